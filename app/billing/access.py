@@ -1,7 +1,11 @@
 from __future__ import annotations
 from app.storage.repo import Repo
 
-def can_use_ai(repo: Repo, user_id: int, free_trial_messages: int) -> tuple[bool, str]:
+def can_use_ai(repo: Repo, user_id: int, free_trial_messages: int, entitlements=None) -> tuple[bool, str]:
+    # с EntitlementService — из кэша (подписчики без запросов к БД)
+    if entitlements is not None:
+        return entitlements.check(user_id)
+
     user = repo.get_user(user_id)
     if not user:
         return True, ""
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Tuple
+
+from app.storage.repo import Repo, on_subscription_change
+
+PAID = "paid"
+EXHAUSTED = "exhausted"
+
+TRIAL_EXHAUSTED_TEXT = "Демо-лимит исчерпан. Оформи подписку, чтобы продолжить 🤍"
+
+
+class EntitlementService:
+    """
+    Доступ к AI (подписка / демо-лимит) с кэшем в памяти.
+
+    - подписчики и исчерпавшие демо кэшируются: на горячем пути ноль запросов к БД;
+    - кэш сбрасывается через хук Repo.set_subscription (и по TTL — на случай,
+      если подписку поменял другой процесс);
+    - демо-сообщение списывается одним атомарным UPDATE с условием, поэтому
+      параллельные апдейты не могут превысить лимит.
+    """
+
+    def __init__(self, repo: Repo, free_trial_messages: int, cache_ttl: float = 300.0):
+        self.repo = repo
+        self.free_trial_messages = int(free_trial_messages)
+        self.cache_ttl = float(cache_ttl)
+        self._cache: Dict[int, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        on_subscription_change(self._on_subscription)
+
+    def _cached(self, user_id: int) -> str | None:
+        item = self._cache.get(user_id)
+        if item is None:
+            return None
+        state, expires = item
+        if expires < time.monotonic():
+            with self._lock:
+                self._cache.pop(user_id, None)
+            return None
+        return state
+
+    def _remember(self, user_id: int, state: str) -> None:
+        with self._lock:
+            self._cache[user_id] = (state, time.monotonic() + self.cache_ttl)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def _on_subscription(self, user_id: int, is_active: bool) -> None:
+        if is_active:
+            self._remember(user_id, PAID)
+        else:
+            self.invalidate(user_id)
+
+    def is_paid(self, user_id: int) -> bool:
+        state = self._cached(user_id)
+        if state is not None:
+            return state == PAID
+        ent = self.repo.get_entitlement(user_id)
+        if ent is not None and ent[0]:
+            self._remember(user_id, PAID)
+            return True
+        return False
+
+    def check(self, user_id: int) -> tuple[bool, str]:
+        """
+        Можно ли ответить (без списания). Та же семантика, что у can_use_ai.
+        """
+        state = self._cached(user_id)
+        if state == PAID:
+            return True, ""
+        if state == EXHAUSTED:
+            return False, TRIAL_EXHAUSTED_TEXT
+
+        ent = self.repo.get_entitlement(user_id)
+        if ent is None:
+            return True, ""
+        is_paid, used = ent
+        if is_paid:
+            self._remember(user_id, PAID)
+            return True, ""
+        if used < self.free_trial_messages:
+            return True, f"Демо-доступ: {used+1}/{self.free_trial_messages}"
+        self._remember(user_id, EXHAUSTED)
+        return False, TRIAL_EXHAUSTED_TEXT
+
+    def consume(self, user_id: int) -> tuple[bool, str]:
+        """
+        Проверка и списание одного демо-сообщения за раз (для подписчиков — без БД).
+        """
+        state = self._cached(user_id)
+        if state == PAID:
+            return True, ""
+        if state == EXHAUSTED:
+            return False, TRIAL_EXHAUSTED_TEXT
+
+        used = self.repo.consume_free_message(user_id, self.free_trial_messages)
+        if used is not None:
+            if used >= self.free_trial_messages:
+                self._remember(user_id, EXHAUSTED)
+            return True, f"Демо-доступ: {used}/{self.free_trial_messages}"
+
+        # не списалось: либо подписка, либо лимит исчерпан
+        ent = self.repo.get_entitlement(user_id)
+        if ent is not None and ent[0]:
+            self._remember(user_id, PAID)
+            return True, ""
+        self._remember(user_id, EXHAUSTED)
+        return False, TRIAL_EXHAUSTED_TEXT
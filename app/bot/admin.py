@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import logging
-import time
 from dataclasses import dataclass
 
 from telegram import Update
@@ -40,49 +39,86 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, repo:
     total = repo.db.query("SELECT COUNT(*) AS c FROM users")[0]["c"]
     active = repo.db.query("SELECT COUNT(*) AS c FROM users WHERE is_active_subscription=1")[0]["c"]
     dormant = repo.db.query("SELECT COUNT(*) AS c FROM users WHERE last_seen_at < datetime('now','-7 day')")[0]["c"]
-    await update.effective_message.reply_text(
+    unreachable = repo.count_unreachable_users()
+    text = (
         f"Пользователей: {total}\nАктивные подписки: {active}\nНеактивны 7д+: {dormant}"
+        f"\nНедоступны для рассылок: {unreachable}"
+    )
+
+    processor = getattr(context.application, "update_processor", None)
+    if hasattr(processor, "stats"):
+        q = processor.stats()
+        text += (
+            f"\n\nОчередь апдейтов: {q['pending']} (в работе {q['active']}/{q['workers']})"
+            f"\nОжидание: avg {q['wait_avg_ms']} ms, max {q['wait_max_ms']} ms"
+        )
+
+    limiter = context.application.bot_data.get("rate_limiter")
+    if limiter is not None:
+        r = limiter.stats()
+        text += f"\nАнтиспам: отклонено {r['rejected']} из {r['allowed'] + r['rejected']}"
+
+    persistence = getattr(context.application, "persistence", None)
+    if hasattr(persistence, "stats"):
+        p = persistence.stats()
+        text += f"\nДиалогов в памяти: {p['users_in_memory']} (выгружено {p['evicted']})"
+    await update.effective_message.reply_text(text)
+
+
+def _broadcast_id_arg(context: ContextTypes.DEFAULT_TYPE) -> int | None:
+    args = getattr(context, "args", None) or []
+    return int(args[0]) if args and args[0].isdigit() else None
+
+
+async def broadcast_status(update: Update, context: ContextTypes.DEFAULT_TYPE, scheduler_service) -> None:
+    text = scheduler_service.broadcast_status_text(_broadcast_id_arg(context))
+    await update.effective_message.reply_text(text or "Рассылок ещё не было.")
+
+
+async def broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE, scheduler_service) -> None:
+    # /broadcast_cancel <id> — одну рассылку, без id — все идущие
+    stopped = await scheduler_service.cancel_broadcast(_broadcast_id_arg(context))
+    if not stopped:
+        await update.effective_message.reply_text("Нет идущей рассылки для отмены.")
+        return
+    await update.effective_message.reply_text(
+        "\n\n".join(scheduler_service.broadcast_status_text(bid) for bid in stopped)
     )
 
 
 async def kb_reload(update: Update, context: ContextTypes.DEFAULT_TYPE, repo: Repo, settings) -> None:
     """
-    Полная переиндексация KB из Google Docs.
-    Важно: после успешного реиндекса — помечаем KB как ready в app.kb.state,
-    иначе остальная система может считать, что KB "не готова".
+    Полная переиндексация KB из Google Docs под арендой run_kb_load: при нескольких
+    репликах (или прогреве в этом же процессе) индексирует ровно одна загрузка.
+    ready/generation/last_load_ts выставляет run_kb_load.
     """
+    from app.kb.lazy_loader import run_kb_load
+    from app.kb.state import kb_mark_ready
+
     await update.effective_message.reply_text("Обновляю KB…")
 
     ing = KnowledgeIngestor(db=repo.db, settings=settings)
     try:
-        indexed = await ing.reindex_all()
-
-        # sync in-memory KB readiness
-        try:
-            from app.kb.state import kb_mark_ready, kb_set_last_load_ts
-
-            kb_mark_ready(True if indexed > 0 else False)
-            kb_set_last_load_ts(int(time.time()))
-        except Exception:
-            log.exception("Failed to mark KB state after kb_reload")
-
-        if indexed > 0:
-            await update.effective_message.reply_text(f"KB обновлена ✅ (chunks: {indexed})")
-        else:
-            await update.effective_message.reply_text(
-                "KB обновлена, но получилась пустой ⚠️\n"
-                "Проверь GDOCS_SOURCES и доступ к документам."
-            )
+        indexed = await run_kb_load(ing.reindex_all)
     except Exception as e:
-        # mark not ready on failure
-        try:
-            from app.kb.state import kb_mark_ready
+        log.exception("KB reload failed: %s", e)
+        await update.effective_message.reply_text("Ошибка при обновлении KB ❌ (см. логи)")
+        return
 
+    if indexed is None:
+        await update.effective_message.reply_text("KB только что обновил другой процесс ✅")
+    elif indexed > 0:
+        await update.effective_message.reply_text(f"KB обновлена ✅ (chunks: {indexed})")
+    else:
+        # пустая KB — не готова (на всех репликах), пока её не перезагрузят
+        try:
             kb_mark_ready(False)
         except Exception:
-            pass
-        log.exception("KB reload failed: %s", e)
-        await update.effective_message.reply_text("Ошибка при обновлении KB ❌ (см. логи)")
+            log.exception("Failed to mark KB state after kb_reload")
+        await update.effective_message.reply_text(
+            "KB обновлена, но получилась пустой ⚠️\n"
+            "Проверь GDOCS_SOURCES и доступ к документам."
+        )
 
 
 async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -105,7 +141,7 @@ async def push_schedule_start(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.effective_message.reply_text("Выбери сегмент:", reply_markup=segments_kb("seg_push"))
 
 
-async def on_segment_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE, repo: Repo) -> None:
+async def on_segment_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE, repo: Repo, settings) -> None:
     query = update.callback_query
     await query.answer()
     st = get_state(context)
@@ -120,7 +156,8 @@ async def on_segment_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE,
     elif prefix == "seg_push":
         st.mode = "push_schedule_time"
         await query.message.reply_text(
-            f"Сегмент: {seg}\nТеперь отправь дату/время запуска в формате: YYYY-MM-DD HH:MM\n(по локальному времени сервера)"
+            f"Сегмент: {seg}\nТеперь отправь дату/время запуска в формате: YYYY-MM-DD HH:MM\n"
+            f"(часовой пояс {getattr(settings, 'scheduler_tz', '') or 'UTC'})"
         )
 
 
@@ -133,8 +170,13 @@ async def on_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE, repo
     if st.mode == "broadcast_text":
         st.draft_text = text
         bid = repo.create_broadcast(admin_id=update.effective_user.id, segment=st.segment, text=st.draft_text)
-        await update.message.reply_text(f"Рассылка создана (id={bid}). Начинаю отправку…")
-        await scheduler_service.send_broadcast_now(broadcast_id=bid, segment=st.segment, text=st.draft_text)
+        msg = await update.message.reply_text(
+            f"Рассылка создана (id={bid}). Начинаю отправку…\n/broadcast_status — прогресс, /broadcast_cancel — отмена"
+        )
+        # рассылка идёт фоном, прогресс — правками этого сообщения
+        scheduler_service.start_broadcast(
+            broadcast_id=bid, segment=st.segment, text=st.draft_text, progress_message=(msg.chat_id, msg.message_id)
+        )
         st.mode = ""
         st.draft_text = ""
         return
@@ -150,12 +192,17 @@ async def on_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE, repo
             await update.message.reply_text("Сначала создай текст пуша: /push_add")
             return
 
-        pid = repo.create_scheduled_push(
-            admin_id=update.effective_user.id,
-            segment=st.segment,
-            text=st.draft_text,
-            run_at_iso=run_at,
-        )
-        await update.message.reply_text(f"Запланировано ✅ push_id={pid} на {run_at} сегмент={st.segment}")
+        try:
+            pid = scheduler_service.schedule_push(
+                admin_id=update.effective_user.id,
+                segment=st.segment,
+                text=st.draft_text,
+                run_at=run_at,
+            )
+        except ValueError:
+            await update.message.reply_text("Не понял дату. Формат: YYYY-MM-DD HH:MM")
+            return
+        tz = getattr(scheduler_service.settings, "scheduler_tz", "") or "UTC"
+        await update.message.reply_text(f"Запланировано ✅ push_id={pid} на {run_at} ({tz}) сегмент={st.segment}")
         st.mode = ""
         return
@@ -1,23 +1,52 @@
 from __future__ import annotations
 
+import logging
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from app.bot.middleware import is_admin
 
+log = logging.getLogger(__name__)
+
+
+def format_symbolism_stats(stats: dict) -> str:
+    total = stats["hits"] + stats["misses"]
+    rate = f"{stats['hits'] / total * 100:.1f}%" if total else "—"
+    lines = [
+        "📊 Символизм: поиск образов",
+        f"Запросов: {total}, найдено: {stats['hits']}, не найдено: {stats['misses']} (hit rate {rate})",
+    ]
+
+    if stats["top_missing"]:
+        lines.append("\nЧаще всего не находим:")
+        for r in stats["top_missing"]:
+            lines.append(f"• {r['requested_key']} ×{r['misses']} (последний раз {r['last_seen_at']})")
+
+    if stats["recent"]:
+        lines.append("\nПоследние запросы:")
+        for r in stats["recent"]:
+            res = f"→ {r['matched_key']} ({r['rule']})" if r["hit"] else "✗"
+            lines.append(f"• {r['requested']} {res}")
+    return "\n".join(lines)
+
 
 async def symbolism_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, repo, settings) -> None:
     """
-    /symbolism_stats — показывает админам статистику по отсутствующим символам (если ты их логируешь в БД).
-    Пока — заглушка: просто подтверждает, что модуль подключен.
+    /symbolism_stats — топ отсутствующих символов, hit rate и последние запросы.
+    Читается из агрегатов (symbol_lookup_stats/totals), а не из всей истории.
     """
     user_id = update.effective_user.id if update.effective_user else None
     if not user_id or not is_admin(user_id, settings.admin_ids):
         return
 
-    # Если у тебя уже есть таблица/метод в repo — сюда вставим реальную выборку.
-    # Пока просто сообщаем, что команда работает.
-    await update.effective_message.reply_text(
-        "✅ symbolism_stats подключён.\n"
-        "Дальше добавим: список отсутствующих символов + счётчики + последние запросы."
-    )
+    # досбрасываем буфер, чтобы видеть и самые свежие запросы
+    telemetry = context.bot_data.get("symbol_telemetry")
+    if telemetry is not None:
+        try:
+            telemetry.flush()
+        except Exception:
+            log.exception("Symbol telemetry flush failed")
+
+    stats = repo.get_symbol_lookup_stats(top=10, recent=10)
+    await update.effective_message.reply_text(format_symbolism_stats(stats))
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Set
+
+from app.knowledge.symbolism import guess_key_from_scene
+
+log = logging.getLogger(__name__)
+
+# Сколько ключей помним как «уже сообщали» (дальше забываем самые давние — о них сообщим снова)
+MAX_SEEN_KEYS = 10000
+# Строк в дайджесте (остальное — одной строкой «и ещё N»)
+DIGEST_MAX_KEYS = 30
+
+
+def _who(user_id: int, username: str | None) -> str:
+    return f"@{username} ({user_id})" if username else f"{user_id}"
+
+
+@dataclass
+class _Miss:
+    count: int = 0
+    users: Set[int] = field(default_factory=set)
+    hint: str = ""
+
+
+class AlertAggregator:
+    """
+    Алерты админам о промахах «Символизма» без флуда:
+    - новый (ещё не виденный) ключ и «KB/Символизм не найден» — сразу;
+    - повторы копятся и уходят одним дайджестом на админа раз в interval секунд
+      (ключ, сколько раз, сколько разных пользователей).
+    """
+
+    def __init__(self, interval_seconds: float = 600.0):
+        self.interval = float(interval_seconds)
+        # ключ -> None в порядке последнего промаха (LRU)
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._pending: Dict[str, _Miss] = {}
+        self._kb_missing_sent_at: float = 0.0
+        self._kb_missing_count = 0
+        self.sent_immediate = 0
+        self.sent_digests = 0
+
+    @staticmethod
+    def _key(requested: str) -> str:
+        # тот же ключ, что у SymbolTelemetry: «волк бежит» и «Волк в лесу» — один промах
+        return guess_key_from_scene(requested) or (requested or "")[:100]
+
+    async def _send(self, bot, admin_ids: Iterable[int], text: str) -> None:
+        async def one(aid: int) -> None:
+            try:
+                await bot.send_message(chat_id=aid, text=text)
+            except Exception:
+                log.exception("Failed to notify admin_id=%s", aid)
+
+        await asyncio.gather(*(one(aid) for aid in admin_ids))
+
+    async def report_missing(
+        self,
+        bot,
+        admin_ids: Iterable[int],
+        user_id: int,
+        username: str | None,
+        requested: str,
+        debug_hint: str,
+        kb_missing: bool = False,
+    ) -> bool:
+        """
+        Возвращает True, если алерт ушёл сразу (иначе — попадёт в дайджест).
+        """
+        admin_ids = list(admin_ids or [])
+        if not admin_ids:
+            return False
+
+        now = time.monotonic()
+        if kb_missing:
+            if now - self._kb_missing_sent_at >= self.interval:
+                self._kb_missing_sent_at = now
+                self.sent_immediate += 1
+                await self._send(bot, admin_ids, (
+                    "⚠️ Symbolism document missing\n"
+                    f"User: {_who(user_id, username)}\n"
+                    f"Requested: {requested}\n"
+                    f"Hint: {debug_hint}"
+                ))
+                return True
+            self._kb_missing_count += 1
+            return False
+
+        key = self._key(requested)
+        if key not in self._seen:
+            while len(self._seen) >= MAX_SEEN_KEYS:
+                self._seen.popitem(last=False)
+            self._seen[key] = None
+            self.sent_immediate += 1
+            await self._send(bot, admin_ids, (
+                "⚠️ Symbolism missing (new)\n"
+                f"User: {_who(user_id, username)}\n"
+                f"Requested: {requested}\n"
+                f"Hint: {debug_hint}"
+            ))
+            return True
+
+        self._seen.move_to_end(key)
+        miss = self._pending.setdefault(key, _Miss())
+        miss.count += 1
+        miss.users.add(user_id)
+        miss.hint = debug_hint
+        return False
+
+    def build_digest(self) -> Optional[str]:
+        """
+        Текст дайджеста за интервал и очистка накопленного. None — нечего слать.
+        """
+        if not self._pending and not self._kb_missing_count:
+            return None
+        pending, self._pending = self._pending, {}
+        kb_missing, self._kb_missing_count = self._kb_missing_count, 0
+
+        minutes = max(1, int(round(self.interval / 60)))
+        lines = [f"⚠️ Symbolism: промахи за ~{minutes} мин"]
+        if kb_missing:
+            lines.append(f"• документ «Символизм» не найден ×{kb_missing}")
+        ranked = sorted(pending.items(), key=lambda kv: (-kv[1].count, kv[0]))
+        for key, miss in ranked[:DIGEST_MAX_KEYS]:
+            lines.append(f"• {key} ×{miss.count} (пользователей: {len(miss.users)})")
+        if len(ranked) > DIGEST_MAX_KEYS:
+            rest = ranked[DIGEST_MAX_KEYS:]
+            lines.append(f"…и ещё {len(rest)} ключей ×{sum(m.count for _, m in rest)}")
+        return "\n".join(lines)
+
+    async def flush(self, bot, admin_ids: Iterable[int]) -> bool:
+        text = self.build_digest()
+        admin_ids = list(admin_ids or [])
+        if not text or not admin_ids:
+            return False
+        await self._send(bot, admin_ids, text)
+        self.sent_digests += 1
+        return True
+
+    async def run(self, bot, admin_ids: Iterable[int]) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush(bot, admin_ids)
+            except Exception:
+                log.exception("Admin alert digest failed")
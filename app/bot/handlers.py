@@ -5,10 +5,11 @@ from telegram.ext import ContextTypes
 
 from app.knowledge.symbolism import (
     build_symbolism_index,
-    find_symbol_entry,
     summarize_index,
 )
+from app.knowledge.symbol_lookup import get_symbol_lookup, load_symbolism_index_cached
 from app.knowledge.ingest import KnowledgeIngestor  # <-- добавили
+from app.kb.state import kb_is_warming
 
 log = logging.getLogger(__name__)
 
@@ -19,6 +20,11 @@ STAGE_ANIMAL_SELF = "animal_self"
 STAGE_ANALYSIS = "analysis"
 STAGE_DONE = "done"
 
+KB_WARMING_TEXT = (
+    "База знаний ещё загружается после обновления бота 🙏\n"
+    "Пришли, пожалуйста, образ зверя ещё раз через минуту."
+)
+
 
 def _ud(context: ContextTypes.DEFAULT_TYPE) -> dict:
     if context.user_data is None:
@@ -26,6 +32,25 @@ def _ud(context: ContextTypes.DEFAULT_TYPE) -> dict:
     return context.user_data
 
 
+def _entitlements(context):
+    return (getattr(context, "bot_data", None) or {}).get("entitlements")
+
+
+async def _consume_access(update, context) -> str | None:
+    """
+    Списывает одно демо-сообщение за выданный разбор (атомарно, см. consume_free_message).
+    None — доступа нет (пользователю уже ответили), иначе пометка «Демо-доступ: n/N» или "".
+    """
+    entitlements = _entitlements(context)
+    if entitlements is None:
+        return ""
+    allowed, note = entitlements.consume(update.effective_user.id)
+    if not allowed:
+        await update.effective_message.reply_text(note)
+        return None
+    return note
+
+
 def _is_positive_feelings(text: str) -> bool:
     t = (text or "").lower()
     positives = ["рад", "радость", "лёгк", "легк", "кайф", "вдохнов", "спокой", "уверен", "приятн"]
@@ -86,6 +111,13 @@ async def text_message(update, context, repo, settings):
     stage = ud.get("stage") or STAGE_SITUATION
 
     if stage == STAGE_SITUATION:
+        # демо исчерпано — не ведём по этапам зря (проверка из кэша, без списания)
+        entitlements = _entitlements(context)
+        if entitlements is not None:
+            allowed, note = entitlements.check(update.effective_user.id)
+            if not allowed:
+                await msg.reply_text(note)
+                return
         ud["situation"] = text
         ud["stage"] = STAGE_FEELINGS
         await msg.reply_text('Что ты чувствуешь в этой ситуации? Напиши все чувства и телесные ощущения.')
@@ -98,8 +130,8 @@ async def text_message(update, context, repo, settings):
             ud["animal_scene"] = None
             ud["animal_self"] = None
             ud["stage"] = STAGE_ANALYSIS
-            await _send_hypothesis_strict(update, context, repo, settings)
-            ud["stage"] = STAGE_DONE
+            if await _send_hypothesis_strict(update, context, repo, settings):
+                ud["stage"] = STAGE_DONE
             return
 
         ud["stage"] = STAGE_ANIMAL
@@ -118,15 +150,15 @@ async def text_message(update, context, repo, settings):
 
         ud["animal_self"] = None
         ud["stage"] = STAGE_ANALYSIS
-        await _send_hypothesis_strict(update, context, repo, settings)
-        ud["stage"] = STAGE_DONE
+        if await _send_hypothesis_strict(update, context, repo, settings):
+            ud["stage"] = STAGE_DONE
         return
 
     if stage == STAGE_ANIMAL_SELF:
         ud["animal_self"] = text
         ud["stage"] = STAGE_ANALYSIS
-        await _send_hypothesis_strict(update, context, repo, settings)
-        ud["stage"] = STAGE_DONE
+        if await _send_hypothesis_strict(update, context, repo, settings):
+            ud["stage"] = STAGE_DONE
         return
 
     ud.clear()
@@ -134,11 +166,24 @@ async def text_message(update, context, repo, settings):
     await msg.reply_text("Что ты хочешь обсудить? Опиши ситуацию/запрос одним сообщением.")
 
 
-async def _notify_admins_missing_symbol(context, settings, user_id: int, username: str | None, requested: str, debug_hint: str):
+async def _notify_admins_missing_symbol(
+    context, settings, user_id: int, username: str | None, requested: str, debug_hint: str,
+    kb_missing: bool = False,
+):
     admin_ids = getattr(settings, "admin_ids", []) or []
     if not admin_ids:
         return
 
+    # агрегатор (app.bot.alerts): новый ключ — сразу, повторы — дайджестом
+    alerts = (getattr(context, "bot_data", None) or {}).get("alerts")
+    if alerts is not None:
+        await alerts.report_missing(
+            context.bot, admin_ids,
+            user_id=user_id, username=username, requested=requested,
+            debug_hint=debug_hint, kb_missing=kb_missing,
+        )
+        return
+
     who = f"{user_id}"
     if username:
         who = f"@{username} ({user_id})"
@@ -157,7 +202,10 @@ async def _notify_admins_missing_symbol(context, settings, user_id: int, usernam
             log.exception("Failed to notify admin_id=%s", aid)
 
 
-async def _send_hypothesis_strict(update, context, repo, settings):
+async def _send_hypothesis_strict(update, context, repo, settings) -> bool:
+    """
+    False — ответ отложен (KB ещё прогревается): ждём образ зверя повторно.
+    """
     msg = update.effective_message
     ud = _ud(context)
 
@@ -167,49 +215,75 @@ async def _send_hypothesis_strict(update, context, repo, settings):
     animal_self = ud.get("animal_self")
 
     if not animal_scene:
+        access_note = await _consume_access(update, context)
+        if access_note is None:
+            return True
         await msg.reply_text(
             "**Этап 4: Гипотеза**\n\n"
             "По алгоритму при ресурсных/позитивных чувствах этап зверя пропускается.\n"
             f"— Ситуация/запрос: {situation}\n"
-            f"— Чувства/ощущения: {feelings}\n",
+            f"— Чувства/ощущения: {feelings}\n"
+            + (f"\n{access_note}" if access_note else ""),
             parse_mode="Markdown"
         )
-        return
-
-    # 1) Пытаемся найти raw_text в БД по title
-    symbolism_raw = repo.get_document_raw_text_by_title("symbolism") \
-        or repo.get_document_raw_text_by_title("Символизм")
+        return True
 
-    # 2) Если нет — лениво догружаем документы (raw_text) из gdocs и пробуем снова
-    if not symbolism_raw:
-        try:
-            ing = KnowledgeIngestor(db=repo.db, settings=settings)
-            # тут важно совпадение title с тем, что в settings.gdocs_sources
-            # поэтому грузим ВСЕ raw_text, а не только по одному названию
-            await ing.ensure_docs_loaded()
-        except Exception:
-            log.exception("Lazy load of docs failed")
+    # 0) Быстрый путь: индекс уже материализован при ingest (таблица symbol_entries)
+    sym = load_symbolism_index_cached(repo)
 
+    if not sym.index:
+        # 1) Пытаемся найти raw_text в БД по title
         symbolism_raw = repo.get_document_raw_text_by_title("symbolism") \
             or repo.get_document_raw_text_by_title("Символизм")
 
-    if not symbolism_raw:
-        await msg.reply_text(
-            "Файл «Символизм» не найден в базе знаний.\n"
-            "Проверь, что в GDOCS_SOURCES title указан как 'symbolism' (или 'Символизм'), "
-            "либо нажми /kb_reload в админке, чтобы загрузить документы."
-        )
-        await _notify_admins_missing_symbol(
-            context, settings,
-            user_id=update.effective_user.id,
-            username=update.effective_user.username,
-            requested=animal_scene,
-            debug_hint="kb_documents missing title=symbolism (after lazy load)"
-        )
-        return
+        # 1a) Документы грузит стартовый прогрев — не дублируем загрузку из gdocs
+        if not symbolism_raw and kb_is_warming():
+            await msg.reply_text(KB_WARMING_TEXT)
+            ud["stage"] = STAGE_ANIMAL
+            return False
+
+        # 2) Если нет — лениво догружаем документы (raw_text) из gdocs и пробуем снова
+        if not symbolism_raw:
+            try:
+                ing = KnowledgeIngestor(db=repo.db, settings=settings)
+                # тут важно совпадение title с тем, что в settings.gdocs_sources
+                # поэтому грузим ВСЕ raw_text, а не только по одному названию
+                await ing.ensure_docs_loaded()
+            except Exception:
+                log.exception("Lazy load of docs failed")
+
+            symbolism_raw = repo.get_document_raw_text_by_title("symbolism") \
+                or repo.get_document_raw_text_by_title("Символизм")
+
+        if not symbolism_raw:
+            await msg.reply_text(
+                "Файл «Символизм» не найден в базе знаний.\n"
+                "Проверь, что в GDOCS_SOURCES title указан как 'symbolism' (или 'Символизм'), "
+                "либо нажми /kb_reload в админке, чтобы загрузить документы."
+            )
+            await _notify_admins_missing_symbol(
+                context, settings,
+                user_id=update.effective_user.id,
+                username=update.effective_user.username,
+                requested=animal_scene,
+                debug_hint="kb_documents missing title=symbolism (after lazy load)",
+                kb_missing=True,
+            )
+            return True
+
+        sym = build_symbolism_index(symbolism_raw, source_title="symbolism")
+        # сохраняем, чтобы следующий запрос (и другие воркеры) не парсили заново
+        try:
+            repo.replace_symbol_entries(sym)
+        except Exception:
+            log.exception("Failed to persist symbol entries")
 
-    sym = build_symbolism_index(symbolism_raw, source_title="symbolism")
-    found = find_symbol_entry(sym, animal_scene)
+    strict = bool(getattr(settings, "symbolism_strict", False))
+    found = get_symbol_lookup(sym).lookup(animal_scene, strict=strict)
+
+    telemetry = (getattr(context, "bot_data", None) or {}).get("symbol_telemetry")
+    if telemetry is not None:
+        telemetry.record(update.effective_user.id, animal_scene, found)
 
     if not found:
         await msg.reply_text(
@@ -217,7 +291,7 @@ async def _send_hypothesis_strict(update, context, repo, settings):
             "Чтобы продолжить строго по структуре, образ должен совпасть с формулировкой/словом из файла."
         )
 
-        debug_hint = summarize_index(sym)
+        debug_hint = summarize_index(sym) + (" (strict)" if strict else "")
         await _notify_admins_missing_symbol(
             context, settings,
             user_id=update.effective_user.id,
@@ -225,9 +299,17 @@ async def _send_hypothesis_strict(update, context, repo, settings):
             requested=animal_scene,
             debug_hint=debug_hint
         )
-        return
+        return True
+
+    log.info(
+        "Symbol matched: requested=%r key=%s rule=%s distance=%s",
+        found.requested, found.key, found.rule, found.distance,
+    )
+    entry = found.entry
 
-    key, entry = found
+    access_note = await _consume_access(update, context)
+    if access_note is None:
+        return True
 
     parts = []
     parts.append("**Этап 3: Символический анализ (по файлу «Символизм»)**")
@@ -243,5 +325,8 @@ async def _send_hypothesis_strict(update, context, repo, settings):
         + "\nГипотеза формулируется на основе этих данных и блока «Символизм» выше. "
         "Если нужны уточнения — они задаются только теми вопросами, которые указаны в «Символизме»."
     )
+    if access_note:
+        parts.append(access_note)
 
     await msg.reply_text("\n\n".join(parts), parse_mode="Markdown")
+    return True
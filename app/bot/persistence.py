@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import pickle
+import time
+from typing import Any, Dict, Optional, Set
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from app.storage.repo import Repo
+
+log = logging.getLogger(__name__)
+
+KIND_USER = "user"
+KIND_CHAT = "chat"
+
+
+def _digest(blob: bytes | None) -> bytes | None:
+    return hashlib.sha1(blob).digest() if blob is not None else None
+
+
+class _Entries:
+    """
+    Учёт записей одного вида (user/chat): что загружено в память, что лежит в БД
+    (по хэшу), что ждёт записи и когда к записи последний раз обращались.
+    """
+
+    def __init__(self):
+        self.loaded: Set[int] = set()
+        self.stored: Dict[int, Optional[bytes]] = {}
+        self.pending: Dict[int, Optional[bytes]] = {}
+        self.last_access: Dict[int, float] = {}
+        self.evicting: Set[int] = set()
+
+    def forget(self, key: int) -> None:
+        self.loaded.discard(key)
+        self.stored.pop(key, None)
+        self.last_access.pop(key, None)
+
+
+class SqlitePersistence(BasePersistence):
+    """
+    PTB persistence для user_data/chat_data (стадии диалога, AdminState) в нашей SQLite.
+
+    - get_user_data() отдаёт пустой dict: записи грузятся лениво в refresh_user_data,
+      т.е. при первом апдейте пользователя после рестарта;
+    - update_user_data() сравнивает pickle с тем, что уже в БД, и ставит в очередь
+      только изменённые записи; очередь пишется одной транзакцией;
+    - записи, к которым не обращались idle_ttl секунд, выгружаются из памяти
+      (evict_idle), в БД они остаются.
+    """
+
+    def __init__(self, repo: Repo, update_interval: float = 30, idle_ttl: float = 3600):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.repo = repo
+        # выгружать раньше, чем PTB успел сохранить изменения, нельзя
+        self.idle_ttl = max(float(idle_ttl), 2 * float(update_interval)) if idle_ttl else 0.0
+        self._entries = {KIND_USER: _Entries(), KIND_CHAT: _Entries()}
+        self._write_task: Optional[asyncio.Task] = None
+        self._application = None
+        self.writes = 0
+        self.evicted = 0
+
+    # --- загрузка ---
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    def _refresh(self, kind: str, key: int, data: dict) -> None:
+        e = self._entries[kind]
+        e.last_access[key] = time.monotonic()
+        if key in e.loaded:
+            return
+        blob = e.pending[key] if key in e.pending else self.repo.get_persistence_entry(kind, key)
+        if blob is not None:
+            try:
+                for k, v in pickle.loads(blob).items():
+                    data.setdefault(k, v)
+            except Exception:
+                log.exception("Broken persisted %s_data for %s; starting empty", kind, key)
+        e.stored[key] = _digest(blob)
+        e.loaded.add(key)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        self._refresh(KIND_USER, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        self._refresh(KIND_CHAT, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        return
+
+    # --- запись ---
+    def _update(self, kind: str, key: int, data: dict) -> None:
+        e = self._entries[kind]
+        blob = pickle.dumps(dict(data), protocol=pickle.HIGHEST_PROTOCOL) if data else None
+        digest = _digest(blob)
+        if digest == e.stored.get(key):
+            return  # не изменилось (или пусто и в БД ничего нет)
+        e.pending[key] = blob
+        e.stored[key] = digest
+        self._schedule_write()
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._update(KIND_USER, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._update(KIND_CHAT, chat_id, data)
+
+    async def update_bot_data(self, data) -> None:
+        return
+
+    async def update_callback_data(self, data) -> None:
+        return
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        return
+
+    def _drop(self, kind: str, key: int) -> None:
+        e = self._entries[kind]
+        if key in e.evicting:
+            # это наша выгрузка из памяти, а не удаление данных
+            e.evicting.discard(key)
+            if key in e.loaded and self._application is not None:
+                # пользователь вернулся до того, как PTB обработал выгрузку
+                if kind == KIND_USER:
+                    self._application.mark_data_for_update_persistence(user_ids=key)
+                else:
+                    self._application.mark_data_for_update_persistence(chat_ids=key)
+            return
+        e.forget(key)
+        e.pending[key] = None
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._drop(KIND_USER, user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._drop(KIND_CHAT, chat_id)
+
+    def _schedule_write(self) -> None:
+        """
+        PTB вызывает update_*_data пачкой (asyncio.gather) — пишем после неё,
+        одной транзакцией на вид данных.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_pending()
+            return
+        if self._write_task is None or self._write_task.done():
+            self._write_task = loop.create_task(self._write_soon())
+
+    async def _write_soon(self) -> None:
+        await asyncio.sleep(0)
+        self._write_pending()
+
+    def _write_pending(self) -> None:
+        for kind, e in self._entries.items():
+            if not e.pending:
+                continue
+            batch, e.pending = e.pending, {}
+            try:
+                self.repo.save_persistence_entries(kind, batch)
+                self.writes += len(batch)
+            except Exception:
+                log.exception("Persistence write failed (%s entries=%s); will retry", kind, len(batch))
+                for key, blob in batch.items():
+                    e.pending.setdefault(key, blob)
+
+    async def flush(self) -> None:
+        if self._write_task is not None and not self._write_task.done():
+            await self._write_task
+        self._write_pending()
+
+    # --- выгрузка ---
+    def evict_idle(self, application) -> int:
+        """
+        Выгружает из памяти записи без обращений дольше idle_ttl.
+        Данные в БД не трогаем: при следующем апдейте refresh_* загрузит их снова.
+        """
+        if not self.idle_ttl:
+            return 0
+        self._application = application
+        now = time.monotonic()
+        n = 0
+        for kind, e in self._entries.items():
+            for key, seen in list(e.last_access.items()):
+                if now - seen < self.idle_ttl or key in e.pending:
+                    continue
+                e.forget(key)
+                e.evicting.add(key)
+                if kind == KIND_USER:
+                    application.drop_user_data(key)
+                else:
+                    application.drop_chat_data(key)
+                n += 1
+        self.evicted += n
+        return n
+
+    async def run_eviction(self, application, interval_seconds: float | None = None) -> None:
+        interval = interval_seconds or max(60.0, self.idle_ttl / 4)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                n = self.evict_idle(application)
+                if n:
+                    log.info("Persistence: evicted %s idle entries", n)
+            except Exception:
+                log.exception("Persistence eviction failed")
+
+    def stats(self) -> dict:
+        return {
+            "users_in_memory": len(self._entries[KIND_USER].loaded),
+            "chats_in_memory": len(self._entries[KIND_CHAT].loaded),
+            "pending": sum(len(e.pending) for e in self._entries.values()),
+            "writes": self.writes,
+            "evicted": self.evicted,
+        }
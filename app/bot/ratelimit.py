@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+log = logging.getLogger(__name__)
+
+RATE_LIMITED_TEXT = "Слишком много сообщений подряд. Дай мне пару секунд и напиши снова 🤍"
+LLM_OVERLOADED_TEXT = "Сейчас очень много запросов. Попробуй, пожалуйста, через минуту 🤍"
+
+# Меньше — раньше в очереди к OpenAI
+PRIORITY_PAID = 0
+PRIORITY_TRIAL = 1
+
+# Не чаще одного «подожди» на пользователя за столько секунд
+NOTIFY_COOLDOWN_SECONDS = 10.0
+# Раз в столько проверок выбрасываем давно полные (неактивные) бакеты
+_PRUNE_EVERY = 1000
+
+
+class UserRateLimiter:
+    """
+    Token bucket на пользователя: rate_per_minute токенов в минуту, до burst подряд.
+    Бакеты создаются лениво и пополняются по времени при обращении (без таймеров).
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = float(rate_per_minute) / 60.0
+        self.burst = max(1, int(burst))
+        self._buckets: Dict[int, Tuple[float, float]] = {}  # user_id -> (tokens, ts)
+        self._notified: Dict[int, float] = {}
+        self._checks = 0
+        self.allowed = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def allow(self, user_id: int, cost: float = 1.0) -> bool:
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        tokens, ts = self._buckets.get(user_id, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - ts) * self.rate)
+        ok = tokens >= cost
+        if ok:
+            tokens -= cost
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        self._buckets[user_id] = (tokens, now)
+
+        self._checks += 1
+        if self._checks % _PRUNE_EVERY == 0:
+            self._prune(now)
+        return ok
+
+    def should_notify(self, user_id: int) -> bool:
+        now = time.monotonic()
+        if now - self._notified.get(user_id, 0.0) < NOTIFY_COOLDOWN_SECONDS:
+            return False
+        self._notified[user_id] = now
+        return True
+
+    def _prune(self, now: float) -> None:
+        full_after = self.burst / self.rate if self.rate > 0 else 0.0
+        for uid, (tokens, ts) in list(self._buckets.items()):
+            if tokens + (now - ts) * self.rate >= self.burst and now - ts > full_after:
+                self._buckets.pop(uid, None)
+                self._notified.pop(uid, None)
+
+    def stats(self) -> dict:
+        return {"users": len(self._buckets), "allowed": self.allowed, "rejected": self.rejected}
+
+
+class LLMOverloaded(Exception):
+    """
+    Нет свободного слота к OpenAI: очередь полна или ждали дольше таймаута.
+    """
+
+
+class LLMGate:
+    """
+    Общий для процесса лимит одновременных вызовов OpenAI с приоритетной очередью:
+    освободившийся слот получает подписчик раньше триального пользователя.
+    Триальные занимают не больше trial_queue_share очереди, остальное — запас
+    для подписчиков. Переполнение — сразу LLMOverloaded (быстрый отказ, без ожидания).
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, timeout: float = 20.0, trial_queue_share: float = 0.5):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.trial_queue_limit = int(self.max_queue * trial_queue_share)
+        self.timeout = float(timeout)
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def queued(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    async def acquire(self, priority: int = PRIORITY_TRIAL) -> None:
+        if self.active < self.max_concurrent and not self.queued():
+            self.active += 1
+            self.admitted += 1
+            return
+
+        limit = self.max_queue if priority <= PRIORITY_PAID else self.trial_queue_limit
+        if self.queued() >= limit:
+            self.rejected += 1
+            raise LLMOverloaded()
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            done, _ = await asyncio.wait({fut}, timeout=self.timeout)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # слот уже передали нам — вернуть
+            else:
+                fut.cancel()
+            raise
+        if not done:
+            fut.cancel()
+            self.timeouts += 1
+            raise LLMOverloaded()
+        self.admitted += 1
+
+    def release(self) -> None:
+        # передаём слот следующему живому ожидающему (active не меняется)
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active = max(0, self.active - 1)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_TRIAL) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, priority: int, fn: Callable, *args, **kwargs):
+        """
+        Блокирующий вызов OpenAI (llm_answer, embed_query) в потоке под слотом.
+        """
+        async with self.slot(priority):
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queued": self.queued(),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+def priority_for(entitlements, user_id: int) -> int:
+    if entitlements is not None and entitlements.is_paid(user_id):
+        return PRIORITY_PAID
+    return PRIORITY_TRIAL
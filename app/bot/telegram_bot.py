@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 import logging
+from telegram import Update
 from telegram.ext import (
     Application,
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
+    ApplicationHandlerStop,
     filters,
 )
 
@@ -15,29 +18,105 @@ from app.storage.db import Database
 from app.storage.repo import Repo
 from app.bot import handlers
 from app.bot.admin import (
-    admin_menu, admin_stats, broadcast_start, push_add_start, push_schedule_start,
+    admin_menu, admin_stats, broadcast_start, broadcast_status, broadcast_cancel,
+    push_add_start, push_schedule_start,
     on_segment_chosen, on_admin_text, kb_reload
 )
-from app.bot.middleware import is_admin
+from app.bot.middleware import is_admin, touch_user
+from app.bot.persistence import SqlitePersistence
+from app.billing.entitlements import EntitlementService
+from app.bot.alerts import AlertAggregator
+from app.knowledge.symbol_telemetry import SymbolTelemetry
+from app.bot.ratelimit import RATE_LIMITED_TEXT, UserRateLimiter
+from app.bot.update_processor import PerChatUpdateProcessor
+from app.metrics import HANDLER_ERRORS
 
 log = logging.getLogger(__name__)
 
 
-def build_application(db: Database, settings, scheduler):
-    repo = Repo(db)
+def build_application(db: Database, settings, scheduler, activity=None):
+    repo = Repo(db, activity=activity)
+
+    # параллельно между пользователями, строго по порядку внутри одного чата
+    update_processor = PerChatUpdateProcessor(workers=getattr(settings, "update_workers", 8))
+
+    # стадии диалога и AdminState переживают рестарт/деплой
+    persistence = SqlitePersistence(
+        repo,
+        update_interval=getattr(settings, "persistence_update_seconds", 30.0),
+        idle_ttl=getattr(settings, "persistence_idle_ttl_seconds", 3600.0),
+    )
+
+    # один пул HTTP-соединений (keep-alive) на все исходящие: ответы, рассылки, пуши, алерты
+    pool_size = (
+        int(getattr(settings, "update_workers", 8))
+        + int(getattr(settings, "broadcast_concurrency", 16))
+        + 4
+    )
 
     application: Application = (
         ApplicationBuilder()
         .token(settings.telegram_bot_token)
+        .concurrent_updates(update_processor)
+        .persistence(persistence)
+        .connection_pool_size(pool_size)
+        .http_version("1.1")
         .build()
     )
+    scheduler.telegram_app = application
 
     # ---------- global error handler (CRITICAL) ----------
     async def on_error(update, context):
+        HANDLER_ERRORS.inc(error=type(context.error).__name__)
         log.exception("Unhandled error in update=%s", update, exc_info=context.error)
 
     application.add_error_handler(on_error)
 
+    # доступ к AI (подписка/демо): кэш + атомарное списание демо-сообщений
+    application.bot_data["entitlements"] = EntitlementService(
+        repo,
+        free_trial_messages=getattr(settings, "free_trial_messages", 3),
+        cache_ttl=getattr(settings, "entitlement_cache_seconds", 300.0),
+    )
+
+    # алерты админам о промахах «Символизма» (дайджест отправляет фоновая задача в main)
+    application.bot_data["alerts"] = AlertAggregator(getattr(settings, "admin_alert_digest_seconds", 600.0))
+
+    # попадания/промахи «Символизма» для /symbolism_stats (сброс в БД — фоновая задача в main)
+    application.bot_data["symbol_telemetry"] = SymbolTelemetry(repo)
+
+    # ---------- rate limit: token bucket на пользователя ----------
+    # (LLMGate для вызовов OpenAI подключим вместе с первым хендлером, который их делает:
+    # сейчас разбор идёт строго по «Символизму», без LLM)
+    limiter = UserRateLimiter(
+        rate_per_minute=getattr(settings, "rate_limit_per_minute", 20.0),
+        burst=getattr(settings, "rate_limit_burst", 5),
+    )
+    application.bot_data["rate_limiter"] = limiter
+
+    async def on_rate_limit(update, context):
+        user = update.effective_user
+        if not user or is_admin(user.id, settings.admin_ids) or limiter.allow(user.id):
+            return
+        if limiter.should_notify(user.id):
+            try:
+                if update.callback_query:
+                    await update.callback_query.answer(RATE_LIMITED_TEXT)
+                elif update.effective_message:
+                    await update.effective_message.reply_text(RATE_LIMITED_TEXT)
+            except Exception:
+                log.exception("Failed to send rate-limit notice")
+        raise ApplicationHandlerStop
+
+    application.add_handler(TypeHandler(Update, on_rate_limit), group=-2)
+
+    # ---------- activity (до всех хендлеров; с буфером — без записи в БД) ----------
+    async def on_any_update(update, context):
+        if update.effective_user:
+            await touch_user(repo, update.effective_user)
+
+    application.add_handler(TypeHandler(Update, on_any_update), group=-1)
+
     # ---------- user commands (NO lambdas) ----------
     async def start_cmd(update, context):
         await handlers.start(update, context, repo, settings)
@@ -81,6 +160,16 @@ def build_application(db: Database, settings, scheduler):
             return
         await broadcast_start(update, context)
 
+    async def broadcast_status_cmd(update, context):
+        if not is_admin(update.effective_user.id, settings.admin_ids):
+            return
+        await broadcast_status(update, context, scheduler)
+
+    async def broadcast_cancel_cmd(update, context):
+        if not is_admin(update.effective_user.id, settings.admin_ids):
+            return
+        await broadcast_cancel(update, context, scheduler)
+
     async def push_add_cmd(update, context):
         if not is_admin(update.effective_user.id, settings.admin_ids):
             return
@@ -93,8 +182,14 @@ def build_application(db: Database, settings, scheduler):
 
     application.add_handler(CommandHandler("admin", admin_cmd))
     application.add_handler(CommandHandler("stats", stats_cmd))
+    async def symbolism_stats_cmd(update, context):
+        await symbolism_stats(update, context, repo, settings)
+
     application.add_handler(CommandHandler("kb_reload", kb_reload_cmd))
+    application.add_handler(CommandHandler("symbolism_stats", symbolism_stats_cmd))
     application.add_handler(CommandHandler("broadcast", broadcast_cmd))
+    application.add_handler(CommandHandler("broadcast_status", broadcast_status_cmd))
+    application.add_handler(CommandHandler("broadcast_cancel", broadcast_cancel_cmd))
     application.add_handler(CommandHandler("push_add", push_add_cmd))
     application.add_handler(CommandHandler("push_schedule", push_schedule_cmd))
 
@@ -122,7 +217,7 @@ def build_application(db: Database, settings, scheduler):
         elif data.startswith("seg_bcast:") or data.startswith("seg_push:"):
             if not is_admin(update.effective_user.id, settings.admin_ids):
                 return
-            await on_segment_chosen(update, context, repo)
+            await on_segment_chosen(update, context, repo, settings)
 
     application.add_handler(CallbackQueryHandler(on_cb))
 
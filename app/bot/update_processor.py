@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from app.metrics import UPDATE_DURATION, UPDATE_WAIT
+
+log = logging.getLogger(__name__)
+
+# Если апдейт ждал очереди дольше — пишем warning (видно, что воркеров не хватает)
+SLOW_WAIT_WARN_SECONDS = 5.0
+
+
+def chat_key(update: object) -> Optional[int]:
+    """
+    Ключ сериализации: chat_id (или user_id, если чата нет).
+    None — апдейт не привязан к диалогу и может идти параллельно со всеми.
+    """
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка апдейтов с сохранением порядка внутри одного чата.
+
+    - разные пользователи обрабатываются параллельно (не больше workers одновременно),
+      поэтому чужая ленивая загрузка Google Docs / LLM-вызов никого не блокирует;
+    - апдейты одного чата идут строго по очереди (ситуация -> чувства -> зверь);
+    - сначала берём lock чата, потом слот воркера: апдейты, ждущие свой чат,
+      не занимают воркеров.
+
+    Базовый семафор PTB (max_concurrent_updates) здесь — верхняя граница числа
+    апдейтов «в системе» (в работе + в очереди), а не число воркеров.
+    """
+
+    def __init__(self, workers: int, max_pending: int | None = None):
+        workers = max(1, int(workers))
+        super().__init__(max_concurrent_updates=max(workers, int(max_pending or workers * 64)))
+        self.workers = workers
+        self._worker_sem: Optional[asyncio.Semaphore] = None
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_refs: Dict[int, int] = {}
+
+        self.pending = 0
+        self.active = 0
+        self.processed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def initialize(self) -> None:
+        # семафор создаём внутри работающего event loop
+        self._worker_sem = asyncio.Semaphore(self.workers)
+
+    async def shutdown(self) -> None:
+        return
+
+    def _acquire_chat_lock(self, key: int) -> asyncio.Lock:
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        self._chat_refs[key] = self._chat_refs.get(key, 0) + 1
+        return lock
+
+    def _release_chat_lock(self, key: int) -> None:
+        left = self._chat_refs.get(key, 1) - 1
+        if left <= 0:
+            self._chat_refs.pop(key, None)
+            self._chat_locks.pop(key, None)
+        else:
+            self._chat_refs[key] = left
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        t0 = time.monotonic()
+        self.pending += 1
+        key = chat_key(update)
+        lock = self._acquire_chat_lock(key) if key is not None else None
+        dequeued = False
+        try:
+            if lock is not None:
+                await lock.acquire()
+            try:
+                if self._worker_sem is None:
+                    self._worker_sem = asyncio.Semaphore(self.workers)
+                async with self._worker_sem:
+                    dequeued = True
+                    waited = time.monotonic() - t0
+                    self.pending -= 1
+                    self.wait_total += waited
+                    self.wait_max = max(self.wait_max, waited)
+                    UPDATE_WAIT.observe(waited)
+                    if waited > SLOW_WAIT_WARN_SECONDS:
+                        log.warning(
+                            "Update waited %.2fs in queue (pending=%s, workers=%s)",
+                            waited, self.pending, self.workers,
+                        )
+                    self.active += 1
+                    started = time.monotonic()
+                    try:
+                        await coroutine
+                    finally:
+                        UPDATE_DURATION.observe(time.monotonic() - started)
+                        self.active -= 1
+                        self.processed += 1
+            finally:
+                if lock is not None:
+                    lock.release()
+        finally:
+            if key is not None:
+                self._release_chat_lock(key)
+            if not dequeued:
+                # отменили, пока апдейт стоял в очереди
+                self.pending -= 1
+                close = getattr(coroutine, "close", None)
+                if close:
+                    close()
+
+    def stats(self) -> dict:
+        done = max(1, self.processed)
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "active": self.active,
+            "processed": self.processed,
+            "chats_in_flight": len(self._chat_locks),
+            "wait_avg_ms": round(self.wait_total / done * 1000, 2),
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+        }
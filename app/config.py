@@ -3,9 +3,6 @@ import json
 import logging
 import os
 from dataclasses import dataclass
-from dotenv import load_dotenv
-
-load_dotenv()
 
 log = logging.getLogger(__name__)
 
@@ -28,6 +25,51 @@ class Settings:
     scheduler_tz: str
     log_level: str
 
+    # Только точный ключ / отрезанная гласная (без стемминга и опечаток)
+    symbolism_strict: bool = False
+
+    # Сколько апдейтов обрабатываем параллельно (внутри одного чата — всегда по порядку)
+    update_workers: int = 8
+
+    # last_seen/профиль копятся в памяти и пишутся пачкой раз в N секунд (0 — сразу)
+    activity_flush_seconds: float = 10.0
+
+    # сколько секунд кэшируем «подписка есть / демо исчерпано» (сброс — при set_subscription)
+    entitlement_cache_seconds: float = 300.0
+
+    # антиспам: токенов на пользователя в минуту и «пачка» подряд (0 — без лимита)
+    rate_limit_per_minute: float = 20.0
+    rate_limit_burst: int = 5
+
+    # повторные алерты админам о промахах «Символизма» — дайджестом раз в N секунд
+    admin_alert_digest_seconds: float = 600.0
+    # попадания/промахи поиска символов пишутся пачкой раз в N секунд
+    symbol_telemetry_flush_seconds: float = 30.0
+
+    # рассылки: сообщений в секунду на бота (потолок Telegram ~30) и параллельных запросов
+    broadcast_rate_per_second: float = 25.0
+    broadcast_concurrency: int = 16
+    # как часто обновлять сообщение админу с прогрессом рассылки
+    broadcast_progress_seconds: float = 5.0
+
+    # напоминания неактивным: период проверки (0 — выключено), порог неактивности, текст
+    reminder_interval_seconds: float = 0.0
+    reminder_dormant_days: float = 7.0
+    reminder_text: str = ""
+
+    # user_data/chat_data в SQLite: как часто PTB сохраняет изменения и через сколько
+    # секунд без активности запись выгружается из памяти (0 — не выгружать)
+    persistence_update_seconds: float = 30.0
+    persistence_idle_ttl_seconds: float = 3600.0
+
+    # BOT_MODE=webhook: апдейты приходят на наш HTTP-сервер (тот же, что health),
+    # иначе — long polling. webhook_url — публичный https-адрес сервиса.
+    # webhook_secret обязателен для webhook-режима (один на все реплики).
+    bot_mode: str = "polling"
+    webhook_url: str = ""
+    webhook_path: str = "/telegram/webhook"
+    webhook_secret: str = ""
+
 def _parse_admin_ids(raw: str) -> set[int]:
     ids = set()
     for x in (raw or "").split(","):
@@ -40,6 +82,21 @@ def _parse_admin_ids(raw: str) -> set[int]:
             log.warning("Invalid admin id in ADMIN_IDS: %r (skipping)", x)
     return ids
 
+def env_flag(name: str, default: bool = False) -> bool:
+    """
+    Булев env-флаг: "1"/"true"/"yes"/"on" -> True, "0"/"false"/"no"/"off"/"" -> False.
+    """
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    raw = raw.strip().lower()
+    if raw in ("1", "true", "yes", "y", "on"):
+        return True
+    if raw in ("0", "false", "no", "n", "off", ""):
+        return False
+    log.warning("Env %s has unexpected value %r; treating as True", name, raw)
+    return True
+
 def _parse_json(raw: str, default):
     if not raw:
         return default
@@ -49,7 +106,25 @@ def _parse_json(raw: str, default):
         log.warning("Failed to parse JSON from env; using default instead", exc_info=True)
         return default
 
+_env_loaded = False
+
+
+def load_env() -> None:
+    """
+    .env -> os.environ, один раз. Не при импорте модуля: импорт config не должен
+    иметь побочных эффектов (и тянуть python-dotenv, если .env не нужен).
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    _env_loaded = True
+
+
 def get_settings() -> Settings:
+    load_env()
     return Settings(
         telegram_bot_token=os.environ["TELEGRAM_BOT_TOKEN"],
         admin_ids=_parse_admin_ids(os.getenv("ADMIN_IDS", "")),
@@ -67,5 +142,29 @@ def get_settings() -> Settings:
         free_trial_messages=int(os.getenv("FREE_TRIAL_MESSAGES", "3")),
         scheduler_tz=os.getenv("SCHEDULER_TZ", "Europe/Vilnius"),
         log_level=os.getenv("LOG_LEVEL", "INFO"),
+
+        symbolism_strict=env_flag("SYMBOLISM_STRICT", False),
+        update_workers=int(os.getenv("UPDATE_WORKERS", "8")),
+
+        activity_flush_seconds=float(os.getenv("ACTIVITY_FLUSH_SECONDS", "10")),
+
+        entitlement_cache_seconds=float(os.getenv("ENTITLEMENT_CACHE_SECONDS", "300")),
+        rate_limit_per_minute=float(os.getenv("RATE_LIMIT_PER_MINUTE", "20")),
+        rate_limit_burst=int(os.getenv("RATE_LIMIT_BURST", "5")),
+        admin_alert_digest_seconds=float(os.getenv("ADMIN_ALERT_DIGEST_SECONDS", "600")),
+        symbol_telemetry_flush_seconds=float(os.getenv("SYMBOL_TELEMETRY_FLUSH_SECONDS", "30")),
+        broadcast_rate_per_second=float(os.getenv("BROADCAST_RATE_PER_SECOND", "25")),
+        broadcast_concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "16")),
+        broadcast_progress_seconds=float(os.getenv("BROADCAST_PROGRESS_SECONDS", "5")),
+        reminder_interval_seconds=float(os.getenv("REMINDER_INTERVAL_SECONDS", "0")),
+        reminder_dormant_days=float(os.getenv("REMINDER_DORMANT_DAYS", "7")),
+        reminder_text=os.getenv("REMINDER_TEXT", ""),
+        persistence_update_seconds=float(os.getenv("PERSISTENCE_UPDATE_SECONDS", "30")),
+        persistence_idle_ttl_seconds=float(os.getenv("PERSISTENCE_IDLE_TTL_SECONDS", "3600")),
+
+        bot_mode=os.getenv("BOT_MODE", "polling").strip().lower(),
+        webhook_url=os.getenv("WEBHOOK_URL", "").strip().rstrip("/"),
+        webhook_path=os.getenv("WEBHOOK_PATH", "/telegram/webhook"),
+        webhook_secret=os.getenv("WEBHOOK_SECRET", ""),
     )
 
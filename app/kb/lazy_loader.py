@@ -1,64 +1,87 @@
+import asyncio
 import os
 import time
 import logging
 
 from app.kb.state import (
-    kb_is_ready,
+    kb_get_generation,
     kb_mark_ready,
     kb_set_last_load_ts,
+    kb_lease_active,
+    kb_lease_owner,
+    kb_refresh_state,
+    kb_release_lease,
+    kb_try_acquire_lease,
     get_kb_loading_lock,
 )
 
 log = logging.getLogger(__name__)
 
+# Сколько держим аренду на загрузку и сколько максимум ждём чужую загрузку
+KB_LOAD_LEASE_SECONDS = int(os.getenv("KB_LOAD_LEASE_SECONDS", "600"))
+KB_LOAD_POLL_SECONDS = 1.0
+# Как часто продлеваем свою аренду, пока идёт загрузка (доля от KB_LOAD_LEASE_SECONDS)
+KB_LEASE_RENEW_FRACTION = 3
+
 
 class KBLoadError(RuntimeError):
     pass
 
 
-def _env_flag(name: str, default: bool = False) -> bool:
+async def _renew_lease(owner: str) -> None:
     """
-    Нормальный парсер булевых env-флагов.
-    "0" -> False, "1" -> True.
+    Продлевает аренду, пока идёт загрузка: долгая индексация не должна
+    пережить KB_LOAD_LEASE_SECONDS и отдать аренду второму загрузчику.
     """
-    raw = os.getenv(name)
-    if raw is None:
-        return default
-    raw = raw.strip().lower()
-    if raw in ("1", "true", "yes", "y", "on"):
-        return True
-    if raw in ("0", "false", "no", "n", "off", ""):
-        return False
-    log.warning("Env %s has unexpected value %r; treating as True", name, raw)
-    return True
+    interval = max(1.0, KB_LOAD_LEASE_SECONDS / KB_LEASE_RENEW_FRACTION)
+    while True:
+        await asyncio.sleep(interval)
+        if not kb_try_acquire_lease(owner, KB_LOAD_LEASE_SECONDS):
+            log.warning("KB load lease was taken over by another process")
+            return
 
 
-async def ensure_kb_loaded(load_fn):
+async def run_kb_load(load_fn):
     """
-    load_fn: async function, которая реально грузит/парсит KB (твой существующий код).
+    Выполняет load_fn под межпроцессной арендой (kb_state.lease_*) и process-local
+    lock: грузит ровно одна загрузка, остальные ждут, пока она закончит, и
+    подхватывают результат через generation.
+    Успех — ready + новая generation. Ошибка снимает ready, только если KB ещё
+    ни разу не загружалась: неудачная перезагрузка не выключает предыдущую версию
+    на всех репликах.
+    Возвращает результат load_fn или None, если загрузку сделал другой процесс.
     """
-    if kb_is_ready():
-        return True
+    async with get_kb_loading_lock():
+        return await _run_kb_load_locked(load_fn)
 
-    lock = get_kb_loading_lock()
-    async with lock:
-        if kb_is_ready():
-            return True
 
-        disable_startup = _env_flag("KB_DISABLE_STARTUP", default=False)
-        log.warning(
-            "KB not ready -> lazy loading triggered (KB_DISABLE_STARTUP=%s)",
-            disable_startup,
-        )
+async def _run_kb_load_locked(load_fn):
+    owner = kb_lease_owner()
+    generation = kb_get_generation()
+    deadline = time.monotonic() + KB_LOAD_LEASE_SECONDS
+    while not kb_try_acquire_lease(owner, KB_LOAD_LEASE_SECONDS):
+        log.info("KB load is held by another process, waiting...")
+        while kb_lease_active():
+            if time.monotonic() > deadline:
+                raise KBLoadError("Timed out waiting for KB load in another process")
+            await asyncio.sleep(KB_LOAD_POLL_SECONDS)
+        kb_refresh_state()
+        if kb_get_generation() > generation:
+            log.info("KB was loaded by another process")
+            return None
 
-        try:
-            t0 = time.time()
-            await load_fn()  # здесь твой реальный импорт/парсинг "Символизм"
-            kb_mark_ready(True)
-            kb_set_last_load_ts(int(time.time()))
-            log.info("KB lazy load success in %.2fs", time.time() - t0)
-            return True
-        except Exception as e:
+    renew = asyncio.create_task(_renew_lease(owner))
+    try:
+        t0 = time.time()
+        result = await load_fn()
+        kb_mark_ready(True)
+        kb_set_last_load_ts(int(time.time()))
+        log.info("KB load success in %.2fs", time.time() - t0)
+        return result
+    except Exception:
+        if kb_get_generation() == 0:
             kb_mark_ready(False)
-            log.exception("KB lazy load failed: %s", e)
-            raise KBLoadError(str(e)) from e
+        raise
+    finally:
+        renew.cancel()
+        kb_release_lease(owner)
@@ -1,29 +1,107 @@
 from __future__ import annotations
 
 import asyncio
+import os
+import socket
 import time
+import uuid
 from typing import Optional
 
 # ВАЖНО:
-# - состояние хранится в памяти процесса (если у тебя несколько процессов/воркеров,
-#   у каждого будет своё состояние)
+# - если вызван kb_bind_db(db), состояние (ready/generation/last_load/lease) живёт
+#   в общей БД (таблица kb_state) и одинаково для всех процессов/реплик;
+#   без БД — как раньше, в памяти процесса
+# - чтение из БД кэшируется на KB_STATE_POLL_SECONDS: процессы узнают о новой
+#   загрузке по счётчику generation, не дёргая БД на каждый вызов
 # - lock создаём лениво, чтобы избежать привязки к неправильному event loop
 
 _kb_ready: bool = False
 _kb_last_load_ts: Optional[int] = None
+_kb_generation: int = 0
 _kb_loading_lock: Optional[asyncio.Lock] = None
+# прогрев KB фоновой задачей на старте (только этот процесс; см. kb_set_warming)
+_kb_warming: bool = False
+
+_db = None
+_synced_at: float = 0.0
+_POLL_SECONDS = float(os.getenv("KB_STATE_POLL_SECONDS", "5"))
+
+
+def kb_bind_db(db) -> None:
+    """
+    Переключает состояние KB на общую таблицу kb_state (см. ensure_schema).
+    """
+    global _db
+    _db = db
+    _sync(force=True)
+
+
+def _sync(force: bool = False) -> None:
+    global _kb_ready, _kb_last_load_ts, _kb_generation, _synced_at
+    if _db is None:
+        return
+    now = time.monotonic()
+    if not force and now - _synced_at < _POLL_SECONDS:
+        return
+    rows = _db.query("SELECT ready, generation, last_load_ts FROM kb_state WHERE id=1")
+    _synced_at = now
+    if not rows:
+        return
+    _kb_ready = bool(rows[0]["ready"])
+    _kb_generation = int(rows[0]["generation"] or 0)
+    _kb_last_load_ts = int(rows[0]["last_load_ts"]) if rows[0]["last_load_ts"] is not None else None
+
+
+def kb_refresh_state() -> None:
+    """
+    Перечитать состояние из БД прямо сейчас (в обход интервала опроса).
+    """
+    _sync(force=True)
 
 
 def kb_is_ready() -> bool:
+    _sync()
     return _kb_ready
 
 
+def kb_set_warming(value: bool) -> None:
+    global _kb_warming
+    _kb_warming = bool(value)
+
+
+def kb_is_warming() -> bool:
+    """
+    True, пока идёт стартовый прогрев KB: хендлеры отвечают «ещё загружаюсь»
+    вместо собственной догрузки документов.
+    """
+    return _kb_warming and not kb_is_ready()
+
+
 def kb_mark_ready(value: bool) -> None:
-    global _kb_ready
+    """
+    ready=True увеличивает generation: другие процессы по нему понимают,
+    что KB перезагружена.
+    """
+    global _kb_ready, _kb_generation
+    if _db is not None:
+        _db.execute(
+            "UPDATE kb_state SET ready=?, generation=generation+?, updated_at=datetime('now') WHERE id=1",
+            (1 if value else 0, 1 if value else 0),
+        )
+        _sync(force=True)
+        return
     _kb_ready = bool(value)
+    if value:
+        _kb_generation += 1
+
+
+def kb_get_generation() -> int:
+    _sync()
+    return _kb_generation
 
 
 def kb_get_last_load_ts() -> Optional[int]:
+    _sync()
     return _kb_last_load_ts
 
 
@@ -31,9 +109,58 @@ def kb_set_last_load_ts(ts: int | None = None) -> None:
     global _kb_last_load_ts
     if ts is None:
         ts = int(time.time())
+    if _db is not None:
+        _db.execute("UPDATE kb_state SET last_load_ts=? WHERE id=1", (int(ts),))
+        _sync(force=True)
+        return
     _kb_last_load_ts = int(ts)
 
 
+def kb_lease_owner() -> str:
+    """
+    Токен одной загрузки: host:pid:uuid — две загрузки в одном процессе
+    (прогрев и /kb_reload) не считаются одним владельцем аренды.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+
+def kb_try_acquire_lease(owner: str, ttl_seconds: int) -> bool:
+    """
+    Аренда на загрузку KB: только один процесс грузит, остальные ждут.
+    Просроченную аренду (упавший процесс) можно перехватить.
+    Без БД аренда всегда "наша" — хватает process-local lock.
+    """
+    if _db is None:
+        return True
+    now = int(time.time())
+    cur = _db.execute(
+        """
+        UPDATE kb_state SET lease_owner=?, lease_expires_at=?
+        WHERE id=1 AND (lease_owner IS NULL OR lease_owner=? OR lease_expires_at < ?)
+        """,
+        (owner, now + int(ttl_seconds), owner, now),
+    )
+    return cur.rowcount == 1
+
+
+def kb_release_lease(owner: str) -> None:
+    if _db is None:
+        return
+    _db.execute(
+        "UPDATE kb_state SET lease_owner=NULL, lease_expires_at=NULL WHERE id=1 AND lease_owner=?",
+        (owner,),
+    )
+
+
+def kb_lease_active() -> bool:
+    if _db is None:
+        return False
+    rows = _db.query("SELECT lease_owner, lease_expires_at FROM kb_state WHERE id=1")
+    if not rows or rows[0]["lease_owner"] is None:
+        return False
+    return int(rows[0]["lease_expires_at"] or 0) >= int(time.time())
+
+
 def get_kb_loading_lock() -> asyncio.Lock:
     """
     Возвращает asyncio.Lock, создавая его лениво.
@@ -12,6 +12,8 @@ def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 150) -> list[st
         chunk = text[i:end].strip()
         if chunk:
             chunks.append(chunk)
+        if end >= n:
+            break
         i = end - overlap
         if i < 0:
             i = 0
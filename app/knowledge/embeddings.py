@@ -1,9 +1,19 @@
 from __future__ import annotations
-from openai import OpenAI
+import time
+
+from app.metrics import OPENAI_LATENCY
 
 def embed_texts(api_key: str, model: str, texts: list[str]) -> list[list[float]]:
+    from openai import OpenAI  # тяжёлый импорт — только при первой индексации/поиске
+
     client = OpenAI(api_key=api_key)
-    resp = client.embeddings.create(model=model, input=texts)
+    t0 = time.perf_counter()
+    status = "error"
+    try:
+        resp = client.embeddings.create(model=model, input=texts)
+        status = "ok"
+    finally:
+        OPENAI_LATENCY.observe(time.perf_counter() - t0, op="embeddings", status=status)
     return [d.embedding for d in resp.data]
 
 def embed_query(api_key: str, model: str, text: str) -> list[float]:
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
 import logging
-import httpx
 
 log = logging.getLogger(__name__)
 
 
 def export_doc_text(doc_id: str, fmt: str = "txt") -> str:
+    import httpx
+
     url = f"https://docs.google.com/document/d/{doc_id}/export?format={fmt}"
     try:
         with httpx.Client(timeout=30, follow_redirects=True) as client:
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable, List, Sequence
+
+from app.knowledge.rag import llm_answer
+
+log = logging.getLogger(__name__)
+
+# Грубая оценка без токенайзера: для смеси кириллицы и латиницы ~3 символа на токен
+# (с запасом: лучше недобрать истории, чем переполнить промпт)
+CHARS_PER_TOKEN = 3
+# Служебные токены на одно сообщение (role, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+# После сворачивания свежие реплики занимают не больше этой доли бюджета —
+# чтобы summary не пересчитывалось на каждом следующем запросе
+LOW_WATERMARK = 0.6
+
+SUMMARY_PREFIX = "Краткое содержание предыдущей части разговора:\n"
+
+SUMMARY_SYSTEM = (
+    "Ты ведёшь краткий конспект диалога психолога-бота с пользователем. "
+    "Обнови конспект с учётом новых реплик: факты о ситуации, чувства, образы, "
+    "договорённости. Пиши по-русски, кратко, без оценок и без новых выводов."
+)
+
+Summarizer = Callable[[str, List[dict]], str]
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = max(0, tokens) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[: max(0, limit - 1)].rstrip() + "…"
+
+
+def make_llm_summarizer(api_key: str, model: str, max_tokens: int) -> Summarizer:
+    """
+    Summarizer на OpenAI: (предыдущее summary, новые вытесняемые реплики) -> новое summary.
+    Вызов блокирующий: HistoryAssembler.assemble уводит его в поток.
+    """
+
+    def summarize(previous: str, messages: List[dict]) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = (
+            f"Текущий конспект:\n{previous or '—'}\n\n"
+            f"Новые реплики:\n{transcript}\n\n"
+            f"Верни обновлённый конспект не длиннее {max_tokens * CHARS_PER_TOKEN} символов."
+        )
+        return llm_answer(api_key, model, SUMMARY_SYSTEM, [{"role": "user", "content": prompt}])
+
+    return summarize
+
+
+class HistoryAssembler:
+    """
+    Собирает историю для промпта в пределах бюджета токенов:
+    [summary старых реплик] + свежие реплики целиком (с конца, сколько влезает).
+
+    Реплики, не влезшие в бюджет, дописываются в summary инкрементально
+    (в LLM уходит только предыдущее summary + вытесняемые реплики), summary
+    кэшируется в conversation_summaries и переиспользуется следующими запросами.
+    Блокирующий summarizer вызывается через asyncio.to_thread — event loop не ждёт OpenAI.
+    """
+
+    def __init__(
+        self,
+        repo,
+        summarize: Summarizer,
+        budget_tokens: int = 2000,
+        summary_tokens: int = 400,
+    ):
+        self.repo = repo
+        self.summarize = summarize
+        self.budget_tokens = int(budget_tokens)
+        self.summary_tokens = min(int(summary_tokens), self.budget_tokens // 2)
+
+    def _fit_recent(self, rows: Sequence, budget: int) -> int:
+        """
+        Индекс, с которого хвост rows помещается в budget (len(rows) — ничего не влезло).
+        """
+        used = 0
+        start = len(rows)
+        for i in range(len(rows) - 1, -1, -1):
+            cost = message_tokens(rows[i]["content"])
+            if used + cost > budget:
+                break
+            used += cost
+            start = i
+        return start
+
+    async def assemble(self, user_id: int) -> List[dict]:
+        cached = self.repo.get_conversation_summary(user_id)
+        summary, upto = cached if cached else ("", 0)
+        rows = self.repo.get_messages_after(user_id, upto)
+
+        recent_budget = self.budget_tokens - (self.summary_tokens if summary else 0)
+        start = self._fit_recent(rows, recent_budget)
+
+        if start > 0 and len(rows) > 1:
+            # не влезло: сворачиваем старое до нижней отметки, чтобы был запас на следующие реплики
+            low = self._fit_recent(rows, int((self.budget_tokens - self.summary_tokens) * LOW_WATERMARK))
+            # последнюю реплику (текущий вопрос) в summary не сворачиваем
+            start = min(max(start, low), len(rows) - 1)
+            folded = [{"role": r["role"], "content": r["content"]} for r in rows[:start]]
+            try:
+                folded_summary = await asyncio.to_thread(self.summarize, summary, folded)
+                summary = truncate_to_tokens(folded_summary.strip(), self.summary_tokens)
+                upto = int(rows[start - 1]["id"])
+                self.repo.save_conversation_summary(user_id, summary, upto)
+            except Exception:
+                # без summary просто отбрасываем старое: промпт всё равно ограничен
+                log.exception("History summary failed for user_id=%s", user_id)
+            rows = rows[start:]
+            start = self._fit_recent(rows, self.budget_tokens - (self.summary_tokens if summary else 0))
+
+        out: List[dict] = []
+        if summary:
+            out.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+        recent = rows[start:]
+        if not recent and rows:
+            # одна последняя реплика длиннее бюджета — обрезаем, но не теряем её целиком
+            last = rows[-1]
+            budget = self.budget_tokens - (self.summary_tokens if summary else 0) - MESSAGE_OVERHEAD_TOKENS
+            out.append({"role": last["role"], "content": truncate_to_tokens(last["content"], budget)})
+            return out
+        out.extend({"role": r["role"], "content": r["content"]} for r in recent)
+        return out
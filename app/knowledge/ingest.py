@@ -8,15 +8,38 @@ from app.storage.repo import Repo
 from app.knowledge.gdocs_loader import export_doc_text
 from app.knowledge.chunker import chunk_text
 from app.knowledge.embeddings import embed_texts
+from app.knowledge.symbolism import (
+    SYMBOLISM_COLLECTION,
+    build_symbolism_index,
+    is_symbolism_title,
+    symbolism_version,
+)
+from app.knowledge.vector_store import DEFAULT_COLLECTION, EmbeddingStore
 
 log = logging.getLogger(__name__)
 
 
+def source_collection(src: dict, title: str) -> tuple[str, list[str]]:
+    """
+    Коллекция и теги источника из GDOCS_SOURCES:
+    {"doc_id": "...", "title": "...", "collection": "faq", "tags": ["ru", "pricing"]}
+    Без явной коллекции «Символизм» попадает в свою, остальные — в "default".
+    """
+    default = SYMBOLISM_COLLECTION if is_symbolism_title(title) else DEFAULT_COLLECTION
+    collection = (src.get("collection") or default).strip()
+    tags = src.get("tags") or []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return collection, [t.strip() for t in tags if t and t.strip()]
+
+
 class KnowledgeIngestor:
-    def __init__(self, db: Database, settings):
+    def __init__(self, db: Database, settings, vectors: EmbeddingStore | None = None):
         self.db = db
-        self.repo = Repo(db)
+        self.repo = Repo(db, vectors=vectors)
         self.settings = settings
+        # ensure_docs_loaded поменял коллекцию/теги уже загруженных документов
+        self._metadata_changed = False
 
     async def ensure_indexed_once(self) -> int:
         """
@@ -37,6 +60,10 @@ class KnowledgeIngestor:
 
         rows = self.db.query("SELECT COUNT(*) AS c FROM kb_chunks")
         if int(rows[0]["c"]) > 0:
+            # чанки есть (например, БД пережила деплой), а memmap-файла ещё нет
+            # или в GDOCS_SOURCES поменялись коллекции/теги — перевыгружаем матрицу
+            if self._metadata_changed or not self.repo.vectors.available():
+                self.export_embeddings()
             return 0
         return await self.reindex_all()
 
@@ -64,16 +91,25 @@ class KnowledgeIngestor:
             if wanted and title.strip().lower() not in wanted:
                 continue
 
+            collection, tags = source_collection(src, title)
             existing_raw = self.repo.get_document_raw_text_by_source_key(source_key)
             if existing_raw and existing_raw.strip():
                 log.info("Document %s already loaded, skipping download", title)
+                # коллекция/теги берутся из GDOCS_SOURCES и могли поменяться после загрузки
+                if self.repo.update_document_metadata(source_key, collection, tags):
+                    log.info("Document %s moved to collection=%s tags=%s", title, collection, tags)
+                    self._metadata_changed = True
+                self._sync_symbol_entries(title, existing_raw)
                 continue
 
             log.info("Loading doc %s (%s)...", title, doc_id)
             raw = export_doc_text(doc_id=doc_id, fmt=fmt)
 
             # ВАЖНО: raw_text сохраняем всегда
-            self.repo.upsert_document(source_key=source_key, title=title, raw_text=raw)
+            self.repo.upsert_document(
+                source_key=source_key, title=title, raw_text=raw, collection=collection, tags=tags
+            )
+            self._sync_symbol_entries(title, raw)
             loaded += 1
 
         return loaded
@@ -106,7 +142,11 @@ class KnowledgeIngestor:
                 log.info("Loading doc %s (%s)...", title, doc_id)
                 raw = export_doc_text(doc_id=doc_id, fmt=fmt)
 
-            doc_db_id = self.repo.upsert_document(source_key=source_key, title=title, raw_text=raw)
+            collection, tags = source_collection(src, title)
+            doc_db_id = self.repo.upsert_document(
+                source_key=source_key, title=title, raw_text=raw, collection=collection, tags=tags
+            )
+            self._sync_symbol_entries(title, raw)
 
             chunks = chunk_text(raw, chunk_size=1400, overlap=180)
             if not chunks:
@@ -126,4 +166,35 @@ class KnowledgeIngestor:
             total_chunks += len(chunks)
             log.info("Indexed %s: %d chunks", title, len(chunks))
 
+        if total_chunks:
+            self.export_embeddings()
         return total_chunks
+
+    def export_embeddings(self) -> None:
+        """
+        Выгружает эмбеддинги всех чанков в EmbeddingStore (contiguous .npy + ids),
+        откуда kb_search читает их через memmap без парсинга JSON.
+        """
+        chunks = self.repo.get_chunk_vectors()
+        if not chunks:
+            return
+        self.repo.vectors.write(
+            ids=[chunk_id for chunk_id, _, _, _ in chunks],
+            embeddings=[emb for _, _, _, emb in chunks],
+            collections=[collection for _, collection, _, _ in chunks],
+            tags=[tags for _, _, tags, _ in chunks],
+        )
+
+    def _sync_symbol_entries(self, title: str, raw: str) -> None:
+        """
+        Для документа «Символизм» материализует индекс в symbol_entries,
+        чтобы воркеры не парсили raw_text после каждого рестарта.
+        Пересобираем только если поменялась версия документа.
+        """
+        if not is_symbolism_title(title):
+            return
+        if self.repo.get_symbol_entries_version() == symbolism_version(raw):
+            return
+        sym = build_symbolism_index(raw, source_title="symbolism")
+        self.repo.replace_symbol_entries(sym)
+        log.info("Symbolism entries materialized: %d (version=%s)", len(sym.index), sym.version)
@@ -1,19 +1,29 @@
 from __future__ import annotations
-import numpy as np
-from openai import OpenAI
+import time
+
+# numpy и openai импортируются в функциях: модуль тянут history/admin на старте,
+# а сами вызовы нужны только при ответе LLM
 
 def cosine_sim(a: list[float], b: list[float]) -> float:
+    import numpy as np
+
     va = np.array(a, dtype=np.float32)
     vb = np.array(b, dtype=np.float32)
     denom = (np.linalg.norm(va) * np.linalg.norm(vb)) + 1e-9
     return float(np.dot(va, vb) / denom)
 
 def top_k_chunks(query_emb: list[float], chunks: list[tuple[int, str, list[float]]], k: int) -> list[tuple[int, str, float]]:
-    scored = []
-    for chunk_id, content, emb in chunks:
-        scored.append((chunk_id, content, cosine_sim(query_emb, emb)))
-    scored.sort(key=lambda x: x[2], reverse=True)
-    return scored[:k]
+    if not chunks or k <= 0:
+        return []
+    import numpy as np
+
+    # одно матричное умножение вместо cosine_sim в цикле
+    matrix = np.asarray([emb for _, _, emb in chunks], dtype=np.float32)
+    q = np.asarray(query_emb, dtype=np.float32)
+    denom = (np.linalg.norm(matrix, axis=1) * np.linalg.norm(q)) + 1e-9
+    scores = (matrix @ q) / denom
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [(chunks[i][0], chunks[i][1], float(scores[i])) for i in order]
 
 def build_context(chunks: list[tuple[int, str, float]], max_chars: int) -> str:
     parts = []
@@ -32,14 +42,23 @@ def llm_answer(
     system: str,
     messages: list[dict],
 ) -> str:
+    from openai import OpenAI
+    from app.metrics import OPENAI_LATENCY
+
     client = OpenAI(api_key=api_key)
-    resp = client.responses.create(
-        model=model,
-        input=[
-            {"role": "system", "content": system},
-            *messages,
-        ],
-    )
+    t0 = time.perf_counter()
+    status = "error"
+    try:
+        resp = client.responses.create(
+            model=model,
+            input=[
+                {"role": "system", "content": system},
+                *messages,
+            ],
+        )
+        status = "ok"
+    finally:
+        OPENAI_LATENCY.observe(time.perf_counter() - t0, op="responses", status=status)
     # normalize
     out = []
     for item in resp.output:
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from app.knowledge.symbolism import SymbolismIndex, guess_key_from_scene
+
+# Правила сопоставления (в порядке приоритета). Строгий режим = только первые два,
+# т.е. ровно то, что раньше делал find_symbol_entry.
+RULE_EXACT = "exact"
+RULE_TRIM_VOWEL = "trim_vowel"
+RULE_STEM = "stem"
+RULE_FUZZY = "fuzzy"
+
+_TRIM_VOWELS = ("а", "я", "ы", "и", "у", "ю", "е", "о")
+
+# Окончания словоизменения (длинные раньше коротких)
+_INFLECTIONS = (
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими",
+    "ах", "ях", "ом", "ем", "ой", "ей", "ам", "ям", "ов", "ев",
+    "ы", "и", "а", "я", "у", "ю", "е", "о", "ь", "й",
+)
+
+# Уменьшительные/производные суффиксы: волчонок, волчата, волчица, лисичка, зайчик...
+_DERIVATIONS = (
+    "онька", "енька", "онок", "енок", "ушка", "юшка", "ишка", "ышка",
+    "очка", "ечка", "ичка", "ица", "иха", "чик", "ата", "ята", "ат", "ят",
+    "ик", "ок", "ек",
+)
+
+# Чередование согласных в основе: волк -> волчица, заяц -> зайчик не ловим, но к/ч, г/ж, х/ш — да
+_ALTERNATIONS = {"ч": "к", "ж": "г", "ш": "х"}
+
+_MIN_STEM = 3
+
+
+def _strip_suffix(word: str, suffixes: tuple[str, ...]) -> str:
+    for suf in suffixes:
+        if word.endswith(suf) and len(word) - len(suf) >= _MIN_STEM:
+            return word[: -len(suf)]
+    return word
+
+
+def stem_word(word: str) -> str:
+    """
+    Грубый стеммер для русских существительных (без словарей):
+    не больше двух срезов (суффикс или окончание), затем чередующаяся
+    согласная в конце основы приводится к общему виду.
+    Пример: "волчатами" -> "волк", "лисенок" -> "лис", "волчица" -> "волк".
+    """
+    w = word
+    for _ in range(2):
+        w2 = _strip_suffix(w, _DERIVATIONS)
+        if w2 == w:
+            w2 = _strip_suffix(w, _INFLECTIONS)
+        if w2 == w:
+            break
+        w = w2
+    if w and w[-1] in _ALTERNATIONS:
+        w = w[:-1] + _ALTERNATIONS[w[-1]]
+    return w
+
+
+def levenshtein(a: str, b: str) -> int:
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def max_distance_for(word: str) -> int:
+    """
+    Допустимая опечатка зависит от длины слова: короткие слова не «чиним»,
+    иначе "кот" внезапно станет "кит".
+    """
+    n = len(word)
+    if n < 5:
+        return 0
+    if n < 8:
+        return 1
+    return 2
+
+
+_MAX_FUZZY = 2
+
+
+def _deletes(word: str, depth: int) -> set[str]:
+    """
+    Все варианты слова с удалёнными 0..depth символами.
+    """
+    out = {word}
+    frontier = {word}
+    for _ in range(depth):
+        nxt = set()
+        for w in frontier:
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        out |= nxt
+        frontier = nxt
+    return out
+
+
+class DeleteIndex:
+    """
+    Индекс «симметричных удалений» (как в SymSpell): для каждого ключа заранее
+    храним его варианты с удалёнными символами. Поиск в радиусе d — это пара
+    словарных lookup'ов по удалениям запроса и проверка кандидатов Левенштейном,
+    без обхода всего словаря (микросекунды даже на тысячах ключей).
+    """
+
+    def __init__(self, words: List[str] | None = None, max_dist: int = _MAX_FUZZY):
+        self.max_dist = max_dist
+        self._by_delete: Dict[str, List[str]] = {}
+        for w in words or []:
+            for d in _deletes(w, max_dist):
+                self._by_delete.setdefault(d, []).append(w)
+
+    def search(self, word: str, max_dist: int) -> List[Tuple[int, str]]:
+        max_dist = min(max_dist, self.max_dist)
+        if max_dist < 0:
+            return []
+        seen: set[str] = set()
+        out: List[Tuple[int, str]] = []
+        for d in _deletes(word, max_dist):
+            for cand in self._by_delete.get(d, ()):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                if abs(len(cand) - len(word)) > max_dist:
+                    continue
+                dist = levenshtein(word, cand)
+                if dist <= max_dist:
+                    out.append((dist, cand))
+        out.sort()
+        return out
+
+
+@dataclass(frozen=True)
+class SymbolMatch:
+    """
+    Результат поиска символа.
+    rule — каким правилом найдено (exact/trim_vowel/stem/fuzzy), для аудита «строгой структуры».
+    requested — нормализованный ключ, который искали.
+    """
+    key: str
+    entry: str
+    rule: str
+    requested: str
+    distance: int = 0
+
+
+class SymbolLookup:
+    """
+    Поисковая структура над ключами «Символизма»:
+    - exact: точный ключ
+    - trim_vowel: старое правило (отрезать гласную на конце)
+    - stem: совпадение основы (падежи, мн. число, уменьшительные формы)
+    - fuzzy: опечатки в пределах max_distance_for(...) через DeleteIndex
+    """
+
+    def __init__(self, sym: SymbolismIndex):
+        self.sym = sym
+        self._stems: Dict[str, List[str]] = {}
+        for key in sym.index:
+            self._stems.setdefault(stem_word(key), []).append(key)
+        self._fuzzy = DeleteIndex(sorted(sym.index))
+
+    def _match(self, requested: str, key: str, rule: str, distance: int = 0) -> SymbolMatch:
+        return SymbolMatch(key=key, entry=self.sym.index[key], rule=rule, requested=requested, distance=distance)
+
+    def lookup(self, scene_or_word: str, strict: bool = False) -> SymbolMatch | None:
+        if not self.sym.index:
+            return None
+
+        key = guess_key_from_scene(scene_or_word)
+        if not key:
+            return None
+
+        if key in self.sym.index:
+            return self._match(key, key, RULE_EXACT)
+
+        for cut in _TRIM_VOWELS:
+            if key.endswith(cut) and len(key) > 4:
+                k2 = key[:-1]
+                if k2 in self.sym.index:
+                    return self._match(key, k2, RULE_TRIM_VOWEL)
+
+        if strict:
+            return None
+
+        candidates = self._stems.get(stem_word(key))
+        if candidates:
+            best = min(candidates, key=lambda k: (levenshtein(key, k), k))
+            return self._match(key, best, RULE_STEM, levenshtein(key, best))
+
+        found = self._fuzzy.search(key, max_distance_for(key))
+        if found:
+            dist, best = found[0]
+            return self._match(key, best, RULE_FUZZY, dist)
+
+        return None
+
+
+_cached: Tuple[str, SymbolLookup] | None = None
+# (doc_version, индекс)
+_cached_index: Tuple[str, SymbolismIndex] | None = None
+
+
+def load_symbolism_index_cached(repo) -> SymbolismIndex:
+    """
+    Индекс «Символизма» из symbol_entries с кэшем в процессе по doc_version:
+    на запрос — одна строка (версия), вся таблица — только при смене версии.
+    Так видна любая запись replace_symbol_entries (ingest, ленивая догрузка
+    в хендлере, другая реплика), даже без новой generation KB.
+    """
+    global _cached_index
+    version = repo.get_symbol_entries_version()
+    if version is None:
+        return SymbolismIndex(index={}, source_title="symbolism")
+    if _cached_index is None or _cached_index[0] != version:
+        _cached_index = (version, repo.load_symbolism_index())
+    return _cached_index[1]
+
+
+def get_symbol_lookup(sym: SymbolismIndex) -> SymbolLookup:
+    """
+    Кэширует построенную структуру по версии документа: пересобираем только
+    когда «Символизм» реально изменился.
+    """
+    global _cached
+    if not sym.version:
+        return SymbolLookup(sym)
+    if _cached is None or _cached[0] != sym.version:
+        _cached = (sym.version, SymbolLookup(sym))
+    return _cached[1]
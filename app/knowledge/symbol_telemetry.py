@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from app.knowledge.symbol_lookup import SymbolMatch
+from app.knowledge.symbolism import guess_key_from_scene
+
+log = logging.getLogger(__name__)
+
+# Сырую историю держим столько дней (агрегаты — бессрочно)
+KEEP_DAYS = 30
+_PRUNE_EVERY_SECONDS = 3600.0
+
+
+class SymbolTelemetry:
+    """
+    Учёт попаданий/промахов поиска символов. record() только кладёт запись в память,
+    flush() пишет пачку одной транзакцией (Repo.record_symbol_lookups).
+    """
+
+    def __init__(self, repo, keep_days: int = KEEP_DAYS):
+        self.repo = repo
+        self.keep_days = keep_days
+        self._pending: List[Tuple[Optional[int], str, Optional[str], Optional[str], str]] = []
+        self._pruned_at = 0.0
+
+    def record(self, user_id: int | None, requested: str, match: SymbolMatch | None) -> None:
+        key = match.requested if match is not None else (guess_key_from_scene(requested) or (requested or "")[:100])
+        if not key:
+            return
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        self._pending.append((
+            user_id,
+            key,
+            match.key if match is not None else None,
+            match.rule if match is not None else None,
+            ts,
+        ))
+
+    def flush(self) -> int:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            self.repo.record_symbol_lookups(batch)
+        except Exception:
+            self._pending = batch + self._pending
+            raise
+
+        now = time.monotonic()
+        if now - self._pruned_at >= _PRUNE_EVERY_SECONDS:
+            self._pruned_at = now
+            self.repo.prune_symbol_lookups(self.keep_days)
+        return len(batch)
+
+    async def run(self, interval_seconds: float) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Symbol telemetry flush failed (will retry)")
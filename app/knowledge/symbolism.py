@@ -1,10 +1,31 @@
 from __future__ import annotations
 
+import hashlib
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, Tuple, List
 
 
+# Названия документа «Символизм» в GDOCS_SOURCES (сравниваем в нижнем регистре)
+SYMBOLISM_TITLES = ("symbolism", "символизм")
+
+# Коллекция по умолчанию для «Символизма»: он нужен только для точного lookup,
+# поэтому семантический поиск (kb_search) её по умолчанию не трогает.
+SYMBOLISM_COLLECTION = "symbolism"
+
+
+def is_symbolism_title(title: str | None) -> bool:
+    return (title or "").strip().lower() in SYMBOLISM_TITLES
+
+
+def symbolism_version(raw_text: str) -> str:
+    """
+    Версия документа = короткий хэш raw_text.
+    По ней понимаем, что таблица symbol_entries устарела и её надо пересобрать.
+    """
+    return hashlib.sha1((raw_text or "").encode("utf-8")).hexdigest()[:16]
+
+
 def normalize_word(s: str) -> str:
     """
     Нормализует слово для ключей словаря:
@@ -37,9 +58,13 @@ class SymbolismIndex:
     """
     index: ключ (например 'волк') -> блок текста (как в файле)
     source_title: для диагностики
+    display: ключ -> слово заголовка как в файле (например 'волк' -> 'Волк')
+    version: версия исходного документа (см. symbolism_version)
     """
     index: Dict[str, str]
     source_title: str = "symbolism"
+    display: Dict[str, str] = field(default_factory=dict)
+    version: str = ""
 
 
 def build_symbolism_index(raw_text: str, source_title: str = "symbolism") -> SymbolismIndex:
@@ -54,6 +79,7 @@ def build_symbolism_index(raw_text: str, source_title: str = "symbolism") -> Sym
         return SymbolismIndex(index={}, source_title=source_title)
 
     index: Dict[str, str] = {}
+    display: Dict[str, str] = {}
 
     current_key: str | None = None
     current_block: List[str] = []
@@ -76,6 +102,7 @@ def build_symbolism_index(raw_text: str, source_title: str = "symbolism") -> Sym
 
                 current_key = key
                 current_block = [stripped]
+                display[key] = m.group(1)
                 continue
 
         # тело блока
@@ -86,7 +113,12 @@ def build_symbolism_index(raw_text: str, source_title: str = "symbolism") -> Sym
     if current_key and current_block:
         index[current_key] = "\n".join(current_block).strip()
 
-    return SymbolismIndex(index=index, source_title=source_title)
+    return SymbolismIndex(
+        index=index,
+        source_title=source_title,
+        display=display,
+        version=symbolism_version(raw_text),
+    )
 
 
 def find_symbol_entry(sym: SymbolismIndex, scene_or_word: str) -> Tuple[str, str] | None:
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from typing import TYPE_CHECKING
+
+# numpy импортируется в методах: хранилище создаётся при импорте Repo, а матрица
+# нужна только при поиске/индексации
+if TYPE_CHECKING:
+    import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Файлы хранилища:
+#   embeddings-<version>.npy      float32 [N, dim], строки уже L2-нормированы
+#   embeddings-<version>.ids.npy  int64 [N], chunk_id для каждой строки (offset = номер строки)
+#   embeddings-<version>.tags.npy uint64 [N], битовая маска тегов строки (словарь — в CURRENT.json)
+#   CURRENT.json                  {"version", "count", "dim", "collections", "tags"} — указатель
+#                                 на актуальную версию; collections: имя -> [start, end)
+# Строки отсортированы по коллекции, поэтому коллекция — это непрерывный срез матрицы:
+# фильтр по коллекции не копирует данные и трогает только свои страницы memmap.
+# Новая версия пишется рядом и включается атомарным os.replace(CURRENT.json),
+# поэтому читатели никогда не видят наполовину записанную матрицу.
+POINTER_FILE = "CURRENT.json"
+KEEP_VERSIONS = 2
+DEFAULT_COLLECTION = "default"
+MAX_TAGS = 64
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    import numpy as np
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingStore:
+    """
+    Общая для всех процессов на хосте матрица эмбеддингов чанков.
+    Открывается через np.load(mmap_mode="r") (np.memmap): процессы делят одну копию
+    в page cache, а на старте ничего не парсят (никакого json.loads по чанкам).
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self._pointer_mtime: float | None = None
+        self._generation: int | None = None
+        self._version: str | None = None
+        self._matrix: np.ndarray | None = None
+        self._ids: np.ndarray | None = None
+        self._tag_bits: np.ndarray | None = None
+        self._collections: dict[str, tuple[int, int]] = {}
+        self._tag_vocab: dict[str, int] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.base_dir, name)
+
+    # --- write (ingest) ---
+    def write(
+        self,
+        ids: list[int],
+        embeddings: list[list[float]],
+        collections: list[str] | None = None,
+        tags: list[list[str]] | None = None,
+    ) -> str:
+        import numpy as np
+
+        os.makedirs(self.base_dir, exist_ok=True)
+        version = f"{time.time_ns()}-{os.getpid()}"
+
+        n = len(ids)
+        collections = collections or [DEFAULT_COLLECTION] * n
+        tags = tags or [[] for _ in range(n)]
+        order = sorted(range(n), key=lambda i: (collections[i], ids[i]))
+
+        matrix = np.asarray([embeddings[i] for i in order], dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(n, -1)
+        matrix = _normalize(matrix)
+        id_arr = np.asarray([ids[i] for i in order], dtype=np.int64)
+
+        ranges: dict[str, list[int]] = {}
+        for row, i in enumerate(order):
+            r = ranges.setdefault(collections[i], [row, row])
+            r[1] = row + 1
+
+        vocab = sorted({t for i in range(n) for t in tags[i]})
+        if len(vocab) > MAX_TAGS:
+            log.warning("Too many KB tags (%d > %d); extra tags are not filterable", len(vocab), MAX_TAGS)
+            vocab = vocab[:MAX_TAGS]
+        bit = {t: j for j, t in enumerate(vocab)}
+        tag_bits = np.zeros(n, dtype=np.uint64)
+        for row, i in enumerate(order):
+            mask = 0
+            for t in tags[i]:
+                if t in bit:
+                    mask |= 1 << bit[t]
+            tag_bits[row] = mask
+
+        files = (
+            (f"embeddings-{version}.npy", matrix),
+            (f"embeddings-{version}.ids.npy", id_arr),
+            (f"embeddings-{version}.tags.npy", tag_bits),
+        )
+        for name, arr in files:
+            tmp = self._path(name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._path(name))
+
+        pointer_tmp = self._path(POINTER_FILE + ".tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": version,
+                    "count": int(matrix.shape[0]),
+                    "dim": int(matrix.shape[1]),
+                    "collections": ranges,
+                    "tags": vocab,
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, self._path(POINTER_FILE))
+
+        self._cleanup(keep=version)
+        log.info("Embedding store written: version=%s rows=%s dim=%s", version, matrix.shape[0], matrix.shape[1])
+        return version
+
+    def _cleanup(self, keep: str) -> None:
+        """
+        Оставляем текущую и предыдущую версии: читатель мог ещё не переоткрыть файл.
+        (На Linux удаление замапленного файла безопасно, но так проще отлаживать.)
+        """
+        versions = sorted(
+            {n[len("embeddings-"):].split(".")[0] for n in os.listdir(self.base_dir) if n.startswith("embeddings-")},
+            key=lambda v: int(v.split("-")[0]),
+        )
+        for v in versions[:-KEEP_VERSIONS]:
+            if v == keep:
+                continue
+            for suffix in (".npy", ".ids.npy", ".tags.npy"):
+                try:
+                    os.remove(self._path(f"embeddings-{v}{suffix}"))
+                except FileNotFoundError:
+                    pass
+
+    # --- read (retrieval) ---
+    def _refresh(self) -> bool:
+        """
+        Дёшево проверяет указатель (один stat) и generation KB и переоткрывает файлы
+        при смене версии. generation ловит перезагрузку, даже если mtime указателя
+        не изменился (грубое разрешение mtime на части ФС).
+        """
+        import numpy as np
+
+        from app.kb.state import kb_get_generation
+
+        pointer = self._path(POINTER_FILE)
+        try:
+            mtime = os.stat(pointer).st_mtime
+        except FileNotFoundError:
+            self._matrix = None
+            self._ids = None
+            self._tag_bits = None
+            self._version = None
+            self._pointer_mtime = None
+            return False
+
+        generation = kb_get_generation()
+        if mtime == self._pointer_mtime and generation == self._generation and self._matrix is not None:
+            return True
+
+        with open(pointer, encoding="utf-8") as f:
+            meta = json.load(f)
+        version = meta["version"]
+        if version != self._version or self._matrix is None:
+            self._matrix = np.load(self._path(f"embeddings-{version}.npy"), mmap_mode="r")
+            self._ids = np.load(self._path(f"embeddings-{version}.ids.npy"), mmap_mode="r")
+            self._tag_bits = np.load(self._path(f"embeddings-{version}.tags.npy"), mmap_mode="r")
+            self._collections = {k: (int(v[0]), int(v[1])) for k, v in meta.get("collections", {}).items()}
+            self._tag_vocab = {t: j for j, t in enumerate(meta.get("tags", []))}
+            self._version = version
+        self._pointer_mtime = mtime
+        self._generation = generation
+        return True
+
+    def available(self) -> bool:
+        try:
+            return self._refresh() and self._matrix is not None and self._matrix.shape[0] > 0
+        except Exception:
+            log.exception("Embedding store is unreadable: %s", self.base_dir)
+            return False
+
+    @property
+    def version(self) -> str | None:
+        return self._version
+
+    def collections(self) -> list[str]:
+        if not self.available():
+            return []
+        return sorted(self._collections)
+
+    def _rows(self, collections: list[str] | None, tags: list[str] | None) -> list[np.ndarray]:
+        """
+        Номера строк-кандидатов по партициям: сначала срезы коллекций, затем маска тегов
+        (совпадение хотя бы одного тега). Всё это — до скоринга.
+        """
+        import numpy as np
+
+        if collections is None:
+            spans = [(0, self._matrix.shape[0])]
+        else:
+            spans = [self._collections[c] for c in collections if c in self._collections]
+
+        wanted = 0
+        if tags:
+            for t in tags:
+                if t in self._tag_vocab:
+                    wanted |= 1 << self._tag_vocab[t]
+            if not wanted:
+                return []
+
+        out = []
+        for start, end in spans:
+            rows = np.arange(start, end)
+            if wanted:
+                rows = rows[(self._tag_bits[start:end] & np.uint64(wanted)) != 0]
+            if rows.size:
+                out.append(rows)
+        return out
+
+    def search(
+        self,
+        query_embedding: list[float],
+        top_k: int,
+        collections: list[str] | None = None,
+        tags: list[str] | None = None,
+    ) -> list[tuple[int, float]]:
+        """
+        Возвращает [(chunk_id, cosine)] по убыванию сходства.
+        collections/tags (опционально) сужают набор строк до скоринга.
+        """
+        import numpy as np
+
+        if not self.available():
+            return []
+        matrix = self._matrix
+        q = np.asarray(query_embedding, dtype=np.float32)
+        if q.shape[0] != matrix.shape[1]:
+            log.warning("Query dim %s != store dim %s", q.shape[0], matrix.shape[1])
+            return []
+        qn = np.linalg.norm(q)
+        if qn <= 0:
+            return []
+        q = q / qn
+
+        all_rows: list[np.ndarray] = []
+        all_scores: list[np.ndarray] = []
+        for rows in self._rows(collections, tags):
+            start, end = int(rows[0]), int(rows[-1]) + 1
+            if rows.size == end - start:
+                # сплошной срез (без фильтра тегов) — view на memmap, без копии
+                sub = matrix[start:end]
+            else:
+                sub = matrix[rows]
+            all_rows.append(rows)
+            all_scores.append(sub @ q)
+        if not all_rows:
+            return []
+
+        rows = np.concatenate(all_rows)
+        scores = np.concatenate(all_scores)
+        k = min(int(top_k), scores.shape[0])
+        if k <= 0:
+            return []
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx])]
+        return [(int(self._ids[rows[i]]), float(scores[i])) for i in idx]
+
+
+_default_store: EmbeddingStore | None = None
+
+
+def get_embedding_store() -> EmbeddingStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = EmbeddingStore(os.getenv("KB_VECTORS_DIR", "./data/vectors"))
+    return _default_store
@@ -6,9 +6,12 @@ import os
 import sys
 import time
 import traceback
-import threading
 import socket
-from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from app import startup_profile
+
+# до любых импортов приложения: иначе профиль не увидит время их загрузки
+startup_profile.start()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,135 +22,269 @@ log = logging.getLogger(__name__)
 # Лог "BOOT" — только ПОСЛЕ создания log
 log.info("BOOT pid=%s host=%s", os.getpid(), socket.gethostname())
 
+# Только лёгкие модули: telegram/openai/numpy/httpx грузятся в main() после
+# настроек (и .env) или при первом использовании подсистемы
 try:
-    from app.config import get_settings
+    from app.config import env_flag, get_settings
     from app.logging_setup import setup_logging
     from app.storage.db import Database
     from app.storage.schema import ensure_schema
-    from app.knowledge.ingest import KnowledgeIngestor
-    from app.bot.telegram_bot import build_application
-    from app.push.scheduler import SchedulerService
+    from app.web.server import HttpServer, Response
+    from app.metrics import REGISTRY, Heartbeat
 except Exception as e:
     print("FATAL: import failed in app.main.py:", repr(e), flush=True)
     traceback.print_exc()
     raise
 
 
-def _start_health_server() -> None:
+async def _start_http_server(heartbeat: Heartbeat, readiness: dict) -> HttpServer:
     """
     Railway Web Service часто ждёт, что процесс слушает $PORT.
-    Этот мини-сервер отвечает 200 OK и предотвращает рестарты.
+    Сервер на asyncio (в том же loop, что и бот): health, readiness, метрики и webhook.
+    - /healthz: пульс event loop (503, если loop завис);
+    - /readyz: БД отвечает и KB загружена (app.kb.state);
+    - /metrics: Prometheus text format (app.metrics).
+    На любой другой GET (и /health) отвечаем 200 OK, как и раньше, чтобы не было рестартов.
     """
     port = int(os.getenv("PORT", "8080"))
+    server = HttpServer("0.0.0.0", port)
 
-    class Handler(BaseHTTPRequestHandler):
-        def do_GET(self):
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(b"OK")
-
-        def log_message(self, format, *args):
-            return  # не спамим логи
-
-    server = HTTPServer(("0.0.0.0", port), Handler)
-    t = threading.Thread(target=server.serve_forever, daemon=True)
-    t.start()
-    log.info("Health server listening on 0.0.0.0:%s", port)
+    async def ok(req):
+        return Response(status=200, body=b"OK")
 
+    async def healthz(req):
+        if heartbeat.healthy():
+            return Response(status=200, body=f"ok lag={heartbeat.lag:.3f}s".encode())
+        return Response(status=503, body=b"event loop heartbeat is stale")
 
-def _env_flag(name: str, default: bool = False) -> bool:
-    raw = os.getenv(name)
-    if raw is None:
-        return default
-    raw = raw.strip().lower()
-    if raw in ("1", "true", "yes", "y", "on"):
-        return True
-    if raw in ("0", "false", "no", "n", "off", ""):
-        return False
-    log.warning("Env %s has unexpected value %r; treating as True", name, raw)
-    return True
+    async def readyz(req):
+        from app.kb.state import kb_is_ready
 
-
-def _set_kb_state(ready: bool) -> None:
-    try:
-        from app.kb.state import kb_mark_ready, kb_set_last_load_ts
-        kb_mark_ready(bool(ready))
-        if ready:
-            kb_set_last_load_ts(int(time.time()))
-    except Exception:
-        log.exception("Failed to update KB state")
+        db = readiness.get("db")
+        if db is None:
+            return Response(status=503, body=b"db not initialized")
+        try:
+            db.query("SELECT 1")
+        except Exception as e:
+            return Response(status=503, body=f"db unavailable: {e}".encode())
+        if not kb_is_ready():
+            return Response(status=503, body=b"kb not ready")
+        return Response(status=200, body=b"ready")
+
+    async def metrics(req):
+        return Response(
+            status=200,
+            body=REGISTRY.render().encode(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+    server.route("GET", "/health", ok)
+    server.route("GET", "/healthz", healthz)
+    server.route("GET", "/readyz", readyz)
+    server.route("GET", "/metrics", metrics)
+    server.fallback_get(ok)
+    await server.start()
+    return server
 
 
 async def _startup_kb(db: Database, settings) -> int:
+    from app.kb.lazy_loader import run_kb_load
+    from app.knowledge.ingest import KnowledgeIngestor
+
     ingestor = KnowledgeIngestor(db=db, settings=settings)
-    indexed = await ingestor.ensure_indexed_once()
+    # под арендой в kb_state: при нескольких репликах индексирует только одна
+    indexed = await run_kb_load(ingestor.ensure_indexed_once)
     return int(indexed or 0)
 
 
+# Повторы фонового прогрева KB: пауза перед попыткой N (секунды)
+KB_WARM_RETRY_DELAYS = (30, 120, 600)
+
+
+async def _warm_kb(db: Database, settings) -> None:
+    """
+    Прогрев KB после старта бота (апдейты уже обрабатываются).
+    Ошибка не роняет процесс: повторяем с паузами, пока не кончатся попытки.
+    """
+    from app.kb.state import kb_set_warming
+
+    kb_set_warming(True)
+    try:
+        for attempt, delay in enumerate((0,) + KB_WARM_RETRY_DELAYS, start=1):
+            if delay:
+                await asyncio.sleep(delay)
+            t0 = time.perf_counter()
+            try:
+                indexed = await _startup_kb(db, settings)
+                log.info("KB warm start done (indexed=%s) in %.1fs", indexed, time.perf_counter() - t0)
+                return
+            except Exception as e:
+                # ready снимает run_kb_load, и только если KB ещё ни разу не загружалась
+                log.exception("KB warm start attempt %s failed: %s", attempt, e)
+        log.error("KB warm start gave up; /kb_reload remains available")
+    finally:
+        kb_set_warming(False)
+
+
 async def main() -> None:
     print("MAIN: entered main()", flush=True)
 
-    settings = get_settings()
-    setup_logging(settings.log_level)
+    t_start = time.perf_counter()
+    with startup_profile.phase("settings"):
+        settings = get_settings()
+        setup_logging(settings.log_level)
 
     # Railway Web требует порт
-    _start_health_server()
+    heartbeat = Heartbeat()
+    heartbeat_task = asyncio.create_task(heartbeat.run())
+    readiness: dict = {}
+    with startup_profile.phase("http_server"):
+        http_server = await _start_http_server(heartbeat, readiness)
 
     log.info("Starting bot...")
 
-    db = Database(settings.database_url)
-    ensure_schema(db)
+    with startup_profile.phase("db"):
+        db = Database(settings.database_url)
+        ensure_schema(db)
 
-    kb_disable_startup = _env_flag("KB_DISABLE_STARTUP", default=False)
-    log.info("KB_DISABLE_STARTUP=%r (parsed=%s)", os.getenv("KB_DISABLE_STARTUP"), kb_disable_startup)
+        # KB ready/generation/lease — общие для всех процессов через БД
+        from app.kb.state import kb_bind_db
+        kb_bind_db(db)
+        readiness["db"] = db
 
+    kb_disable_startup = env_flag("KB_DISABLE_STARTUP", default=False)
+    log.info("KB_DISABLE_STARTUP=%r (parsed=%s)", os.getenv("KB_DISABLE_STARTUP"), kb_disable_startup)
     if kb_disable_startup:
+        # состояние KB общее для реплик: этот процесс просто не грузит её сам
         log.warning("KB startup disabled by env KB_DISABLE_STARTUP")
-        _set_kb_state(False)
-    else:
+
+    with startup_profile.phase("import_bot"):
         try:
-            indexed = await _startup_kb(db, settings)
-            _set_kb_state(True)
-            log.info("KB warm start done (indexed=%s)", indexed)
+            from app.bot.telegram_bot import build_application
+            from app.bot.persistence import SqlitePersistence
+            from app.push.scheduler import SchedulerService
         except Exception as e:
-            _set_kb_state(False)
-            log.exception("KB startup failed, continuing without KB: %s", e)
-
-    scheduler = SchedulerService(db=db, settings=settings)
-    scheduler.start()
-
-    application = build_application(db=db, settings=settings, scheduler=scheduler)
-
-    # ВАЖНО: delete_webhook делаем ДО polling, но ПОСЛЕ initialize()
-    await application.initialize()
-
-    try:
-        await application.bot.delete_webhook(drop_pending_updates=True)
-        log.info("Webhook deleted (drop_pending_updates=True)")
-    except Exception:
-        log.exception("delete_webhook failed (continuing)")
-
-    await application.start()
-
-    log.info("Bot started. Listening...")
-    await application.updater.start_polling(drop_pending_updates=True)
+            print("FATAL: import failed in app.main.py:", repr(e), flush=True)
+            traceback.print_exc()
+            raise
+
+    with startup_profile.phase("build_application"):
+        scheduler = SchedulerService(db=db, settings=settings)
+
+        # write-behind для last_seen/счётчиков: одна транзакция раз в N секунд вместо записи на каждое сообщение
+        from app.storage.activity import ActivityBuffer
+        flush_every = float(getattr(settings, "activity_flush_seconds", 10.0))
+        activity = ActivityBuffer(db) if flush_every > 0 else None
+
+        application = build_application(db=db, settings=settings, scheduler=scheduler, activity=activity)
+
+    use_webhook = settings.bot_mode == "webhook"
+    if use_webhook and not settings.webhook_url:
+        log.error("BOT_MODE=webhook but WEBHOOK_URL is empty -> falling back to polling")
+        use_webhook = False
+    if use_webhook and not settings.webhook_secret:
+        # секрет общий для всех реплик: случайный на каждый старт сломал бы
+        # проверку заголовка у всех, кроме последней вызвавшей set_webhook
+        log.error("BOT_MODE=webhook but WEBHOOK_SECRET is empty -> falling back to polling")
+        use_webhook = False
+
+    with startup_profile.phase("initialize"):
+        await application.initialize()
+
+    if use_webhook:
+        from telegram import Update
+        from app.web.webhook import make_webhook_handler
+
+        # секрет проверяем в заголовке X-Telegram-Bot-Api-Secret-Token
+        secret = settings.webhook_secret
+        http_server.route("POST", settings.webhook_path, make_webhook_handler(application, secret))
+
+        await application.start()
+        await application.bot.set_webhook(
+            url=settings.webhook_url + settings.webhook_path,
+            secret_token=secret,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True,
+        )
+        log.info("Bot started in webhook mode: %s%s", settings.webhook_url, settings.webhook_path)
+    else:
+        # ВАЖНО: delete_webhook делаем ДО polling, но ПОСЛЕ initialize()
+        try:
+            await application.bot.delete_webhook(drop_pending_updates=True)
+            log.info("Webhook deleted (drop_pending_updates=True)")
+        except Exception:
+            log.exception("delete_webhook failed (continuing)")
+
+        await application.start()
+
+        log.info("Bot started. Listening...")
+        await application.updater.start_polling(drop_pending_updates=True)
+
+    log.info("Startup: serving updates after %.0f ms", (time.perf_counter() - t_start) * 1000)
+    startup_profile.finish()
+
+    # фоновые задачи (отменяются на shutdown)
+    background: list[asyncio.Task] = [heartbeat_task]
+    if not kb_disable_startup:
+        # KB прогревается фоном: до готовности хендлеры работают по raw_text/symbol_entries из БД
+        background.append(asyncio.create_task(_warm_kb(db, settings)))
+    if activity is not None:
+        background.append(asyncio.create_task(activity.run(flush_every)))
+    if isinstance(application.persistence, SqlitePersistence):
+        background.append(asyncio.create_task(application.persistence.run_eviction(application)))
+    telemetry = application.bot_data.get("symbol_telemetry")
+    if telemetry is not None:
+        background.append(asyncio.create_task(
+            telemetry.run(float(getattr(settings, "symbol_telemetry_flush_seconds", 30.0)))
+        ))
+    alerts = application.bot_data.get("alerts")
+    if alerts is not None:
+        background.append(asyncio.create_task(alerts.run(application.bot, settings.admin_ids)))
+    background.append(asyncio.create_task(scheduler.run()))
+    reminder_every = float(getattr(settings, "reminder_interval_seconds", 0.0))
+    if reminder_every > 0:
+        from app.push.reminders import DEFAULT_TEXT, DormantReminder
+        reminders = DormantReminder(
+            scheduler.repo,
+            scheduler.engine,
+            text=getattr(settings, "reminder_text", "") or DEFAULT_TEXT,
+            dormant_days=getattr(settings, "reminder_dormant_days", 7.0),
+        )
+        background.append(asyncio.create_task(reminders.run(reminder_every)))
+    scheduler.resume_broadcasts()
 
     try:
         while True:
             await asyncio.sleep(3600)
     finally:
         # аккуратный shutdown (чтобы не было overlap и конфликтов при рестарте)
+        for task in background:
+            task.cancel()
+        if not use_webhook:
+            try:
+                await application.updater.stop()
+            except Exception:
+                pass
         try:
-            await application.updater.stop()
+            await application.stop()
         except Exception:
             pass
         try:
-            await application.stop()
+            await application.shutdown()
         except Exception:
             pass
+        if activity is not None:
+            try:
+                activity.flush()
+            except Exception:
+                log.exception("Final activity flush failed")
+        if telemetry is not None:
+            try:
+                telemetry.flush()
+            except Exception:
+                log.exception("Final symbol telemetry flush failed")
         try:
-            await application.shutdown()
+            await http_server.stop()
         except Exception:
             pass
 
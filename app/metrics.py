@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# In-process метрики в формате Prometheus (text exposition 0.0.4) без внешних зависимостей.
+# Запись — несколько операций со словарём под общим lock: дёшево на горячем пути
+# (апдейты, запросы к БД), чтение — только при GET /metrics.
+
+# Границы (секунды): от быстрых запросов к SQLite до долгих вызовов LLM
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [count по бакетам (не накопительно)..., +Inf], sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, seconds: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[i] += 1
+            self._sums[key] += seconds
+
+    def time(self, **labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v), self._sums[k]) for k, v in self._counts.items())
+        out = []
+        for key, counts, total in items:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                out.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', _num(bound))])} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, key)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.label_names, key)} {acc}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("_hist", "_labels", "_t0")
+
+    def __init__(self, hist: Histogram, labels: Dict[str, str]):
+        self._hist = hist
+        self._labels = labels
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._t0, **self._labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+UPDATE_WAIT = REGISTRY.histogram(
+    "bot_update_queue_wait_seconds", "Time an update waited for its chat and a worker")
+UPDATE_DURATION = REGISTRY.histogram(
+    "bot_update_duration_seconds", "Update handling time, from dequeue to done")
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Unhandled errors reaching the application error handler", ["error"])
+OPENAI_LATENCY = REGISTRY.histogram(
+    "openai_request_duration_seconds", "OpenAI API call latency", ["op", "status"])
+DB_LATENCY = REGISTRY.histogram(
+    "db_operation_duration_seconds", "SQLite operation latency", ["op"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+BROADCAST_MESSAGES = REGISTRY.counter(
+    "broadcast_messages_total", "Broadcast/push messages by outcome", ["result"])
+BROADCAST_RETRIES = REGISTRY.counter(
+    "broadcast_retries_total", "Broadcast sends retried after a network error")
+BROADCAST_FLOOD_WAITS = REGISTRY.counter(
+    "broadcast_flood_waits_total", "RetryAfter (flood control) responses during broadcasts")
+BROADCAST_RATE = REGISTRY.gauge(
+    "broadcast_last_rate_messages_per_second", "Throughput of the last finished broadcast run")
+LOOP_LAG = REGISTRY.gauge(
+    "event_loop_lag_seconds", "How late the last event-loop heartbeat woke up")
+LOOP_HEARTBEAT = REGISTRY.gauge(
+    "event_loop_last_heartbeat_timestamp_seconds", "Unix time of the last event-loop heartbeat")
+
+
+class Heartbeat:
+    """
+    Пульс event loop: задача просыпается раз в interval и отмечает время.
+    Если loop занят блокирующим кодом, пульс опаздывает (lag) или пропадает (/healthz -> 503).
+    """
+
+    def __init__(self, interval: float = 1.0, stale_after: float = 10.0):
+        self.interval = float(interval)
+        self.stale_after = float(stale_after)
+        self.last_beat: Optional[float] = None
+        self.lag = 0.0
+
+    def beat(self, lag: float = 0.0) -> None:
+        self.last_beat = time.monotonic()
+        self.lag = max(0.0, lag)
+        LOOP_LAG.set(self.lag)
+        LOOP_HEARTBEAT.set(time.time())
+
+    def healthy(self) -> bool:
+        return self.last_beat is not None and time.monotonic() - self.last_beat <= self.stale_after
+
+    async def run(self) -> None:
+        self.beat()
+        while True:
+            t0 = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.beat(time.monotonic() - t0 - self.interval)
@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from app.metrics import BROADCAST_FLOOD_WAITS, BROADCAST_MESSAGES, BROADCAST_RATE, BROADCAST_RETRIES
+
+log = logging.getLogger(__name__)
+
+# Telegram: ~30 сообщений/сек на бота в разные чаты. Держимся чуть ниже потолка.
+DEFAULT_RATE_PER_SECOND = 25.0
+DEFAULT_CONCURRENCY = 16
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BASE_BACKOFF = 1.0
+# Как часто дёргать on_progress (в отправленных сообщениях)
+PROGRESS_EVERY = 500
+# Сколько получателей забирать из deliveries за раз и как часто писать результаты
+DELIVERY_BATCH = 500
+COMPLETE_EVERY = 50
+# Lease на claim пачки; пока пачка отправляется, продлеваем его каждые LEASE/3 секунд
+DELIVERY_LEASE_SECONDS = 300
+# Сетевые сбои после всех повторов возвращаются в очередь: не больше стольких claim-ов
+# на получателя, следующий проход по отложенным — не раньше чем через DELIVERY_RETRY_DELAY
+MAX_DELIVERY_ATTEMPTS = 5
+DELIVERY_RETRY_DELAY = 60.0
+
+
+# BadRequest, после которого писать пользователю бессмысленно (в отличие от ошибок в самом сообщении)
+UNREACHABLE_MARKERS = (
+    "chat not found",
+    "user not found",
+    "user is deactivated",
+    "peer_id_invalid",
+    "bot can't initiate conversation",
+)
+
+
+def is_unreachable(exc: Exception) -> bool:
+    """
+    Постоянная ошибка получателя: бот заблокирован, аккаунт удалён, чат не найден.
+    """
+    if isinstance(exc, Forbidden):
+        return True
+    if isinstance(exc, BadRequest):
+        message = str(exc).lower()
+        return any(m in message for m in UNREACHABLE_MARKERS)
+    return False
+
+
+def _record_rate(done: int, elapsed: float) -> None:
+    if done > 0 and elapsed > 0:
+        BROADCAST_RATE.set(done / elapsed)
+
+
+def _seconds(value) -> float:
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class AsyncTokenBucket:
+    """
+    Глобальный token bucket для исходящих сообщений.
+    pause() останавливает выдачу токенов всем отправителям сразу (RetryAfter от Telegram
+    относится к боту целиком, а не к одному чату).
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float | None = None):
+        self.rate = float(rate_per_second)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate_per_second))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        until = time.monotonic() + max(0.0, seconds)
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+@dataclass
+class BroadcastResult:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    elapsed: float = 0.0
+    failed_user_ids: List[int] = field(default_factory=list)
+    # из них недоступные навсегда (бот заблокирован, чат не найден) — см. is_unreachable
+    unreachable_user_ids: List[int] = field(default_factory=list)
+    # из них временные сбои (сеть после всех повторов) — имеет смысл повторить позже
+    retryable_user_ids: List[int] = field(default_factory=list)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    def summary(self) -> str:
+        rate = self.sent / self.elapsed if self.elapsed > 0 else 0.0
+        return (
+            f"отправлено {self.sent}/{self.total}, ошибок {self.failed} "
+            f"(недоступны {len(self.unreachable_user_ids)}), "
+            f"повторов {self.retries}, flood-пауз {self.rate_limited}, "
+            f"{self.elapsed:.1f}s ({rate:.1f} msg/s)"
+        )
+
+
+ProgressCallback = Callable[[BroadcastResult], Awaitable[None]]
+# (user_id, отправлено, текст ошибки) — после каждого получателя
+OutcomeCallback = Callable[[int, bool, Optional[str]], Awaitable[None]]
+
+
+def format_progress(job_id: int, status: str, progress: dict, rate: float | None = None) -> str:
+    """
+    Текст прогресса рассылки для админа (progress — Repo.delivery_progress).
+    """
+    remaining = progress["pending"] + progress["sending"]
+    lines = [
+        f"Рассылка #{job_id}: {status}",
+        f"Отправлено: {progress['sent']}/{progress['total']}, ошибок: {progress['failed']}, осталось: {remaining}",
+    ]
+    if progress.get("cancelled"):
+        lines.append(f"Отменено: {progress['cancelled']}")
+    if rate:
+        eta = remaining / rate
+        lines.append(f"Скорость: {rate:.1f} msg/s, ETA: {int(eta // 60)} мин {int(eta % 60)} с")
+    return "\n".join(lines)
+
+
+class BroadcastEngine:
+    """
+    Массовая отправка: общий token bucket (лимит Telegram на бота) + ограниченное
+    число одновременных запросов.
+    - RetryAfter: ставим на паузу весь bucket на retry_after и повторяем тому же получателю
+      (не считается попыткой);
+    - сетевые ошибки/таймауты: повтор с экспоненциальной задержкой (до max_retries);
+    - Forbidden/BadRequest: постоянная ошибка, не повторяем; недоступные получатели
+      (is_unreachable) попадают в unreachable_user_ids.
+    """
+
+    def __init__(
+        self,
+        bot,
+        rate_per_second: float = DEFAULT_RATE_PER_SECOND,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_backoff: float = DEFAULT_BASE_BACKOFF,
+    ):
+        self.bot = bot
+        self.bucket = AsyncTokenBucket(rate_per_second)
+        self.concurrency = max(1, int(concurrency))
+        self.max_retries = int(max_retries)
+        self.base_backoff = float(base_backoff)
+
+    async def _send_one(
+        self, uid: int, text: str, result: BroadcastResult, **kwargs
+    ) -> tuple[bool, str | None, bool, bool]:
+        """
+        (отправлено, текст ошибки, получатель недоступен навсегда, временный сбой — можно повторить позже).
+        """
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=uid, text=text, **kwargs)
+                return True, None, False, False
+            except RetryAfter as e:
+                wait = _seconds(e.retry_after)
+                result.rate_limited += 1
+                BROADCAST_FLOOD_WAITS.inc()
+                log.warning("Broadcast: flood control, pausing %.1fs", wait)
+                self.bucket.pause(wait)
+            except (Forbidden, BadRequest) as e:
+                unreachable = is_unreachable(e)
+                log.info("Broadcast: user_id=%s rejected (unreachable=%s): %s", uid, unreachable, e)
+                return False, f"{type(e).__name__}: {e}", unreachable, False
+            except NetworkError as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    log.warning("Broadcast: user_id=%s failed after %s retries: %s", uid, self.max_retries, e)
+                    return False, f"{type(e).__name__}: {e}", False, True
+                result.retries += 1
+                BROADCAST_RETRIES.inc()
+                await asyncio.sleep(self.base_backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+            except Exception as e:
+                log.exception("Broadcast: unexpected error for user_id=%s", uid)
+                return False, f"{type(e).__name__}: {e}", False, False
+
+    async def _run(
+        self,
+        items: List[tuple[int, int]],
+        text: str,
+        result: BroadcastResult,
+        on_outcome: Callable[[int, int, bool, str | None, bool], Awaitable[None]],
+        **kwargs,
+    ) -> None:
+        """
+        items: [(ключ, user_id)]; on_outcome(ключ, user_id, ok, error, retryable) — после каждого получателя.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+
+        async def worker() -> None:
+            while True:
+                try:
+                    key, uid = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                ok, err, unreachable, retryable = await self._send_one(uid, text, result, **kwargs)
+                if ok:
+                    result.sent += 1
+                    BROADCAST_MESSAGES.inc(result="sent")
+                else:
+                    result.failed += 1
+                    result.failed_user_ids.append(uid)
+                    if unreachable:
+                        result.unreachable_user_ids.append(uid)
+                    if retryable:
+                        result.retryable_user_ids.append(uid)
+                    BROADCAST_MESSAGES.inc(result="unreachable" if unreachable else "failed")
+                await on_outcome(key, uid, ok, err, retryable)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, max(1, len(items))))))
+
+    async def send(
+        self,
+        user_ids: Iterable[int],
+        text: str,
+        on_progress: Optional[ProgressCallback] = None,
+        progress_every: int = PROGRESS_EVERY,
+        on_sent: Optional[OutcomeCallback] = None,
+        **kwargs,
+    ) -> BroadcastResult:
+        """
+        Разовая отправка списку (без учёта в БД; on_sent — чтобы вызывающий записал исход сам).
+        """
+        ids = list(user_ids)
+        result = BroadcastResult(total=len(ids))
+        t0 = time.monotonic()
+
+        async def on_outcome(key, uid, ok, err, retryable) -> None:
+            if on_sent is not None:
+                await on_sent(uid, ok, err)
+            if on_progress is not None and result.done % progress_every == 0:
+                result.elapsed = time.monotonic() - t0
+                try:
+                    await on_progress(result)
+                except Exception:
+                    log.exception("Broadcast progress callback failed")
+
+        await self._run([(uid, uid) for uid in ids], text, result, on_outcome, **kwargs)
+        result.elapsed = time.monotonic() - t0
+        _record_rate(result.done, result.elapsed)
+        log.info("Broadcast finished: %s", result.summary())
+        return result
+
+    async def send_deliveries(
+        self,
+        repo,
+        kind: str,
+        job_id: int,
+        text: str,
+        batch_size: int = DELIVERY_BATCH,
+        on_progress: Optional[ProgressCallback] = None,
+        progress_every: int = PROGRESS_EVERY,
+        **kwargs,
+    ) -> BroadcastResult:
+        """
+        Отправка по очереди deliveries: забираем пачку (claim), шлём, результаты пишем
+        в БД небольшими порциями. После рестарта продолжаем с того же места; повторно
+        могут уйти только сообщения, которые были «в полёте» в момент падения.
+        Сетевые сбои возвращаются в pending (см. Repo.complete_deliveries) и
+        забираются следующим проходом через DELIVERY_RETRY_DELAY, пока не кончатся
+        MAX_DELIVERY_ATTEMPTS. Итоговые sent/failed берём из БД.
+        """
+        progress = repo.delivery_progress(kind, job_id)
+        result = BroadcastResult(total=progress["total"], sent=progress["sent"], failed=progress["failed"])
+        already_done = result.done
+        t0 = time.monotonic()
+        done_buf: List[tuple[int, bool, str | None, bool]] = []
+        marked = len(result.unreachable_user_ids)
+
+        def flush_outcomes() -> None:
+            nonlocal marked
+            batch = done_buf[:]
+            done_buf.clear()
+            repo.complete_deliveries(batch, max_attempts=MAX_DELIVERY_ATTEMPTS)
+            unreachable = result.unreachable_user_ids[marked:]
+            if unreachable:
+                repo.mark_users_unreachable(unreachable)
+                marked += len(unreachable)
+
+        async def on_outcome(delivery_id, uid, ok, err, retryable) -> None:
+            nonlocal retried
+            retried = retried or retryable
+            done_buf.append((delivery_id, ok, err, retryable))
+            if len(done_buf) >= COMPLETE_EVERY:
+                flush_outcomes()
+            if on_progress is not None and result.done % progress_every == 0:
+                result.elapsed = time.monotonic() - t0
+                try:
+                    await on_progress(result)
+                except Exception:
+                    log.exception("Broadcast progress callback failed")
+
+        async def renew_claims(delivery_ids: List[int]) -> None:
+            while True:
+                await asyncio.sleep(DELIVERY_LEASE_SECONDS / 3)
+                try:
+                    repo.renew_delivery_claims(delivery_ids)
+                except Exception:
+                    log.exception("Failed to renew delivery claims %s#%s", kind, job_id)
+
+        retried = False
+        after_id = 0
+        while True:
+            claimed = repo.claim_deliveries(
+                kind, job_id, batch_size, lease_seconds=DELIVERY_LEASE_SECONDS, after_id=after_id
+            )
+            if not claimed:
+                if not retried:
+                    break
+                # новый проход: отложенные сетевые сбои (если у них остались попытки)
+                retried = False
+                after_id = 0
+                await asyncio.sleep(DELIVERY_RETRY_DELAY)
+                continue
+            after_id = claimed[-1][0]
+            renew = asyncio.create_task(renew_claims([did for did, _ in claimed]))
+            try:
+                await self._run(claimed, text, result, on_outcome, **kwargs)
+            finally:
+                renew.cancel()
+                if done_buf:
+                    flush_outcomes()
+
+        progress = repo.delivery_progress(kind, job_id)
+        result.sent, result.failed = progress["sent"], progress["failed"]
+        result.elapsed = time.monotonic() - t0
+        _record_rate(result.done - already_done, result.elapsed)
+        log.info("Delivery %s#%s finished: %s", kind, job_id, result.summary())
+        return result
+
+
+def engine_from_settings(bot, settings) -> BroadcastEngine:
+    return BroadcastEngine(
+        bot,
+        rate_per_second=getattr(settings, "broadcast_rate_per_second", DEFAULT_RATE_PER_SECOND),
+        concurrency=getattr(settings, "broadcast_concurrency", DEFAULT_CONCURRENCY),
+    )
@@ -1,41 +1,46 @@
 from __future__ import annotations
-import asyncio
 import logging
 
+from app.push.broadcast import BroadcastResult
+
 log = logging.getLogger(__name__)
 
-def due_pushes_job(repo, scheduler_service):
-    # called from thread; run async via loop
+# on_progress дёргается часто: это дешёвое обновление ссылки на результат, не сообщение
+PROGRESS_EVERY = 10
+
+async def run_delivery_job(
+    repo, engine, kind: str, job_id: int, segment: str, text: str, running: set | None = None, on_progress=None
+) -> BroadcastResult | None:
+    """
+    Рассылка через очередь deliveries (kind: "broadcast" | "push").
+    Новое задание: получатели сегмента фиксируются в deliveries в момент старта;
+    начатое ранее (после рестарта) — продолжается с неотправленных, сегмент не перечитывается.
+    running — задания, которые уже идут в этом процессе (не запускаем второй раз).
+    """
+    key = (kind, job_id)
+    if running is not None:
+        if key in running:
+            return None
+        running.add(key)
     try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-    loop.create_task(_send_due(repo, scheduler_service))
-
-async def _send_due(repo, scheduler_service):
-    from telegram import Bot
-    bot = Bot(scheduler_service.settings.telegram_bot_token)
-
-    due = repo.get_due_pushes()
-    if not due:
-        return
-
-    for push in due:
-        push_id = int(push["id"])
-        segment = push["segment"]
-        text = push["text"]
-        user_ids = repo.list_users_by_segment(segment)
-
-        ok = 0
-        for uid in user_ids:
-            try:
-                await bot.send_message(chat_id=uid, text=text)
-                ok += 1
-                await asyncio.sleep(0.05)
-            except Exception:
-                continue
-
-        repo.mark_push_sent(push_id)
-        log.info("Push %s sent to %s users in segment=%s", push_id, ok, segment)
+        if repo.start_delivery_job(kind, job_id, segment):
+            log.info("Delivery %s#%s started (segment=%s)", kind, job_id, segment)
+        else:
+            log.info("Delivery %s#%s resumed: %s", kind, job_id, repo.delivery_progress(kind, job_id))
+        result = await engine.send_deliveries(
+            repo, kind, job_id, text, on_progress=on_progress, progress_every=PROGRESS_EVERY
+        )
+        repo.finish_delivery_job(kind, job_id)
+        return result
+    finally:
+        if running is not None:
+            running.discard(key)
+
+async def send_push(repo, engine, push_id: int, running: set | None = None) -> BroadcastResult | None:
+    push = repo.get_scheduled_push(push_id)
+    if push is None or push["status"] not in ("pending", "sending"):
+        return None
+    result = await run_delivery_job(repo, engine, "push", push_id, push["segment"], push["text"], running=running)
+    if result is not None:
+        log.info("Push %s segment=%s: %s", push_id, push["segment"], result.summary())
+    return result
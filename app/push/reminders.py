@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from app.push.broadcast import COMPLETE_EVERY
+
+log = logging.getLogger(__name__)
+
+CURSOR_NAME = "dormant_reminders"
+# Аренда прохода (job_leases, имя как у курсора); пока идёт проход, продлеваем каждые LEASE/3
+LEASE_SECONDS = 600
+DEFAULT_TEXT = (
+    "Давно не виделись 🌿 Если что-то тревожит или не отпускает — опиши ситуацию и чувства, "
+    "и вместе посмотрим, какой зверь к тебе придёт. Просто напиши /start."
+)
+
+
+def _sqlite_ts(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+class DormantReminder:
+    """
+    Напоминания пользователям, неактивным dormant_days дней.
+
+    Курсор (last_seen_at, user_id) в job_cursors двигается по индексу users(last_seen_at):
+    каждый запуск читает только тех, кто стал неактивным после прошлого запуска.
+    Написавший боту получает новый last_seen_at (позади курсора) и снова попадёт
+    в обход, когда опять станет неактивным. last_reminded_at >= last_seen_at —
+    за этот период неактивности уже напоминали.
+
+    Отправленные отмечаются по ходу пачки (каждые COMPLETE_EVERY), поэтому после падения
+    повторно уйдут только сообщения «в полёте». Курсор не заходит дальше первого
+    получателя с временной ошибкой: следующий запуск повторит его, а уже
+    напомненных после него пропустит по last_reminded_at.
+
+    Проход идёт под арендой в job_leases: при нескольких репликах напоминания
+    шлёт одна, у остальных run_once в этот тик ничего не делает.
+    """
+
+    def __init__(self, repo, engine, text: str = DEFAULT_TEXT, dormant_days: float = 7.0, batch_size: int = 500):
+        self.repo = repo
+        self.engine = engine
+        self.text = text
+        self.dormant_days = float(dormant_days)
+        self.batch_size = int(batch_size)
+        self.sent = 0
+
+    async def run_once(self) -> int:
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        if not self.repo.try_acquire_job_lease(CURSOR_NAME, owner, LEASE_SECONDS):
+            log.debug("Dormant reminders are running in another process, skipping")
+            return 0
+        renew = asyncio.create_task(self._renew_lease(owner))
+        try:
+            return await self._run_locked()
+        finally:
+            renew.cancel()
+            self.repo.release_job_lease(CURSOR_NAME, owner)
+
+    async def _renew_lease(self, owner: str) -> None:
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            if not self.repo.try_acquire_job_lease(CURSOR_NAME, owner, LEASE_SECONDS):
+                log.warning("Dormant reminders lease was taken over by another process")
+
+    async def _run_locked(self) -> int:
+        window = self.dormant_days * 86400
+        now = time.time()
+        before = _sqlite_ts(now - window)
+        # первый запуск: не напоминаем тем, кто пропал задолго до включения функции
+        cursor = self.repo.get_job_cursor(CURSOR_NAME) or (_sqlite_ts(now - 2 * window), 0)
+
+        marked: list[int] = []  # отправлено, но ещё не записано в users.last_reminded_at
+        total = 0
+
+        def flush_marked(new_cursor: tuple[str, int] | None = None) -> None:
+            nonlocal total
+            total += len(marked)
+            self.repo.save_reminder_progress(CURSOR_NAME, marked[:], new_cursor)
+            marked.clear()
+
+        async def on_sent(uid: int, ok: bool, err: str | None) -> None:
+            if ok:
+                marked.append(uid)
+                if len(marked) >= COMPLETE_EVERY:
+                    flush_marked()
+
+        while True:
+            rows = self.repo.list_dormant_after(cursor, before, self.batch_size)
+            if not rows:
+                break
+            due = [
+                int(r["user_id"]) for r in rows
+                if int(r["reachable"]) == 1
+                and (r["last_reminded_at"] is None or r["last_reminded_at"] < r["last_seen_at"])
+            ]
+            retry: set[int] = set()
+            if due:
+                try:
+                    result = await self.engine.send(due, self.text, on_sent=on_sent)
+                except BaseException:
+                    # курсор не двигаем: следующий запуск пропустит отмеченных по last_reminded_at
+                    flush_marked()
+                    raise
+                self.repo.mark_users_unreachable(result.unreachable_user_ids)
+                retry = set(result.retryable_user_ids)
+
+            # курсор — только до первого получателя с временной ошибкой (его повторим)
+            done_rows = rows
+            for i, r in enumerate(rows):
+                if int(r["user_id"]) in retry:
+                    done_rows = rows[:i]
+                    break
+            if done_rows:
+                cursor = (done_rows[-1]["last_seen_at"], int(done_rows[-1]["user_id"]))
+            flush_marked(cursor if done_rows else None)
+            if retry or len(rows) < self.batch_size:
+                break
+
+        self.sent += total
+        if total:
+            log.info("Dormant reminders sent: %s", total)
+        return total
+
+    async def run(self, interval_seconds: float) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                log.exception("Dormant reminders failed (will retry)")
+            await asyncio.sleep(interval_seconds)
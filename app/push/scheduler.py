@@ -1,47 +1,269 @@
 from __future__ import annotations
 import asyncio
+import heapq
 import logging
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from app.storage.db import Database
 from app.storage.repo import Repo
-from app.push.jobs import due_pushes_job
+from app.push.jobs import run_delivery_job, send_push
+from app.push.broadcast import BroadcastEngine, BroadcastResult, engine_from_settings, format_progress
 
 log = logging.getLogger(__name__)
 
+# Дольше не спим даже при далёком run_at (страховка от перевода системных часов)
+MAX_SLEEP_SECONDS = 3600.0
+
+
+def parse_run_at(value: str) -> datetime:
+    """
+    run_at хранится строкой "YYYY-MM-DD HH:MM[:SS]" и сравнивается с datetime('now') (UTC).
+    """
+    return datetime.fromisoformat(value.strip().replace("T", " "))
+
+
+def scheduler_zone(settings) -> ZoneInfo:
+    """
+    Часовой пояс, в котором админ вводит время пуша (SCHEDULER_TZ); неизвестный — UTC.
+    """
+    name = getattr(settings, "scheduler_tz", "") or "UTC"
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        log.warning("Unknown SCHEDULER_TZ=%r, using UTC", name)
+        return ZoneInfo("UTC")
+
+
+def local_to_utc(value: str, tz: ZoneInfo) -> datetime:
+    """
+    "YYYY-MM-DD HH:MM" во времени tz -> naive UTC (как хранится run_at).
+    """
+    return parse_run_at(value).replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class BroadcastJob:
+    """
+    Рассылка, идущая фоновой задачей в этом процессе.
+    """
+    broadcast_id: int
+    task: asyncio.Task | None = None
+    started: float = field(default_factory=time.monotonic)
+    done_at_start: int = 0
+    result: BroadcastResult | None = None
+    # сообщение админу, которое редактируем с прогрессом: (chat_id, message_id)
+    progress_message: tuple[int, int] | None = None
+
+    def rate(self) -> float | None:
+        if self.result is None:
+            return None
+        elapsed = time.monotonic() - self.started
+        done = self.result.done - self.done_at_start
+        return done / elapsed if elapsed > 0 and done > 0 else None
+
+
 class SchedulerService:
+    """
+    Отложенные пуши на event loop бота: min-heap (run_at, push_id), сон ровно до
+    ближайшего run_at. Очередь загружается из БД при старте и пополняется через
+    schedule_push — опроса БД по таймеру нет.
+    """
+
     def __init__(self, db: Database, settings):
         self.db = db
         self.repo = Repo(db)
         self.settings = settings
-        self.scheduler = BackgroundScheduler(timezone=settings.scheduler_tz)
-        self.telegram_app = None  # injected later by send methods
-
-    def start(self) -> None:
-        self.scheduler.add_job(
-            lambda: due_pushes_job(self.repo, self),
-            trigger=IntervalTrigger(seconds=30),
-            id="due_pushes",
-            replace_existing=True,
+        self.telegram_app = None  # injected by build_application
+        self._engine: BroadcastEngine | None = None
+        # (kind, job_id) рассылок, которые сейчас идут в этом процессе
+        self.running: set[tuple[str, int]] = set()
+        self._heap: list[tuple[datetime, int]] = []
+        self._wakeup = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+        self.broadcasts: dict[int, BroadcastJob] = {}
+
+    @property
+    def engine(self) -> BroadcastEngine:
+        """
+        Один engine на процесс поверх bot из Application: общий пул HTTP-соединений
+        и общий token bucket для рассылок и пушей (лимит Telegram — на бота).
+        """
+        if self._engine is None:
+            if self.telegram_app is None:
+                raise RuntimeError("SchedulerService: telegram application is not attached")
+            self._engine = engine_from_settings(self.telegram_app.bot, self.settings)
+        return self._engine
+
+    def _push(self, push_id: int, run_at: str) -> None:
+        try:
+            when = parse_run_at(run_at)
+        except ValueError:
+            log.warning("Push %s has invalid run_at=%r, skipped", push_id, run_at)
+            return
+        heapq.heappush(self._heap, (when, push_id))
+        self._wakeup.set()
+
+    def load_pending(self) -> int:
+        self._heap.clear()
+        for push_id, run_at in self.repo.list_pending_pushes():
+            self._push(push_id, run_at)
+        return len(self._heap)
+
+    def schedule_push(self, admin_id: int, segment: str, text: str, run_at: str) -> int:
+        """
+        Создаёт пуш и ставит его в очередь. run_at — время в SCHEDULER_TZ (в БД — UTC).
+        ValueError — run_at не разобран.
+        """
+        run_at = local_to_utc(run_at, scheduler_zone(self.settings)).strftime("%Y-%m-%d %H:%M:%S")
+        push_id = self.repo.create_scheduled_push(admin_id=admin_id, segment=segment, text=text, run_at_iso=run_at)
+        self._push(push_id, run_at)
+        return push_id
+
+    def _fire(self, push_id: int) -> None:
+        async def fire() -> None:
+            try:
+                await send_push(self.repo, self.engine, push_id, running=self.running)
+            except Exception:
+                log.exception("Push %s failed", push_id)
+
+        task = asyncio.create_task(fire())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self) -> None:
+        log.info("Scheduler started (%s pending pushes)", self.load_pending())
+        try:
+            while True:
+                self._wakeup.clear()
+                now = _utcnow()
+                while self._heap and self._heap[0][0] <= now:
+                    _, push_id = heapq.heappop(self._heap)
+                    self._fire(push_id)
+                timeout = None
+                if self._heap:
+                    timeout = min((self._heap[0][0] - now).total_seconds(), MAX_SLEEP_SECONDS)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            for job in self.broadcasts.values():
+                if job.task is not None:
+                    job.task.cancel()
+
+    async def send_broadcast_now(self, broadcast_id: int, segment: str, text: str, on_progress=None):
+        result = await run_delivery_job(
+            self.repo, self.engine, "broadcast", broadcast_id, segment, text,
+            running=self.running, on_progress=on_progress,
         )
-        self.scheduler.start()
-        log.info("Scheduler started")
-
-    async def send_broadcast_now(self, broadcast_id: int, segment: str, text: str):
-        # Needs telegram bot instance; we fetch it lazily from running application
-        # The PTB Application is global in app.main; simplest: use Bot token directly here
-        # but for template keep it minimal: use raw HTTP via telegram bot api
-        from telegram import Bot
-        bot = Bot(self.settings.telegram_bot_token)
-
-        user_ids = self.repo.list_users_by_segment(segment)
-        sent = 0
-        for uid in user_ids:
+        if result is None:
+            return 0
+        log.info("Broadcast %s segment=%s: %s", broadcast_id, segment, result.summary())
+        return result.sent
+
+    def start_broadcast(
+        self, broadcast_id: int, segment: str, text: str, progress_message: tuple[int, int] | None = None
+    ) -> BroadcastJob:
+        """
+        Запускает рассылку фоновой задачей (хендлер админа не ждёт её окончания).
+        progress_message — (chat_id, message_id), которое периодически редактируется.
+        """
+        job = self.broadcasts.get(broadcast_id)
+        if job is not None and job.task is not None and not job.task.done():
+            return job
+        job = BroadcastJob(broadcast_id, progress_message=progress_message)
+        progress = self._progress(broadcast_id)
+        job.done_at_start = progress["sent"] + progress["failed"]
+
+        async def on_progress(result: BroadcastResult) -> None:
+            job.result = result
+
+        async def run() -> None:
+            reporter = asyncio.create_task(self._report_progress(job))
             try:
-                await bot.send_message(chat_id=uid, text=text)
-                sent += 1
-                await asyncio.sleep(0.05)
+                await self.send_broadcast_now(broadcast_id, segment, text, on_progress=on_progress)
+            except asyncio.CancelledError:
+                pass
             except Exception:
+                log.exception("Broadcast %s failed", broadcast_id)
+            finally:
+                reporter.cancel()
+                await self._edit_progress(job)
+
+        job.task = asyncio.create_task(run())
+        self.broadcasts[broadcast_id] = job
+        return job
+
+    def _progress(self, broadcast_id: int) -> dict:
+        return self.repo.delivery_progress("broadcast", broadcast_id)
+
+    def broadcast_status_text(self, broadcast_id: int | None = None) -> str | None:
+        row = self.repo.get_broadcast(broadcast_id)
+        if row is None:
+            return None
+        bid = int(row["id"])
+        job = self.broadcasts.get(bid)
+        rate = job.rate() if job is not None and job.task is not None and not job.task.done() else None
+        return format_progress(bid, row["status"], self._progress(bid), rate)
+
+    async def _edit_progress(self, job: BroadcastJob) -> None:
+        if job.progress_message is None or self.telegram_app is None:
+            return
+        text = self.broadcast_status_text(job.broadcast_id)
+        if not text:
+            return
+        chat_id, message_id = job.progress_message
+        try:
+            await self.telegram_app.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            # "message is not modified" и т.п. — прогресс не критичен
+            log.debug("Broadcast %s progress edit failed: %s", job.broadcast_id, e)
+
+    async def _report_progress(self, job: BroadcastJob) -> None:
+        interval = float(getattr(self.settings, "broadcast_progress_seconds", 5.0))
+        while True:
+            await asyncio.sleep(interval)
+            await self._edit_progress(job)
+
+    async def cancel_broadcast(self, broadcast_id: int | None = None) -> list[int]:
+        """
+        Отменяет рассылку broadcast_id, а без id — все идущие.
+        Возвращает id реально остановленных (пусто — отменять нечего).
+        """
+        if broadcast_id is not None:
+            ids = [int(broadcast_id)]
+        else:
+            ids = sorted(
+                {int(r["id"]) for r in self.repo.list_unfinished_jobs("broadcast")}
+                | {bid for bid, job in self.broadcasts.items() if job.task is not None and not job.task.done()}
+            )
+        stopped = []
+        for bid in ids:
+            if not self.repo.cancel_delivery_job("broadcast", bid):
                 continue
-        return sent
+            job = self.broadcasts.get(bid)
+            if job is not None and job.task is not None and not job.task.done():
+                job.task.cancel()
+                try:
+                    await job.task
+                except asyncio.CancelledError:
+                    pass
+            stopped.append(bid)
+        return stopped
+
+    def resume_broadcasts(self) -> None:
+        """
+        Досылает рассылки, прерванные рестартом (status='sending').
+        Пуши в том же состоянии попадают в очередь через load_pending.
+        """
+        for row in self.repo.list_unfinished_jobs("broadcast"):
+            self.start_broadcast(int(row["id"]), row["segment"], row["text"])
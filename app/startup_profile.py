@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import importlib.abc
+import importlib.machinery
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# STARTUP_PROFILE=1 — время импорта по модулям и стадий старта в лог.
+# Флаг читается из окружения процесса (до .env): профилировать надо и сам импорт config.
+ENV_FLAG = "STARTUP_PROFILE"
+# Сколько самых медленных модулей показывать в отчёте
+TOP_MODULES = 25
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, profiler: "StartupProfiler", loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__)
+
+    def __getattr__(self, name):
+        # get_resource_reader, is_package и т.п. — как у исходного загрузчика
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, profiler: "StartupProfiler"):
+        self._profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(self._profiler, spec.loader)
+            return spec
+        return None
+
+
+class StartupProfiler:
+    """
+    Время импорта модулей (как python -X importtime, но в лог приложения) и стадий
+    инициализации. self — время модуля без вложенных импортов, cumulative — с ними.
+    """
+
+    def __init__(self):
+        self.modules: Dict[str, Tuple[float, float]] = {}
+        self.phases: List[Tuple[str, float]] = []
+        self._stack: List[Tuple[str, float, float]] = []
+        self._finder: Optional[_TimingFinder] = None
+        self.started = time.perf_counter()
+
+    # --- импорты ---
+    def install(self) -> None:
+        if self._finder is None:
+            self._finder = _TimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self) -> None:
+        if self._finder is not None and self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        self._finder = None
+
+    def _enter(self, name: str) -> None:
+        self._stack.append((name, time.perf_counter(), 0.0))
+
+    def _exit(self, name: str) -> None:
+        name, t0, children = self._stack.pop()
+        total = time.perf_counter() - t0
+        self.modules[name] = (total - children, total)
+        if self._stack:
+            parent, pt0, pchildren = self._stack[-1]
+            self._stack[-1] = (parent, pt0, pchildren + total)
+
+    # --- стадии ---
+    def record_phase(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    def report(self, top: int = TOP_MODULES) -> str:
+        lines = [f"Startup profile: {(time.perf_counter() - self.started) * 1000:.0f} ms since profiler start"]
+        if self.phases:
+            lines.append("phases (ms):")
+            lines.extend(f"  {name:<24} {sec * 1000:8.1f}" for name, sec in self.phases)
+        if self.modules:
+            lines.append(f"imports, top {top} by cumulative (self / cumulative, ms):")
+            ranked = sorted(self.modules.items(), key=lambda kv: kv[1][1], reverse=True)[:top]
+            lines.extend(f"  {name:<48} {own * 1000:8.1f} {total * 1000:8.1f}" for name, (own, total) in ranked)
+        return "\n".join(lines)
+
+
+_profiler: Optional[StartupProfiler] = None
+
+
+def _enabled() -> bool:
+    return os.getenv(ENV_FLAG, "").strip().lower() in ("1", "true", "yes", "y", "on")
+
+
+def start() -> Optional[StartupProfiler]:
+    """
+    Включает профилирование, если задан STARTUP_PROFILE. Вызывать до тяжёлых импортов.
+    """
+    global _profiler
+    if _profiler is None and _enabled():
+        _profiler = StartupProfiler()
+        _profiler.install()
+    return _profiler
+
+
+def get_profiler() -> Optional[StartupProfiler]:
+    return _profiler
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Время стадии старта в лог (всегда) и в профиль (если включён).
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        log.info("Startup phase %s: %.0f ms", name, elapsed * 1000)
+        if _profiler is not None:
+            _profiler.record_phase(name, elapsed)
+
+
+def finish() -> None:
+    """
+    Пишет отчёт и снимает хук импорта (дальнейшие ленивые импорты не замедляем).
+    """
+    global _profiler
+    if _profiler is None:
+        return
+    _profiler.uninstall()
+    log.info("%s", _profiler.report())
+    _profiler = None
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from app.storage.db import Database
+
+log = logging.getLogger(__name__)
+
+# Значения по умолчанию для пользователя, которого ещё нет в БД (как в схеме users)
+_USER_DEFAULTS = {
+    "username": None,
+    "first_name": None,
+    "created_at": None,
+    "last_seen_at": None,
+    "is_active_subscription": 0,
+    "free_messages_used": 0,
+}
+
+
+def _sqlite_ts(ts: float) -> str:
+    # тот же формат, что у datetime('now'): сравнения last_seen_at в SQL не ломаются
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+@dataclass
+class _Pending:
+    seen_ts: float
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+
+
+class ActivityBuffer:
+    """
+    Write-behind буфер активности пользователей.
+
+    touch_user раньше писал (и коммитил) строку users на каждое сообщение.
+    Теперь в памяти копится последнее время активности и профиль по каждому
+    пользователю, а flush() пишет всё одной транзакцией (раз в
+    ACTIVITY_FLUSH_SECONDS и на shutdown).
+
+    Счётчик демо-сообщений здесь не буферизуется: его единственный источник —
+    атомарный Repo.consume_free_message.
+    Чтение «сквозное»: Repo.get_user накладывает несброшенный профиль на строку из БД.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._pending: Dict[int, _Pending] = {}
+        self._lock = threading.Lock()
+        self.flushes = 0
+        self.flushed_users = 0
+
+    # --- запись ---
+    def touch(self, user_id: int, username: str | None, first_name: str | None) -> None:
+        with self._lock:
+            self._pending[user_id] = _Pending(seen_ts=time.time(), username=username, first_name=first_name)
+
+    # --- чтение ---
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def overlay(self, user_id: int, row) -> dict | None:
+        """
+        Строка users (или None) + несброшенные изменения этого пользователя.
+        """
+        with self._lock:
+            p = self._pending.get(user_id)
+            if p is None:
+                return dict(row) if row is not None else None
+            user = dict(row) if row is not None else {"user_id": user_id, **_USER_DEFAULTS}
+            user["last_seen_at"] = _sqlite_ts(p.seen_ts)
+            user["username"] = p.username
+            user["first_name"] = p.first_name
+            return user
+
+    # --- сброс ---
+    def flush(self) -> int:
+        """
+        Пишет накопленное одной транзакцией. Возвращает число пользователей.
+        При ошибке изменения возвращаются в буфер (сольются с новыми).
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        upserts = [
+            (user_id, p.username, p.first_name, _sqlite_ts(p.seen_ts)) for user_id, p in batch.items()
+        ]
+        try:
+            with self.db.transaction() as conn:
+                # upsert: строки users может ещё не быть (первое сообщение пользователя);
+                # написал после неудачной рассылки — снова доступен
+                conn.executemany("""
+                INSERT INTO users (user_id, username, first_name, last_seen_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                  username=excluded.username,
+                  first_name=excluded.first_name,
+                  last_seen_at=excluded.last_seen_at,
+                  reachable=CASE WHEN unreachable_at <= excluded.last_seen_at THEN 1 ELSE reachable END,
+                  unreachable_at=CASE WHEN unreachable_at <= excluded.last_seen_at THEN NULL ELSE unreachable_at END;
+                """, upserts)
+        except Exception:
+            self._restore(batch)
+            raise
+
+        self.flushes += 1
+        self.flushed_users += len(batch)
+        return len(batch)
+
+    def _restore(self, batch: Dict[int, _Pending]) -> None:
+        with self._lock:
+            for user_id, old in batch.items():
+                # новее то, что пришло после неудачного flush
+                self._pending.setdefault(user_id, old)
+
+    async def run(self, interval_seconds: float) -> None:
+        """
+        Фоновый цикл сброса. Отменяется на shutdown (после этого вызвать flush()).
+        """
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                n = self.flush()
+                if n:
+                    log.debug("Activity flushed: users=%s", n)
+            except Exception:
+                log.exception("Activity flush failed (will retry)")
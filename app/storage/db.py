@@ -1,7 +1,12 @@
 from __future__ import annotations
 import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator
 from urllib.parse import urlparse
 
+from app.metrics import DB_LATENCY
+
 class Database:
     def __init__(self, database_url: str):
         self.database_url = database_url
@@ -26,15 +31,39 @@ class Database:
         return self._conn
 
     def execute(self, sql: str, params: tuple = ()):
-        cur = self._conn.execute(sql, params)
-        self._conn.commit()
-        return cur
+        t0 = time.perf_counter()
+        try:
+            cur = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cur
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - t0, op="execute")
 
     def executemany(self, sql: str, seq_of_params):
-        cur = self._conn.executemany(sql, seq_of_params)
-        self._conn.commit()
-        return cur
+        t0 = time.perf_counter()
+        try:
+            cur = self._conn.executemany(sql, seq_of_params)
+            self._conn.commit()
+            return cur
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - t0, op="executemany")
 
     def query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
-        cur = self._conn.execute(sql, params)
-        return cur.fetchall()
+        t0 = time.perf_counter()
+        try:
+            cur = self._conn.execute(sql, params)
+            return cur.fetchall()
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - t0, op="query")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Несколько statement'ов одним коммитом (или rollback при исключении).
+        """
+        t0 = time.perf_counter()
+        try:
+            with self._conn:
+                yield self._conn
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - t0, op="transaction")
@@ -1,38 +1,115 @@
 from __future__ import annotations
 
 import json
+import logging
 import math
-from typing import Optional
+import time
+from typing import Callable, Optional
 from app.storage.db import Database
+from app.storage.activity import ActivityBuffer
+from app.knowledge.symbolism import SYMBOLISM_COLLECTION, SymbolismIndex
+from app.knowledge.vector_store import DEFAULT_COLLECTION, EmbeddingStore, get_embedding_store
+
+log = logging.getLogger(__name__)
+
+# Подписчики на смену подписки (кэш доступа в app.billing.entitlements)
+_subscription_listeners: list[Callable[[int, bool], None]] = []
+
+
+def on_subscription_change(fn: Callable[[int, bool], None]) -> None:
+    _subscription_listeners.append(fn)
+
+
+# Задания доставки: вид -> (таблица, статус «готово»)
+DELIVERY_JOBS = {
+    "broadcast": ("broadcasts", "done"),
+    "push": ("scheduled_pushes", "sent"),
+}
+
+
+# Коллекции, которые kb_search не трогает, пока их не запросили явно
+EXACT_LOOKUP_COLLECTIONS = (SYMBOLISM_COLLECTION,)
+
+
+def encode_tags(tags) -> str:
+    tags = [t.strip() for t in (tags or []) if t and t.strip()]
+    return f",{','.join(tags)}," if tags else ""
+
+
+def decode_tags(raw: str | None) -> list[str]:
+    return [t for t in (raw or "").split(",") if t]
 
 
 class Repo:
-    def __init__(self, db: Database):
+    def __init__(
+        self,
+        db: Database,
+        vectors: EmbeddingStore | None = None,
+        activity: ActivityBuffer | None = None,
+    ):
         self.db = db
+        self.vectors = vectors or get_embedding_store()
+        # если задан — last_seen/профиль пишутся пачками (write-behind)
+        self.activity = activity
 
     # --- users ---
     def upsert_user(self, user_id: int, username: str | None, first_name: str | None) -> None:
+        if self.activity is not None:
+            self.activity.touch(user_id, username, first_name)
+            return
         self.db.execute("""
         INSERT INTO users (user_id, username, first_name)
         VALUES (?, ?, ?)
         ON CONFLICT(user_id) DO UPDATE SET
           username=excluded.username,
           first_name=excluded.first_name,
-          last_seen_at=datetime('now');
+          last_seen_at=datetime('now'),
+          reachable=1,
+          unreachable_at=NULL;
         """, (user_id, username, first_name))
 
     def get_user(self, user_id: int):
         rows = self.db.query("SELECT * FROM users WHERE user_id=?", (user_id,))
-        return rows[0] if rows else None
-
-    def inc_free_used(self, user_id: int) -> None:
-        self.db.execute(
-            "UPDATE users SET free_messages_used=free_messages_used+1, last_seen_at=datetime('now') WHERE user_id=?",
-            (user_id,),
-        )
+        row = rows[0] if rows else None
+        if self.activity is not None:
+            return self.activity.overlay(user_id, row)
+        return row
 
     def set_subscription(self, user_id: int, is_active: bool) -> None:
         self.db.execute("UPDATE users SET is_active_subscription=? WHERE user_id=?", (1 if is_active else 0, user_id))
+        for fn in list(_subscription_listeners):
+            try:
+                fn(user_id, is_active)
+            except Exception:
+                log.exception("Subscription listener failed")
+
+    def get_entitlement(self, user_id: int) -> tuple[bool, int] | None:
+        """
+        (подписка активна, использовано демо-сообщений) или None, если пользователя нет.
+        """
+        rows = self.db.query(
+            "SELECT is_active_subscription, free_messages_used FROM users WHERE user_id=?", (user_id,)
+        )
+        if not rows:
+            return None
+        return int(rows[0]["is_active_subscription"] or 0) == 1, int(rows[0]["free_messages_used"] or 0)
+
+    def consume_free_message(self, user_id: int, limit: int) -> int | None:
+        """
+        Атомарно списывает одно демо-сообщение, если лимит не исчерпан (один statement,
+        без гонки «прочитал — проверил — записал»). Возвращает новый счётчик или None.
+        Пользователя, которого ещё нет в таблице, создаёт.
+        """
+        if limit <= 0:
+            return None
+        with self.db.transaction() as conn:
+            rows = conn.execute("""
+            INSERT INTO users (user_id, free_messages_used) VALUES (?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET free_messages_used=free_messages_used+1
+            WHERE is_active_subscription=0 AND free_messages_used < ?
+            RETURNING free_messages_used;
+            """, (user_id, limit)).fetchall()
+        return int(rows[0]["free_messages_used"]) if rows else None
 
     # --- messages ---
     def add_message(self, user_id: int, role: str, content: str) -> None:
@@ -44,28 +121,173 @@ class Repo:
             (user_id, limit),
         )[::-1]
 
+    def get_messages_after(self, user_id: int, after_id: int = 0):
+        return self.db.query(
+            "SELECT id, role, content FROM messages WHERE user_id=? AND id>? ORDER BY id",
+            (user_id, after_id),
+        )
+
     def clear_messages(self, user_id: int) -> None:
-        self.db.execute("DELETE FROM messages WHERE user_id=?", (user_id,))
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE user_id=?", (user_id,))
+            conn.execute("DELETE FROM conversation_summaries WHERE user_id=?", (user_id,))
+
+    def get_conversation_summary(self, user_id: int) -> tuple[str, int] | None:
+        rows = self.db.query(
+            "SELECT summary, upto_message_id FROM conversation_summaries WHERE user_id=?", (user_id,)
+        )
+        return (rows[0]["summary"], int(rows[0]["upto_message_id"])) if rows else None
+
+    def save_conversation_summary(self, user_id: int, summary: str, upto_message_id: int) -> None:
+        self.db.execute("""
+        INSERT INTO conversation_summaries (user_id, summary, upto_message_id) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+          summary=excluded.summary,
+          upto_message_id=excluded.upto_message_id,
+          updated_at=datetime('now');
+        """, (user_id, summary, upto_message_id))
+
+    # --- symbol lookup telemetry ---
+    def record_symbol_lookups(self, rows: list[tuple[int | None, str, str | None, str | None, str]]) -> None:
+        """
+        rows: (user_id, requested_key, matched_key|None, rule|None, ts 'YYYY-MM-DD HH:MM:SS').
+        Сырые записи + агрегаты одной транзакцией; агрегаты по пачке сводим заранее.
+        """
+        if not rows:
+            return
+        agg: dict[str, list] = {}
+        for _, key, matched, rule, ts in rows:
+            a = agg.setdefault(key, [0, 0, None, None, ts])
+            if matched is not None:
+                a[0] += 1
+                a[2], a[3] = matched, rule
+            else:
+                a[1] += 1
+            a[4] = max(a[4], ts)
+        hits = sum(a[0] for a in agg.values())
+
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO symbol_lookups (user_id, requested, matched_key, rule, hit, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(uid, key, matched, rule, 1 if matched is not None else 0, ts) for uid, key, matched, rule, ts in rows],
+            )
+            conn.executemany("""
+            INSERT INTO symbol_lookup_stats (requested_key, hits, misses, matched_key, last_rule, last_seen_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(requested_key) DO UPDATE SET
+              hits=hits+excluded.hits,
+              misses=misses+excluded.misses,
+              matched_key=COALESCE(excluded.matched_key, matched_key),
+              last_rule=COALESCE(excluded.last_rule, last_rule),
+              last_seen_at=MAX(COALESCE(last_seen_at, ''), excluded.last_seen_at);
+            """, [(key, a[0], a[1], a[2], a[3], a[4]) for key, a in agg.items()])
+            conn.execute(
+                "UPDATE symbol_lookup_totals SET hits=hits+?, misses=misses+? WHERE id=1",
+                (hits, len(rows) - hits),
+            )
+
+    def prune_symbol_lookups(self, keep_days: int) -> None:
+        # агрегаты не трогаем — чистим только сырую историю
+        self.db.execute(
+            "DELETE FROM symbol_lookups WHERE created_at < datetime('now', ?)", (f"-{int(keep_days)} day",)
+        )
+
+    def get_symbol_lookup_stats(self, top: int = 10, recent: int = 10) -> dict:
+        totals = self.db.query("SELECT hits, misses FROM symbol_lookup_totals WHERE id=1")
+        hits, misses = (int(totals[0]["hits"]), int(totals[0]["misses"])) if totals else (0, 0)
+        top_missing = self.db.query(
+            "SELECT requested_key, misses, hits, last_seen_at FROM symbol_lookup_stats "
+            "WHERE misses > 0 ORDER BY misses DESC LIMIT ?",
+            (top,),
+        )
+        recent_rows = self.db.query(
+            "SELECT requested, matched_key, rule, hit, created_at FROM symbol_lookups ORDER BY id DESC LIMIT ?",
+            (recent,),
+        )
+        return {
+            "hits": hits,
+            "misses": misses,
+            "top_missing": [dict(r) for r in top_missing],
+            "recent": [dict(r) for r in recent_rows],
+        }
+
+    # --- PTB persistence ---
+    def get_persistence_entry(self, kind: str, key: int) -> bytes | None:
+        rows = self.db.query("SELECT data FROM persistence_data WHERE kind=? AND key=?", (kind, key))
+        return bytes(rows[0]["data"]) if rows else None
+
+    def save_persistence_entries(self, kind: str, entries: dict[int, bytes | None]) -> None:
+        """
+        Пачка изменений одной транзакцией; None — удалить запись.
+        """
+        upserts = [(kind, key, blob) for key, blob in entries.items() if blob is not None]
+        deletes = [(kind, key) for key, blob in entries.items() if blob is None]
+        with self.db.transaction() as conn:
+            if upserts:
+                conn.executemany("""
+                INSERT INTO persistence_data (kind, key, data) VALUES (?, ?, ?)
+                ON CONFLICT(kind, key) DO UPDATE SET data=excluded.data, updated_at=datetime('now');
+                """, upserts)
+            if deletes:
+                conn.executemany("DELETE FROM persistence_data WHERE kind=? AND key=?", deletes)
 
     # --- kb ---
-    def upsert_document(self, source_key: str, title: str, raw_text: str) -> int:
+    def upsert_document(
+        self,
+        source_key: str,
+        title: str,
+        raw_text: str,
+        collection: str = DEFAULT_COLLECTION,
+        tags: list[str] | None = None,
+    ) -> int:
         self.db.execute("""
-        INSERT INTO kb_documents (source_key, title, raw_text)
-        VALUES (?, ?, ?)
+        INSERT INTO kb_documents (source_key, title, raw_text, collection, tags)
+        VALUES (?, ?, ?, ?, ?)
         ON CONFLICT(source_key) DO UPDATE SET
           title=excluded.title,
           raw_text=excluded.raw_text,
+          collection=excluded.collection,
+          tags=excluded.tags,
           updated_at=datetime('now');
-        """, (source_key, title, raw_text))
+        """, (source_key, title, raw_text, collection, encode_tags(tags)))
         doc = self.db.query("SELECT id FROM kb_documents WHERE source_key=?", (source_key,))[0]
         return int(doc["id"])
 
+    def update_document_metadata(self, source_key: str, collection: str, tags: list[str] | None = None) -> bool:
+        """
+        Обновляет коллекцию/теги уже загруженного документа и его чанков (raw_text не трогаем).
+        True — если что-то поменялось (тогда нужна перевыгрузка EmbeddingStore).
+        """
+        encoded = encode_tags(tags)
+        with self.db.transaction() as conn:
+            cur = conn.execute(
+                """
+                UPDATE kb_documents SET collection=?, tags=?, updated_at=datetime('now')
+                WHERE source_key=? AND (collection IS NOT ? OR tags IS NOT ?)
+                """,
+                (collection, encoded, source_key, collection, encoded),
+            )
+            if cur.rowcount == 0:
+                return False
+            conn.execute(
+                """
+                UPDATE kb_chunks SET collection=?, tags=?
+                WHERE doc_id=(SELECT id FROM kb_documents WHERE source_key=?)
+                """,
+                (collection, encoded, source_key),
+            )
+        return True
+
     def replace_chunks(self, doc_id: int, chunks: list[tuple[int, str, list[float]]]) -> None:
-        # chunks: (chunk_index, content, embedding)
+        # chunks: (chunk_index, content, embedding); collection/tags наследуются от документа
+        doc = self.db.query("SELECT collection, tags FROM kb_documents WHERE id=?", (doc_id,))
+        collection = doc[0]["collection"] if doc else DEFAULT_COLLECTION
+        tags = doc[0]["tags"] if doc else ""
         self.db.execute("DELETE FROM kb_chunks WHERE doc_id=?", (doc_id,))
         self.db.executemany(
-            "INSERT INTO kb_chunks (doc_id, chunk_index, content, embedding_json) VALUES (?, ?, ?, ?)",
-            [(doc_id, idx, content, json.dumps(emb)) for idx, content, emb in chunks],
+            "INSERT INTO kb_chunks (doc_id, chunk_index, content, embedding_json, collection, tags) VALUES (?, ?, ?, ?, ?, ?)",
+            [(doc_id, idx, content, json.dumps(emb), collection, tags) for idx, content, emb in chunks],
         )
 
     def get_all_chunks(self):
@@ -75,6 +297,30 @@ class Repo:
             out.append((int(r["id"]), r["content"], json.loads(r["embedding_json"])))
         return out
 
+    def get_chunk_vectors(self) -> list[tuple[int, str, list[str], list[float]]]:
+        """
+        (chunk_id, collection, tags, embedding) — для выгрузки в EmbeddingStore.
+        """
+        rows = self.db.query("SELECT id, collection, tags, embedding_json FROM kb_chunks")
+        return [
+            (int(r["id"]), r["collection"], decode_tags(r["tags"]), json.loads(r["embedding_json"]))
+            for r in rows
+        ]
+
+    def _chunk_filter_sql(self, collections: list[str] | None, tags: list[str] | None) -> tuple[str, tuple]:
+        where: list[str] = []
+        params: list = []
+        if collections is None:
+            where.append(f"collection NOT IN ({','.join('?' for _ in EXACT_LOOKUP_COLLECTIONS)})")
+            params.extend(EXACT_LOOKUP_COLLECTIONS)
+        else:
+            where.append(f"collection IN ({','.join('?' for _ in collections) or 'NULL'})")
+            params.extend(collections)
+        if tags:
+            where.append("(" + " OR ".join("tags LIKE ?" for _ in tags) + ")")
+            params.extend(f"%,{t},%" for t in tags)
+        return " WHERE " + " AND ".join(where), tuple(params)
+
     # --- NEW: read raw document text (needed for "Символизм" exact phrasing/questions) ---
     def get_document_raw_text_by_title(self, title: str) -> str | None:
         """
@@ -118,6 +364,43 @@ class Repo:
             return None
         return rows[0]["raw_text"]
 
+    # --- symbolism entries (materialized at ingest time) ---
+    def replace_symbol_entries(self, sym: SymbolismIndex) -> None:
+        """
+        Перезаписывает таблицу symbol_entries содержимым индекса одной транзакцией.
+        """
+        rows = [
+            (key, sym.display.get(key) or key, entry, sym.version)
+            for key, entry in sym.index.items()
+        ]
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM symbol_entries")
+            conn.executemany(
+                "INSERT INTO symbol_entries (norm_key, display_key, entry_text, doc_version) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def get_symbol_entries_version(self) -> str | None:
+        rows = self.db.query("SELECT doc_version FROM symbol_entries LIMIT 1")
+        if not rows:
+            return None
+        return rows[0]["doc_version"]
+
+    def load_symbolism_index(self) -> SymbolismIndex:
+        """
+        Поднимает весь индекс «Символизма» одним чтением (без парсинга raw_text).
+        Пустой индекс = таблица ещё не заполнена.
+        """
+        rows = self.db.query("SELECT norm_key, display_key, entry_text, doc_version FROM symbol_entries")
+        if not rows:
+            return SymbolismIndex(index={}, source_title="symbolism")
+        return SymbolismIndex(
+            index={r["norm_key"]: r["entry_text"] for r in rows},
+            source_title="symbolism",
+            display={r["norm_key"]: r["display_key"] for r in rows},
+            version=rows[0]["doc_version"],
+        )
+
     # --- NEW: semantic KB search over chunks ---
     @staticmethod
     def _cosine(a: list[float], b: list[float]) -> float:
@@ -134,14 +417,49 @@ class Repo:
             return -1.0
         return dot / (math.sqrt(na) * math.sqrt(nb))
 
-    def kb_search(self, query_embedding: list[float], top_k: int = 3) -> list[dict]:
+    def get_chunk_contents(self, chunk_ids: list[int]) -> dict[int, str]:
+        if not chunk_ids:
+            return {}
+        placeholders = ",".join("?" for _ in chunk_ids)
+        rows = self.db.query(
+            f"SELECT id, content FROM kb_chunks WHERE id IN ({placeholders})",
+            tuple(chunk_ids),
+        )
+        return {int(r["id"]): r["content"] for r in rows}
+
+    def kb_search(
+        self,
+        query_embedding: list[float],
+        top_k: int = 3,
+        collections: list[str] | None = None,
+        tags: list[str] | None = None,
+    ) -> list[dict]:
         """
         Returns top_k chunks by cosine similarity.
         Caller is responsible for generating query_embedding (OpenAI embeddings).
+
+        collections/tags фильтруют чанки ДО скоринга. collections=None — все коллекции,
+        кроме EXACT_LOOKUP_COLLECTIONS («Символизм» нужен только для точного lookup).
+
+        Основной путь — memmap-матрица из EmbeddingStore (пишется при ingest);
+        если её нет — старый путь через embedding_json в БД.
         """
-        chunks = self.get_all_chunks()
+        if self.vectors.available():
+            if collections is None:
+                collections = [c for c in self.vectors.collections() if c not in EXACT_LOOKUP_COLLECTIONS]
+            hits = self.vectors.search(query_embedding, top_k, collections=collections, tags=tags)
+            contents = self.get_chunk_contents([chunk_id for chunk_id, _ in hits])
+            return [
+                {"chunk_id": chunk_id, "score": score, "content": contents[chunk_id]}
+                for chunk_id, score in hits
+                if chunk_id in contents
+            ]
+
+        where, params = self._chunk_filter_sql(collections, tags)
+        rows = self.db.query("SELECT id, content, embedding_json FROM kb_chunks" + where, params)
         scored: list[tuple[float, int, str]] = []
-        for chunk_id, content, emb in chunks:
+        for r in rows:
+            chunk_id, content, emb = int(r["id"]), r["content"], json.loads(r["embedding_json"])
             sim = self._cosine(query_embedding, emb)
             scored.append((sim, chunk_id, content))
         scored.sort(key=lambda x: x[0], reverse=True)
@@ -151,24 +469,108 @@ class Repo:
         return out
 
     # --- broadcasts / pushes ---
-    def list_users_by_segment(self, segment: str) -> list[int]:
-        if segment == "all":
-            rows = self.db.query("SELECT user_id FROM users")
-        elif segment == "active":
-            rows = self.db.query("SELECT user_id FROM users WHERE is_active_subscription=1")
+    @staticmethod
+    def _segment_where(segment: str, include_unreachable: bool = False) -> str:
+        if segment == "active":
+            where = "is_active_subscription=1"
         elif segment == "inactive":
-            rows = self.db.query("SELECT user_id FROM users WHERE is_active_subscription=0")
+            where = "is_active_subscription=0"
         elif segment == "dormant_7d":
-            rows = self.db.query("SELECT user_id FROM users WHERE last_seen_at < datetime('now','-7 day')")
+            where = "last_seen_at < datetime('now','-7 day')"
         else:
-            rows = self.db.query("SELECT user_id FROM users")
+            where = "1=1"
+        if not include_unreachable:
+            where += " AND reachable=1"
+        return where
+
+    def list_users_by_segment(self, segment: str, include_unreachable: bool = False) -> list[int]:
+        rows = self.db.query(f"SELECT user_id FROM users WHERE {self._segment_where(segment, include_unreachable)}")
         return [int(r["user_id"]) for r in rows]
 
+    def mark_users_unreachable(self, user_ids: list[int]) -> None:
+        """
+        Постоянная ошибка доставки (Forbidden, чат не найден): исключаем из сегментов,
+        пока пользователь сам не напишет боту (upsert_user / ActivityBuffer вернут reachable=1).
+        """
+        if not user_ids:
+            return
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "UPDATE users SET reachable=0, unreachable_at=datetime('now') WHERE user_id=? AND reachable=1",
+                [(int(uid),) for uid in user_ids],
+            )
+
+    def count_unreachable_users(self) -> int:
+        return int(self.db.query("SELECT COUNT(*) AS c FROM users WHERE reachable=0")[0]["c"])
+
+    # --- напоминания неактивным ---
+    def get_job_cursor(self, name: str) -> tuple[str, int] | None:
+        rows = self.db.query("SELECT last_seen_at, user_id FROM job_cursors WHERE name=?", (name,))
+        return (rows[0]["last_seen_at"], int(rows[0]["user_id"])) if rows else None
+
+    def try_acquire_job_lease(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        """
+        Аренда на задание name: свободная, своя (продление) или просроченная.
+        """
+        now = int(time.time())
+        cur = self.db.execute("""
+        INSERT INTO job_leases (name, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at
+        WHERE job_leases.owner=excluded.owner OR job_leases.expires_at < ?
+        """, (name, owner, now + int(ttl_seconds), now))
+        return cur.rowcount == 1
+
+    def release_job_lease(self, name: str, owner: str) -> None:
+        self.db.execute("DELETE FROM job_leases WHERE name=? AND owner=?", (name, owner))
+
+    def list_dormant_after(self, cursor: tuple[str, int], before: str, limit: int):
+        """
+        Следующие по (last_seen_at, user_id) после курсора, неактивные с before.
+        Идёт по idx_users_last_seen — читаются только строки после курсора.
+        """
+        return self.db.query("""
+          SELECT user_id, last_seen_at, last_reminded_at, reachable FROM users
+          WHERE (last_seen_at, user_id) > (?, ?) AND last_seen_at < ?
+          ORDER BY last_seen_at, user_id
+          LIMIT ?
+        """, (cursor[0], int(cursor[1]), before, int(limit)))
+
+    def save_reminder_progress(
+        self, name: str, reminded_user_ids: list[int], cursor: tuple[str, int] | None = None
+    ) -> None:
+        """
+        last_reminded_at отправленным + новый курсор (None — курсор не двигаем) — одной транзакцией.
+        """
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "UPDATE users SET last_reminded_at=datetime('now') WHERE user_id=?",
+                [(int(uid),) for uid in reminded_user_ids],
+            )
+            if cursor is None:
+                return
+            conn.execute("""
+            INSERT INTO job_cursors (name, last_seen_at, user_id) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+              last_seen_at=excluded.last_seen_at,
+              user_id=excluded.user_id,
+              updated_at=datetime('now');
+            """, (name, cursor[0], int(cursor[1])))
+
     def create_broadcast(self, admin_id: int, segment: str, text: str) -> int:
         self.db.execute("INSERT INTO broadcasts (admin_id, segment, text) VALUES (?, ?, ?)", (admin_id, segment, text))
         row = self.db.query("SELECT last_insert_rowid() AS id")[0]
         return int(row["id"])
 
+    def get_broadcast(self, broadcast_id: int | None = None):
+        """
+        Рассылка по id (None — последняя).
+        """
+        if broadcast_id is None:
+            rows = self.db.query("SELECT * FROM broadcasts ORDER BY id DESC LIMIT 1")
+        else:
+            rows = self.db.query("SELECT * FROM broadcasts WHERE id=?", (broadcast_id,))
+        return rows[0] if rows else None
+
     def create_scheduled_push(self, admin_id: int, segment: str, text: str, run_at_iso: str) -> int:
         self.db.execute(
             "INSERT INTO scheduled_pushes (creator_admin_id, segment, text, run_at) VALUES (?, ?, ?, ?)",
@@ -177,12 +579,148 @@ class Repo:
         row = self.db.query("SELECT last_insert_rowid() AS id")[0]
         return int(row["id"])
 
-    def get_due_pushes(self):
-        return self.db.query("""
-          SELECT * FROM scheduled_pushes
-          WHERE status='pending' AND run_at <= datetime('now')
-          ORDER BY id ASC
+    def list_pending_pushes(self) -> list[tuple[int, str]]:
+        """
+        [(id, run_at)] незавершённых пушей — для очереди SchedulerService.
+        """
+        rows = self.db.query("""
+          SELECT id, run_at FROM scheduled_pushes
+          WHERE status IN ('pending', 'sending')
+          ORDER BY run_at ASC
         """)
+        return [(int(r["id"]), r["run_at"]) for r in rows]
+
+    def get_scheduled_push(self, push_id: int):
+        rows = self.db.query("SELECT * FROM scheduled_pushes WHERE id=?", (push_id,))
+        return rows[0] if rows else None
+
+    # --- deliveries (очередь рассылок) ---
+    def start_delivery_job(self, kind: str, job_id: int, segment: str) -> bool:
+        """
+        pending -> sending и заполнение deliveries получателями сегмента одной транзакцией.
+        Сегмент выбирается только здесь, при первом старте; False — задание уже было
+        начато (продолжаем по существующим deliveries, users не перечитываем).
+        """
+        table, _ = DELIVERY_JOBS[kind]
+        with self.db.transaction() as conn:
+            cur = conn.execute(f"UPDATE {table} SET status='sending' WHERE id=? AND status='pending'", (job_id,))
+            if cur.rowcount != 1:
+                return False
+            conn.execute(
+                f"""
+                INSERT OR IGNORE INTO deliveries (job_kind, job_id, user_id)
+                SELECT ?, ?, user_id FROM users WHERE {self._segment_where(segment)}
+                """,
+                (kind, job_id),
+            )
+        return True
+
+    def claim_deliveries(
+        self, kind: str, job_id: int, limit: int, lease_seconds: int = 300, after_id: int = 0
+    ) -> list[tuple[int, int]]:
+        """
+        Атомарно забирает пачку получателей: pending или «зависшие» sending
+        (взятые процессом, который упал, — дольше lease_seconds назад).
+        after_id — только delivery_id > after_id (проход по очереди без возврата
+        к только что отложенным на повтор).
+        Возвращает [(delivery_id, user_id)].
+        """
+        now = int(time.time())
+        with self.db.transaction() as conn:
+            rows = conn.execute("""
+            UPDATE deliveries SET state='sending', claimed_at=?, attempts=attempts+1
+            WHERE id IN (
+              SELECT id FROM deliveries
+              WHERE job_kind=? AND job_id=? AND id > ?
+                AND (state='pending' OR (state='sending' AND claimed_at < ?))
+              ORDER BY id LIMIT ?
+            )
+            RETURNING id, user_id;
+            """, (now, kind, job_id, int(after_id), now - int(lease_seconds), int(limit))).fetchall()
+        return sorted((int(r["id"]), int(r["user_id"])) for r in rows)
+
+    def renew_delivery_claims(self, delivery_ids: list[int]) -> None:
+        """
+        Продлевает lease ещё не завершённых claim-ов: долгая пачка (паузы RetryAfter)
+        не должна считаться «зависшей» и уйти второму отправителю.
+        """
+        if not delivery_ids:
+            return
+        now = int(time.time())
+        self.db.executemany(
+            "UPDATE deliveries SET claimed_at=? WHERE id=? AND state='sending'",
+            [(now, int(did)) for did in delivery_ids],
+        )
+
+    def complete_deliveries(
+        self, outcomes: list[tuple[int, bool, str | None, bool]], max_attempts: int = 5
+    ) -> None:
+        """
+        outcomes: [(delivery_id, ok, error, retryable)] — одной транзакцией.
+        retryable (сеть после всех повторов) возвращается в pending, пока attempts < max_attempts;
+        остальные ошибки — сразу failed.
+        """
+        if not outcomes:
+            return
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "UPDATE deliveries SET state='sent', error=NULL, sent_at=datetime('now') WHERE id=?",
+                [(did,) for did, ok, _, _ in outcomes if ok],
+            )
+            conn.executemany(
+                "UPDATE deliveries SET state='failed', error=? WHERE id=?",
+                [((err or "")[:500], did) for did, ok, err, retry in outcomes if not ok and not retry],
+            )
+            conn.executemany(
+                """
+                UPDATE deliveries SET state=CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END,
+                  error=?, claimed_at=NULL
+                WHERE id=?
+                """,
+                [(int(max_attempts), (err or "")[:500], did) for did, ok, err, retry in outcomes if not ok and retry],
+            )
+
+    def finish_delivery_job(self, kind: str, job_id: int) -> bool:
+        """
+        Закрывает задание, если не осталось pending/sending.
+        """
+        table, done = DELIVERY_JOBS[kind]
+        cur = self.db.execute(f"""
+        UPDATE {table} SET status=? WHERE id=? AND status='sending' AND NOT EXISTS (
+          SELECT 1 FROM deliveries WHERE job_kind=? AND job_id=? AND state IN ('pending', 'sending')
+        )
+        """, (done, job_id, kind, job_id))
+        return cur.rowcount == 1
+
+    def delivery_progress(self, kind: str, job_id: int) -> dict:
+        rows = self.db.query(
+            "SELECT state, COUNT(*) AS c FROM deliveries WHERE job_kind=? AND job_id=? GROUP BY state",
+            (kind, job_id),
+        )
+        counts = {"pending": 0, "sending": 0, "sent": 0, "failed": 0, "cancelled": 0}
+        for r in rows:
+            counts[r["state"]] = int(r["c"])
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def cancel_delivery_job(self, kind: str, job_id: int) -> bool:
+        """
+        Останавливает задание: неотправленные deliveries -> cancelled.
+        Уже ушедшие в Telegram сообщения при этом всё равно дописываются как sent.
+        """
+        table, _ = DELIVERY_JOBS[kind]
+        with self.db.transaction() as conn:
+            cur = conn.execute(
+                f"UPDATE {table} SET status='cancelled' WHERE id=? AND status IN ('pending', 'sending')", (job_id,)
+            )
+            if cur.rowcount != 1:
+                return False
+            conn.execute(
+                "UPDATE deliveries SET state='cancelled' WHERE job_kind=? AND job_id=? AND state IN ('pending', 'sending')",
+                (kind, job_id),
+            )
+        return True
 
-    def mark_push_sent(self, push_id: int) -> None:
-        self.db.execute("UPDATE scheduled_pushes SET status='sent' WHERE id=?", (push_id,))
+    def list_unfinished_jobs(self, kind: str):
+        table, _ = DELIVERY_JOBS[kind]
+        return self.db.query(f"SELECT * FROM {table} WHERE status='sending' ORDER BY id")
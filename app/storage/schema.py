@@ -1,6 +1,17 @@
 from __future__ import annotations
 from app.storage.db import Database
 
+
+def _ensure_column(db: Database, table: str, column: str, decl: str) -> None:
+    """
+    Мини-миграция для уже существующих БД: CREATE TABLE IF NOT EXISTS
+    не добавляет новые колонки в старую таблицу.
+    """
+    cols = {r["name"] for r in db.query(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
 def ensure_schema(db: Database) -> None:
     db.execute("""
     CREATE TABLE IF NOT EXISTS users (
@@ -14,6 +25,10 @@ def ensure_schema(db: Database) -> None:
     );
     """)
 
+    # Доступность для рассылок: 0 — бот заблокирован / аккаунт удалён (см. Repo.mark_users_unreachable)
+    _ensure_column(db, "users", "reachable", "INTEGER NOT NULL DEFAULT 1")
+    _ensure_column(db, "users", "unreachable_at", "TEXT")
+
     db.execute("""
     CREATE TABLE IF NOT EXISTS messages (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,6 +60,15 @@ def ensure_schema(db: Database) -> None:
     );
     """)
 
+    # Коллекции/теги источников (GDOCS_SOURCES: "collection", "tags").
+    # В kb_chunks дублируем, чтобы фильтровать до скоринга без JOIN.
+    # tags храним как ",a,b," — так фильтр по тегу это LIKE '%,a,%'.
+    _ensure_column(db, "kb_documents", "collection", "TEXT NOT NULL DEFAULT 'default'")
+    _ensure_column(db, "kb_documents", "tags", "TEXT NOT NULL DEFAULT ''")
+    _ensure_column(db, "kb_chunks", "collection", "TEXT NOT NULL DEFAULT 'default'")
+    _ensure_column(db, "kb_chunks", "tags", "TEXT NOT NULL DEFAULT ''")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_kb_chunks_collection ON kb_chunks (collection)")
+
     db.execute("""
     CREATE TABLE IF NOT EXISTS broadcasts (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -67,3 +91,128 @@ def ensure_schema(db: Database) -> None:
       created_at TEXT DEFAULT (datetime('now'))
     );
     """)
+
+    # Материализованный индекс «Символизма» (строится при ingest, см. KnowledgeIngestor)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS symbol_entries (
+      norm_key TEXT PRIMARY KEY,
+      display_key TEXT NOT NULL,
+      entry_text TEXT NOT NULL,
+      doc_version TEXT NOT NULL,
+      updated_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+    # Общее для всех процессов состояние KB (см. app.kb.state): одна строка id=1
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS kb_state (
+      id INTEGER PRIMARY KEY CHECK (id = 1),
+      ready INTEGER NOT NULL DEFAULT 0,
+      generation INTEGER NOT NULL DEFAULT 0,
+      last_load_ts INTEGER,
+      lease_owner TEXT,
+      lease_expires_at INTEGER,
+      updated_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+    db.execute("INSERT OR IGNORE INTO kb_state (id) VALUES (1)")
+
+    # PTB user_data/chat_data (стадии диалога, AdminState): pickle по ключу,
+    # пишутся только изменённые записи (см. app.bot.persistence)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS persistence_data (
+      kind TEXT NOT NULL,
+      key INTEGER NOT NULL,
+      data BLOB NOT NULL,
+      updated_at TEXT DEFAULT (datetime('now')),
+      PRIMARY KEY (kind, key)
+    );
+    """)
+
+    # Телеметрия поиска символов: сырые записи (пачками) + агрегаты по ключу и итоги,
+    # из которых /symbolism_stats читает за O(1) независимо от объёма истории
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS symbol_lookups (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER,
+      requested TEXT NOT NULL,
+      matched_key TEXT,
+      rule TEXT,
+      hit INTEGER NOT NULL,
+      created_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS symbol_lookup_stats (
+      requested_key TEXT PRIMARY KEY,
+      hits INTEGER NOT NULL DEFAULT 0,
+      misses INTEGER NOT NULL DEFAULT 0,
+      matched_key TEXT,
+      last_rule TEXT,
+      last_seen_at TEXT
+    );
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_symbol_lookup_stats_misses ON symbol_lookup_stats(misses)")
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS symbol_lookup_totals (
+      id INTEGER PRIMARY KEY CHECK (id = 1),
+      hits INTEGER NOT NULL DEFAULT 0,
+      misses INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    db.execute("INSERT OR IGNORE INTO symbol_lookup_totals (id) VALUES (1)")
+
+    # История диалога: выборка «сообщения пользователя после id» идёт по индексу
+    db.execute("CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id, id)")
+
+    # Скользящее summary старых реплик (см. app.knowledge.history):
+    # покрывает все сообщения пользователя с id <= upto_message_id
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+      user_id INTEGER PRIMARY KEY,
+      summary TEXT NOT NULL,
+      upto_message_id INTEGER NOT NULL,
+      updated_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+    # Очередь доставки рассылок/пушей: строка на получателя, заполняется при старте задания.
+    # UNIQUE не даёт поставить одного получателя в задание дважды; state:
+    # pending -> sending (взято воркером, claimed_at) -> sent | failed
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS deliveries (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      job_kind TEXT NOT NULL,
+      job_id INTEGER NOT NULL,
+      user_id INTEGER NOT NULL,
+      state TEXT NOT NULL DEFAULT 'pending',
+      attempts INTEGER NOT NULL DEFAULT 0,
+      error TEXT,
+      claimed_at INTEGER,
+      sent_at TEXT,
+      UNIQUE (job_kind, job_id, user_id)
+    );
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_job_state ON deliveries(job_kind, job_id, state)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_scheduled_pushes_status_run_at ON scheduled_pushes(status, run_at)")
+
+    # Напоминания неактивным: обход users по индексу last_seen_at от сохранённого курсора
+    _ensure_column(db, "users", "last_reminded_at", "TEXT")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users(last_seen_at, user_id)")
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS job_cursors (
+      name TEXT PRIMARY KEY,
+      last_seen_at TEXT NOT NULL,
+      user_id INTEGER NOT NULL,
+      updated_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+    # Аренда на периодическое задание (как kb_state.lease_*): при нескольких репликах
+    # проход делает одна, остальные пропускают свой тик
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS job_leases (
+      name TEXT PRIMARY KEY,
+      owner TEXT NOT NULL,
+      expires_at INTEGER NOT NULL
+    );
+    """)
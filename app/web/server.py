@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT_SECONDS = 30.0
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+            503: "Service Unavailable"}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    headers: Dict[str, str]
+    body: bytes = b""
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b"OK"
+    content_type: str = "text/plain; charset=utf-8"
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    """
+    Маленький HTTP/1.1 сервер на asyncio (без сторонних зависимостей):
+    живёт в том же event loop, что и бот, держит keep-alive соединения
+    и не блокируется одним медленным клиентом, как однопоточный HTTPServer.
+    Отдаёт health/readiness и принимает webhook Telegram.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._fallback_get: Optional[Handler] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self._routes[(method.upper(), path)] = handler
+
+    def fallback_get(self, handler: Handler) -> None:
+        """
+        Ответ на GET по неизвестному пути (Railway может проверять любой путь).
+        """
+        self._fallback_get = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_conn, self.host, self.port)
+        log.info("HTTP server listening on %s:%s", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def bound_port(self) -> int:
+        if self._server and self._server.sockets:
+            return int(self._server.sockets[0].getsockname()[1])
+        return self.port
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT_SECONDS)
+        if not line:
+            return None
+        parts = line.decode("latin-1").strip().split()
+        if len(parts) < 2:
+            raise ValueError("bad request line")
+        method, target = parts[0].upper(), parts[1]
+
+        headers: Dict[str, str] = {}
+        while True:
+            h = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT_SECONDS)
+            if h in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = h.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise OverflowError("body too large")
+        body = await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT_SECONDS) if length else b""
+        return Request(method=method, path=target.split("?", 1)[0], headers=headers, body=body)
+
+    async def _dispatch(self, req: Request) -> Response:
+        handler = self._routes.get((req.method, req.path))
+        if handler is None:
+            if req.method == "GET" and self._fallback_get is not None:
+                handler = self._fallback_get
+            elif any(path == req.path for _, path in self._routes):
+                return Response(status=405, body=b"Method Not Allowed")
+            else:
+                return Response(status=404, body=b"Not Found")
+        try:
+            return await handler(req)
+        except Exception:
+            log.exception("HTTP handler failed: %s %s", req.method, req.path)
+            return Response(status=500, body=b"Internal Server Error")
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, resp: Response, keep_alive: bool) -> None:
+        head = [
+            f"HTTP/1.1 {resp.status} {_REASONS.get(resp.status, 'OK')}",
+            f"Content-Type: {resp.content_type}",
+            f"Content-Length: {len(resp.body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        head.extend(f"{k}: {v}" for k, v in resp.headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + resp.body)
+
+    async def _handle_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except OverflowError:
+                    self._write(writer, Response(status=413, body=b"Payload Too Large"), keep_alive=False)
+                    await writer.drain()
+                    return
+                except ValueError:
+                    self._write(writer, Response(status=400, body=b"Bad Request"), keep_alive=False)
+                    await writer.drain()
+                    return
+                if req is None:
+                    return
+
+                keep_alive = req.headers.get("connection", "").lower() != "close"
+                resp = await self._dispatch(req)
+                self._write(writer, resp, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except Exception:
+            log.exception("HTTP connection error")
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
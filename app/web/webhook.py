@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+
+from telegram import Update
+
+from app.web.server import Request, Response
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def make_webhook_handler(application, secret_token: str):
+    """
+    POST от Telegram: проверяем секрет, кладём Update в очередь приложения и
+    сразу отвечаем 200 — обработка идёт асинхронно (update fetcher PTB +
+    PerChatUpdateProcessor), поэтому Telegram не ждёт LLM/Google Docs.
+    """
+
+    async def handle(req: Request) -> Response:
+        got = req.headers.get(SECRET_HEADER, "")
+        if not secret_token or not hmac.compare_digest(got.encode(), secret_token.encode()):
+            return Response(status=403, body=b"Forbidden")
+        try:
+            data = json.loads(req.body.decode("utf-8"))
+            update = Update.de_json(data, application.bot)
+        except Exception:
+            log.warning("Webhook: invalid update payload (len=%s)", len(req.body))
+            return Response(status=400, body=b"Bad Request")
+        if update is None:
+            return Response(status=400, body=b"Bad Request")
+
+        application.update_queue.put_nowait(update)
+        return Response(status=200, body=b"OK")
+
+    return handle
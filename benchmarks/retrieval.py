@@ -0,0 +1,223 @@
+"""
+Бенчмарк ретривала на синтетическом корпусе.
+
+Запуск:
+    python -m benchmarks.retrieval --sizes 1000,10000 --dim 256 --out bench.json
+
+Для каждого размера корпуса генерирует чанки и эмбеддинги (кластеры вокруг
+случайных центров, запросы — зашумлённые чанки), прогоняет по шагам весь путь
+chunk_text -> Repo.replace_chunks -> Repo.get_all_chunks -> Repo.kb_search
+(SQL-fallback и memmap) -> rag.top_k_chunks + build_context и пишет
+p50/p95 латентности, пик памяти (tracemalloc) и recall@k против точного поиска
+в JSON, чтобы результаты разных коммитов можно было сравнивать diff'ом.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.knowledge.chunker import chunk_text
+from app.knowledge.ingest import KnowledgeIngestor
+from app.knowledge.rag import build_context, top_k_chunks
+from app.knowledge.vector_store import EmbeddingStore
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+_WORDS = (
+    "волк лиса медведь заяц сова ворон тигр кошка собака лес река поле дом "
+    "страх радость тревога злость спокойствие сила стая охота путь ночь день"
+).split()
+
+
+def _percentile(values: list[float], p: float) -> float:
+    return float(np.percentile(np.asarray(values), p)) if values else 0.0
+
+
+def _summary(samples_ms: list[float], peak_bytes: int) -> dict:
+    return {
+        "n": len(samples_ms),
+        "p50_ms": round(_percentile(samples_ms, 50), 4),
+        "p95_ms": round(_percentile(samples_ms, 95), 4),
+        "mean_ms": round(float(np.mean(samples_ms)) if samples_ms else 0.0, 4),
+        "peak_mem_kb": round(peak_bytes / 1024, 1),
+    }
+
+
+def _traced_peak(fn) -> int:
+    """
+    Пик аллокаций Python за один вызов. Отдельным прогоном: tracemalloc
+    сильно замедляет код и испортил бы замеры времени.
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def _measure(fn, repeat: int) -> tuple[dict, object]:
+    samples: list[float] = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return _summary(samples, _traced_peak(fn)), result
+
+
+def _measure_queries(fn, queries: np.ndarray, repeat: int) -> tuple[dict, list]:
+    """
+    Латентность на один запрос (p50/p95 по всем запросам и повторам).
+    """
+    samples: list[float] = []
+    results: list = []
+    for _ in range(repeat):
+        results = []
+        for q in queries:
+            t0 = time.perf_counter()
+            results.append(fn(q))
+            samples.append((time.perf_counter() - t0) * 1000)
+    return _summary(samples, _traced_peak(lambda: fn(queries[0]))), results
+
+
+def synthetic_text(rng: np.random.Generator, chars: int) -> str:
+    out: list[str] = []
+    total = 0
+    while total < chars:
+        sentence = " ".join(rng.choice(_WORDS, size=int(rng.integers(5, 15)))).capitalize() + "."
+        out.append(sentence)
+        total += len(sentence) + 1
+    return " ".join(out)
+
+
+def synthetic_embeddings(rng: np.random.Generator, n: int, dim: int, clusters: int = 32) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> list[int]:
+    m = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9)
+    scores = m @ (query / (np.linalg.norm(query) + 1e-9))
+    return [int(i) for i in np.argsort(-scores)[:k]]
+
+
+def _recall(found: list[list[int]], expected: list[list[int]]) -> float:
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, expected))
+    total = sum(len(e) for e in expected)
+    return round(hits / total, 4) if total else 1.0
+
+
+def run_size(n_chunks: int, dim: int, queries: int, top_k: int, repeat: int, seed: int, workdir: str) -> dict:
+    rng = np.random.default_rng(seed)
+    result: dict = {"chunks": n_chunks, "dim": dim, "queries": queries, "top_k": top_k, "ops": {}}
+    ops = result["ops"]
+
+    # chunk_text: документ ~ на n_chunks чанков по 1400 символов (как в ingest)
+    doc = synthetic_text(rng, min(n_chunks, 2000) * 1200)
+    ops["chunk_text"], texts = _measure(lambda: chunk_text(doc, chunk_size=1400, overlap=180), repeat)
+    texts = (texts * (n_chunks // max(1, len(texts)) + 1))[:n_chunks]
+
+    embs = synthetic_embeddings(rng, n_chunks, dim)
+    db_path = os.path.join(workdir, f"bench-{n_chunks}.sqlite")
+    db = Database(f"sqlite:///{db_path}")
+    ensure_schema(db)
+    store = EmbeddingStore(os.path.join(workdir, f"vectors-{n_chunks}"))
+    repo = Repo(db, vectors=store)
+    doc_id = repo.upsert_document(source_key=f"bench:{n_chunks}", title="bench", raw_text=doc[:1000])
+
+    packed = [(i, texts[i], embs[i].tolist()) for i in range(n_chunks)]
+    ops["replace_chunks"], _ = _measure(lambda: repo.replace_chunks(doc_id, packed), 1)
+    ops["get_all_chunks"], chunks = _measure(repo.get_all_chunks, repeat)
+
+    # chunk_id -> строка матрицы (для recall против точного поиска)
+    row_by_id = {chunk_id: i for i, (chunk_id, _, _) in enumerate(chunks)}
+    query_rows = rng.integers(0, n_chunks, size=queries)
+    qs = embs[query_rows] + 0.2 * rng.normal(size=(queries, dim)).astype(np.float32)
+    expected = [exact_top_k(embs, q, top_k) for q in qs]
+
+    def _search(q: np.ndarray) -> list[int]:
+        return [row_by_id[r["chunk_id"]] for r in repo.kb_search(q.tolist(), top_k=top_k)]
+
+    # SQL-fallback медленный (json.loads всех чанков на запрос) — один проход
+    ops["kb_search_sql"], found = _measure_queries(_search, qs, 1)
+    result["recall_at_k_sql"] = _recall(found, expected)
+
+    ingestor = KnowledgeIngestor(db=db, settings=SimpleNamespace(), vectors=store)
+    ops["export_embeddings"], _ = _measure(ingestor.export_embeddings, 1)
+    ops["kb_search_memmap"], found = _measure_queries(_search, qs, repeat)
+    result["recall_at_k_memmap"] = _recall(found, expected)
+
+    def _rag(q: np.ndarray) -> list[int]:
+        top = top_k_chunks(q.tolist(), chunks, top_k)
+        build_context(top, max_chars=6000)
+        return [row_by_id[chunk_id] for chunk_id, _, _ in top]
+
+    ops["rag_top_k_build_context"], found = _measure_queries(_rag, qs, 1)
+    result["recall_at_k_rag"] = _recall(found, expected)
+
+    db.conn.close()
+    return result
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="Retrieval benchmark on a synthetic corpus")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated corpus sizes (chunks)")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="", help="write JSON results to this path")
+    args = parser.parse_args(argv)
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="kb-bench-") as workdir:
+        for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+            res = run_size(size, args.dim, args.queries, args.top_k, args.repeat, args.seed, workdir)
+            report["results"].append(res)
+            print(
+                f"chunks={size}: kb_search memmap p50={res['ops']['kb_search_memmap']['p50_ms']}ms "
+                f"sql p50={res['ops']['kb_search_sql']['p50_ms']}ms recall@{args.top_k}={res['recall_at_k_memmap']}",
+                file=sys.stderr,
+            )
+    report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    payload = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -4,3 +4,13 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _isolated_embedding_store(monkeypatch, tmp_path):
+    # Repo/KnowledgeIngestor по умолчанию пишут memmap-матрицу в ./data/vectors
+    from app.knowledge import vector_store
+
+    monkeypatch.setattr(vector_store, "_default_store", vector_store.EmbeddingStore(str(tmp_path / "vectors")))
@@ -0,0 +1,56 @@
+from app.storage.activity import ActivityBuffer
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+def _repo(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    return Repo(db, activity=ActivityBuffer(db)), db
+
+
+def test_activity_is_coalesced_and_read_through(tmp_path):
+    repo, db = _repo(tmp_path)
+
+    for _ in range(5):
+        repo.upsert_user(1, "alice", "Alice")
+    repo.upsert_user(1, "alice2", "Alice")
+
+    # в БД ещё ничего нет, но чтение видит буфер
+    assert db.query("SELECT COUNT(*) AS c FROM users")[0]["c"] == 0
+    user = repo.get_user(1)
+    assert user["username"] == "alice2"
+    assert user["last_seen_at"]
+
+    assert repo.activity.flush() == 1
+    row = db.query("SELECT * FROM users WHERE user_id=1")[0]
+    assert row["username"] == "alice2"
+    assert row["last_seen_at"]
+    assert repo.activity.flush() == 0
+
+
+def test_free_messages_are_not_buffered(tmp_path):
+    repo, db = _repo(tmp_path)
+    repo.upsert_user(3, "carol", None)
+
+    # демо-счётчик — только атомарный consume в БД, буфер его не трогает и не удваивает
+    assert repo.consume_free_message(3, limit=5) == 1
+    assert repo.get_user(3)["free_messages_used"] == 1
+    repo.activity.flush()
+    assert tuple(db.query("SELECT free_messages_used, username FROM users WHERE user_id=3")[0]) == (1, "carol")
+
+
+def test_failed_flush_keeps_pending(tmp_path):
+    repo, db = _repo(tmp_path)
+    repo.upsert_user(2, "bob", None)
+
+    db.execute("DROP TABLE users")
+    try:
+        repo.activity.flush()
+    except Exception:
+        pass
+    ensure_schema(db)
+
+    assert repo.activity.flush() == 1
+    assert db.query("SELECT username FROM users WHERE user_id=2")[0][0] == "bob"
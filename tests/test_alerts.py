@@ -0,0 +1,55 @@
+import asyncio
+
+from app.bot import alerts
+from app.bot.alerts import AlertAggregator
+
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+def test_new_key_immediate_repeats_digested():
+    bot = _Bot()
+    agg = AlertAggregator(interval_seconds=600)
+
+    async def main():
+        immediate = []
+        for uid, requested in [(1, "Единорог"), (2, "единорог бежит"), (3, "🦄 единорог в лесу"), (3, "Грифон")]:
+            immediate.append(await agg.report_missing(bot, [10, 11], uid, None, requested, "hint"))
+        # документ не найден: первый раз сразу, дальше — в дайджест
+        immediate.append(await agg.report_missing(bot, [10, 11], 4, "u", "волк", "no doc", kb_missing=True))
+        immediate.append(await agg.report_missing(bot, [10, 11], 5, "u", "волк", "no doc", kb_missing=True))
+        flushed = await agg.flush(bot, [10, 11])
+        again = await agg.flush(bot, [10, 11])
+        return immediate, flushed, again
+
+    immediate, flushed, again = asyncio.run(main())
+
+    assert immediate == [True, False, False, True, True, False]
+    assert flushed is True and again is False
+    # 3 мгновенных алерта + 1 дайджест, каждому из двух админов
+    assert len(bot.sent) == 8
+    digest = bot.sent[-1][1]
+    assert "единорог ×2 (пользователей: 2)" in digest
+    assert "не найден ×1" in digest
+
+
+def test_seen_keys_evict_oldest_first(monkeypatch):
+    monkeypatch.setattr(alerts, "MAX_SEEN_KEYS", 2)
+    bot = _Bot()
+    agg = AlertAggregator(interval_seconds=600)
+
+    async def report(requested):
+        return await agg.report_missing(bot, [10], 1, None, requested, "hint")
+
+    async def main():
+        out = [await report("волк"), await report("лиса"), await report("волк")]
+        # «лиса» — самый давний ключ, вытесняется; «волк» остаётся
+        out += [await report("грифон"), await report("волк"), await report("лиса")]
+        return out
+
+    assert asyncio.run(main()) == [True, True, False, True, False, True]
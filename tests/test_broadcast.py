@@ -0,0 +1,68 @@
+import asyncio
+
+from telegram.error import Forbidden, RetryAfter, TimedOut
+
+from app.push.broadcast import AsyncTokenBucket, BroadcastEngine
+
+
+class _Bot:
+    def __init__(self, fail=None):
+        self.fail = dict(fail or {})
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            errors = self.fail.get(chat_id)
+            if errors:
+                raise errors.pop(0)
+            self.sent.append(chat_id)
+        finally:
+            self.in_flight -= 1
+
+
+def test_engine_retries_and_honours_retry_after():
+    bot = _Bot(fail={
+        2: [RetryAfter(0)],
+        3: [TimedOut(), TimedOut()],
+        4: [Forbidden("bot was blocked by the user")],
+        5: [TimedOut()] * 5,
+    })
+    engine = BroadcastEngine(bot, rate_per_second=1000, concurrency=4, max_retries=2, base_backoff=0.001)
+    progress = []
+
+    async def on_progress(r):
+        progress.append(r.done)
+
+    result = asyncio.run(engine.send(range(1, 21), "hi", on_progress=on_progress, progress_every=10))
+
+    assert sorted(bot.sent) == [i for i in range(1, 21) if i not in (4, 5)]
+    assert (result.sent, result.failed) == (18, 2)
+    assert sorted(result.failed_user_ids) == [4, 5]
+    assert result.rate_limited == 1
+    assert result.retries == 4  # 2 для uid=3 и 2 для uid=5
+    assert bot.max_in_flight <= 4
+    assert progress == [10, 20]
+
+
+def test_token_bucket_limits_rate_and_pauses():
+    async def main():
+        bucket = AsyncTokenBucket(rate_per_second=100, capacity=1)
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        for _ in range(11):
+            await bucket.acquire()
+        burst = loop.time() - t0
+
+        bucket.pause(0.05)
+        t1 = loop.time()
+        await bucket.acquire()
+        return burst, loop.time() - t1
+
+    burst, paused = asyncio.run(main())
+    assert burst >= 0.09
+    assert paused >= 0.045
@@ -0,0 +1,100 @@
+import asyncio
+
+from app.push.scheduler import SchedulerService
+from app.storage.db import Database
+from app.storage.schema import ensure_schema
+
+
+class _Settings:
+    scheduler_tz = "UTC"
+    broadcast_rate_per_second = 20
+    broadcast_concurrency = 2
+    broadcast_progress_seconds = 0.05
+
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        self.sent.append(chat_id)
+
+    async def edit_message_text(self, text, chat_id, message_id):
+        self.edits.append(text)
+
+
+class _App:
+    def __init__(self):
+        self.bot = _Bot()
+
+
+def _service(tmp_path, users):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    service = SchedulerService(db, _Settings())
+    service.telegram_app = _App()
+    for uid in range(1, users + 1):
+        service.repo.upsert_user(uid, f"u{uid}", None)
+    return service
+
+
+def test_broadcast_runs_detached_and_reports_progress(tmp_path):
+    service = _service(tmp_path, users=40)
+    bid = service.repo.create_broadcast(1, "all", "hi")
+
+    async def main():
+        job = service.start_broadcast(bid, "all", "hi", progress_message=(100, 7))
+        # хендлер не ждёт рассылку
+        assert not job.task.done()
+        await asyncio.sleep(0.1)
+        running = service.broadcast_status_text()
+        await job.task
+        return running
+
+    running = asyncio.run(main())
+    bot = service.telegram_app.bot
+    assert sorted(bot.sent) == list(range(1, 41))
+    assert "msg/s" in running and "ETA" in running
+    assert len(bot.edits) >= 2
+    assert bot.edits[-1].startswith(f"Рассылка #{bid}: done")
+    assert "Отправлено: 40/40" in bot.edits[-1]
+
+
+def test_cancel_stops_remaining_deliveries(tmp_path):
+    service = _service(tmp_path, users=200)
+    bid = service.repo.create_broadcast(1, "all", "hi")
+
+    async def main():
+        service.start_broadcast(bid, "all", "hi")
+        await asyncio.sleep(0.1)
+        return await service.cancel_broadcast()
+
+    assert asyncio.run(main()) == [bid]
+    progress = service.repo.delivery_progress("broadcast", bid)
+    assert progress["cancelled"] > 0
+    assert progress["pending"] == progress["sending"] == 0
+    assert progress["sent"] == len(service.telegram_app.bot.sent)
+    assert service.repo.get_broadcast(bid)["status"] == "cancelled"
+    assert service.repo.list_unfinished_jobs("broadcast") == []
+
+
+def test_cancel_without_id_stops_every_running_broadcast(tmp_path):
+    service = _service(tmp_path, users=200)
+    first = service.repo.create_broadcast(1, "all", "one")
+    second = service.repo.create_broadcast(1, "all", "two")
+    done = service.repo.create_broadcast(1, "all", "old")
+    service.repo.db.execute("UPDATE broadcasts SET status='done' WHERE id=?", (done,))
+
+    async def main():
+        service.start_broadcast(first, "all", "one")
+        service.start_broadcast(second, "all", "two")
+        await asyncio.sleep(0.1)
+        stopped = await service.cancel_broadcast()
+        return stopped, await service.cancel_broadcast()
+
+    stopped, again = asyncio.run(main())
+    assert stopped == [first, second]
+    assert again == []
+    assert [service.repo.get_broadcast(b)["status"] for b in (first, second, done)] == ["cancelled", "cancelled", "done"]
@@ -0,0 +1,11 @@
+from app.knowledge.chunker import chunk_text
+
+
+def test_chunk_text_terminates_and_overlaps():
+    text = "".join(chr(ord("a") + i % 26) for i in range(3000))
+
+    chunks = chunk_text(text, chunk_size=1400, overlap=180)
+
+    assert [len(c) for c in chunks] == [1400, 1400, 560]
+    assert chunks[1].startswith(chunks[0][-180:])
+    assert chunk_text("short", chunk_size=1400, overlap=180) == ["short"]
@@ -0,0 +1,149 @@
+import asyncio
+
+from app.push.broadcast import BroadcastEngine
+from app.push.jobs import run_delivery_job
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+class _Bot:
+    def __init__(self, crash_after=None):
+        self.sent = []
+        self.crash_after = crash_after
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        if self.crash_after is not None and len(self.sent) >= self.crash_after:
+            raise asyncio.CancelledError()  # «процесс упал» посреди рассылки
+        self.sent.append(chat_id)
+
+
+def _repo(tmp_path, users=120):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    for uid in range(1, users + 1):
+        repo.upsert_user(uid, f"u{uid}", None)
+    return repo, db
+
+
+def _engine(bot):
+    return BroadcastEngine(bot, rate_per_second=10000, concurrency=4)
+
+
+def test_broadcast_resumes_without_duplicates(tmp_path):
+    repo, db = _repo(tmp_path)
+    bid = repo.create_broadcast(admin_id=1, segment="all", text="hi")
+
+    first = _Bot(crash_after=70)
+    try:
+        asyncio.run(run_delivery_job(repo, _engine(first), "broadcast", bid, "all", "hi"))
+    except asyncio.CancelledError:
+        pass
+
+    progress = repo.delivery_progress("broadcast", bid)
+    assert progress["total"] == 120
+    assert 50 <= progress["sent"] <= len(first.sent)
+    assert db.query("SELECT status FROM broadcasts WHERE id=?", (bid,))[0]["status"] == "sending"
+    assert [r["id"] for r in repo.list_unfinished_jobs("broadcast")] == [bid]
+
+    # новые пользователи после старта в уже начатую рассылку не попадают
+    repo.upsert_user(999, "late", None)
+    # рестарт: «зависшие» claim-ы берём только после lease
+    db.execute("UPDATE deliveries SET claimed_at = claimed_at - 3600 WHERE state='sending'")
+
+    second = _Bot()
+    result = asyncio.run(run_delivery_job(repo, _engine(second), "broadcast", bid, "all", "hi"))
+
+    recorded = db.query("SELECT user_id FROM deliveries WHERE state='sent' ORDER BY user_id")
+    assert [int(r["user_id"]) for r in recorded] == list(range(1, 121))
+    # повторно ушли максимум «в полёте» на момент падения (не записанные в БД)
+    assert len(set(first.sent) & set(second.sent)) <= len(first.sent) - progress["sent"]
+    assert 999 not in second.sent
+    assert (result.sent, result.failed, result.total) == (120, 0, 120)
+    assert db.query("SELECT status FROM broadcasts WHERE id=?", (bid,))[0]["status"] == "done"
+
+
+def test_fresh_claims_are_not_taken_twice(tmp_path):
+    repo, db = _repo(tmp_path, users=10)
+    bid = repo.create_broadcast(admin_id=1, segment="all", text="hi")
+    assert repo.start_delivery_job("broadcast", bid, "all") is True
+    assert repo.start_delivery_job("broadcast", bid, "all") is False
+
+    a = repo.claim_deliveries("broadcast", bid, 6)
+    b = repo.claim_deliveries("broadcast", bid, 6)
+    assert len(a) == 6 and len(b) == 4
+    assert not {uid for _, uid in a} & {uid for _, uid in b}
+    assert repo.claim_deliveries("broadcast", bid, 6) == []
+    assert repo.claim_deliveries("broadcast", bid, 6, lease_seconds=-1) != []
+
+    repo.complete_deliveries([(did, did % 2 == 0, "Forbidden: blocked", False) for did, _ in a + b])
+    assert repo.finish_delivery_job("broadcast", bid) is True
+    progress = repo.delivery_progress("broadcast", bid)
+    assert (progress["sent"], progress["failed"], progress["pending"], progress["sending"]) == (5, 5, 0, 0)
+
+
+def test_resume_does_not_reselect_segment_and_renews_claims(monkeypatch, tmp_path):
+    from app.push import broadcast
+
+    repo, db = _repo(tmp_path, users=3)
+    bid = repo.create_broadcast(admin_id=1, segment="all", text="hi")
+    assert repo.start_delivery_job("broadcast", bid, "all") is True
+
+    def _no_segment(*a, **kw):
+        raise AssertionError("resumed job must not re-read the segment")
+
+    monkeypatch.setattr(repo, "list_users_by_segment", _no_segment)
+    monkeypatch.setattr(broadcast, "DELIVERY_LEASE_SECONDS", 0.15)
+    renewed = []
+    real_renew = repo.renew_delivery_claims
+    monkeypatch.setattr(repo, "renew_delivery_claims", lambda ids: renewed.append(list(ids)) or real_renew(ids))
+
+    class _SlowBot(_Bot):
+        async def send_message(self, chat_id, text, **kwargs):
+            await asyncio.sleep(0.1)  # как пауза RetryAfter: пачка дольше lease
+            self.sent.append(chat_id)
+
+    bot = _SlowBot()
+    result = asyncio.run(
+        run_delivery_job(repo, BroadcastEngine(bot, rate_per_second=10000, concurrency=1), "broadcast", bid, "all", "hi")
+    )
+
+    assert sorted(bot.sent) == [1, 2, 3]
+    assert result.sent == 3
+    assert renewed
+
+
+def test_network_failures_go_back_to_pending_until_attempts_run_out(monkeypatch, tmp_path):
+    from telegram.error import Forbidden, NetworkError
+
+    from app.push import broadcast
+
+    repo, db = _repo(tmp_path, users=4)
+    bid = repo.create_broadcast(admin_id=1, segment="all", text="hi")
+    monkeypatch.setattr(broadcast, "DELIVERY_RETRY_DELAY", 0)
+    monkeypatch.setattr(broadcast, "MAX_DELIVERY_ATTEMPTS", 3)
+    calls = {}
+
+    class _FlakyBot(_Bot):
+        async def send_message(self, chat_id, text, **kwargs):
+            calls[chat_id] = calls.get(chat_id, 0) + 1
+            if chat_id == 2 and calls[chat_id] == 1:
+                raise NetworkError("timed out")  # разовый сбой — уйдёт со второго прохода
+            if chat_id == 3:
+                raise NetworkError("timed out")  # сбоит всегда — failed после 3 попыток
+            if chat_id == 4:
+                raise Forbidden("bot was blocked by the user")
+            self.sent.append(chat_id)
+
+    bot = _FlakyBot()
+    engine = BroadcastEngine(bot, rate_per_second=10000, concurrency=2, max_retries=0)
+    result = asyncio.run(run_delivery_job(repo, engine, "broadcast", bid, "all", "hi"))
+
+    assert sorted(bot.sent) == [1, 2]
+    assert (calls[3], calls[4]) == (3, 1)
+    rows = {int(r["user_id"]): (r["state"], int(r["attempts"])) for r in db.query("SELECT * FROM deliveries")}
+    assert rows == {1: ("sent", 1), 2: ("sent", 2), 3: ("failed", 3), 4: ("failed", 1)}
+    assert (result.sent, result.failed) == (2, 2)
+    assert db.query("SELECT status FROM broadcasts WHERE id=?", (bid,))[0]["status"] == "done"
@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.billing.entitlements import EntitlementService
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+def _service(tmp_path, limit=3):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    return EntitlementService(repo, free_trial_messages=limit), repo, db
+
+
+def test_trial_limit_holds_under_concurrency(tmp_path):
+    ent, repo, db = _service(tmp_path, limit=3)
+    repo.upsert_user(1, "u", None)
+
+    # как несколько реплик бота: своё соединение и свой кэш на каждого
+    def worker(_):
+        other = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+        service = EntitlementService(Repo(other), free_trial_messages=3)
+        return [service.consume(1)[0] for _ in range(5)]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = [ok for batch in pool.map(worker, range(4)) for ok in batch]
+
+    assert results.count(True) == 3
+    assert db.query("SELECT free_messages_used FROM users WHERE user_id=1")[0][0] == 3
+    assert ent.check(1)[0] is False
+
+
+def test_consume_creates_missing_user(tmp_path):
+    ent, repo, db = _service(tmp_path, limit=2)
+    assert ent.consume(7) == (True, "Демо-доступ: 1/2")
+    assert db.query("SELECT free_messages_used FROM users WHERE user_id=7")[0][0] == 1
+
+
+def test_paid_users_hit_cache_and_invalidation(tmp_path):
+    ent, repo, db = _service(tmp_path, limit=1)
+    repo.upsert_user(2, "p", None)
+    ent.consume(2)
+    assert ent.consume(2)[0] is False
+
+    repo.set_subscription(2, True)
+
+    def _no_db(*a, **kw):
+        raise AssertionError("paid user must not touch the DB")
+
+    real_query, real_tx = db.query, db.transaction
+    db.query = _no_db
+    db.transaction = _no_db
+    try:
+        for _ in range(5):
+            assert ent.consume(2) == (True, "")
+    finally:
+        db.query, db.transaction = real_query, real_tx
+
+    repo.set_subscription(2, False)
+    assert ent.consume(2)[0] is False
+
+
+def test_analysis_consumes_free_message_and_blocks_after_limit(monkeypatch, tmp_path):
+    import asyncio
+    from types import SimpleNamespace
+
+    from app.bot import handlers
+    from app.billing.entitlements import TRIAL_EXHAUSTED_TEXT
+    from app.knowledge import symbol_lookup
+    from app.knowledge.symbolism import build_symbolism_index
+
+    ent, repo, db = _service(tmp_path, limit=1)
+    repo.replace_symbol_entries(build_symbolism_index("🐺 Волк\n1. Сила и стая.\n"))
+    monkeypatch.setattr(symbol_lookup, "_cached_index", None)
+
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(
+        effective_message=SimpleNamespace(text="волк", reply_text=reply_text),
+        effective_user=SimpleNamespace(id=5, username=None),
+    )
+    context = SimpleNamespace(
+        user_data={"stage": handlers.STAGE_ANIMAL, "situation": "s", "feelings": "f"},
+        bot_data={"entitlements": ent},
+    )
+    settings = SimpleNamespace(admin_ids=[], symbolism_strict=False)
+
+    asyncio.run(handlers.text_message(update, context, repo, settings))
+    assert "Сила и стая" in replies[-1] and "Демо-доступ: 1/1" in replies[-1]
+    assert db.query("SELECT free_messages_used FROM users WHERE user_id=5")[0][0] == 1
+
+    # лимит исчерпан: новый диалог не начинаем
+    context.user_data = {"stage": handlers.STAGE_SITUATION}
+    update.effective_message.text = "новая ситуация"
+    asyncio.run(handlers.text_message(update, context, repo, settings))
+    assert replies[-1] == TRIAL_EXHAUSTED_TEXT
+    assert context.user_data["stage"] == handlers.STAGE_SITUATION
@@ -0,0 +1,91 @@
+import asyncio
+
+from app.knowledge.history import SUMMARY_PREFIX, HistoryAssembler, message_tokens
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+def _setup(tmp_path, budget=200, summary_tokens=50):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    calls = []
+
+    def summarize(previous, messages):
+        calls.append((previous, [m["content"] for m in messages]))
+        return (previous + " | " if previous else "") + ",".join(m["content"][:3] for m in messages)
+
+    return repo, HistoryAssembler(repo, summarize, budget_tokens=budget, summary_tokens=summary_tokens), calls
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _tokens(messages):
+    return sum(message_tokens(m["content"]) for m in messages)
+
+
+def test_short_history_is_passed_as_is(tmp_path):
+    repo, asm, calls = _setup(tmp_path)
+    repo.add_message(1, "user", "привет")
+    repo.add_message(1, "assistant", "привет!")
+
+    assert _run(asm.assemble(1)) == [
+        {"role": "user", "content": "привет"},
+        {"role": "assistant", "content": "привет!"},
+    ]
+    assert calls == []
+
+
+def test_long_history_is_bounded_and_summary_is_incremental(tmp_path):
+    repo, asm, calls = _setup(tmp_path, budget=200, summary_tokens=50)
+    for i in range(30):
+        repo.add_message(1, "user" if i % 2 == 0 else "assistant", f"m{i:02d} " + "x" * 60)
+
+    out = _run(asm.assemble(1))
+    assert out[0]["role"] == "system" and out[0]["content"].startswith(SUMMARY_PREFIX)
+    assert out[-1]["content"].startswith("m29")
+    assert _tokens(out) <= 200 + 20
+    assert len(calls) == 1
+
+    # повтор без новых сообщений — summary из кэша, LLM не зовём
+    assert _run(asm.assemble(1)) == out
+    assert len(calls) == 1
+
+    # пара новых реплик влезает в запас после сворачивания
+    repo.add_message(1, "user", "m30 ещё")
+    assert _run(asm.assemble(1))[-1]["content"] == "m30 ещё"
+    assert len(calls) == 1
+
+    for i in range(31, 40):
+        repo.add_message(1, "user", f"m{i} " + "y" * 60)
+    out = _run(asm.assemble(1))
+    assert len(calls) == 2
+    # в LLM ушли только вытесняемые реплики, а не вся история
+    previous, folded = calls[1]
+    assert previous and not any(c.startswith("m00") for c in folded)
+    assert _tokens(out) <= 200 + 20
+
+    repo.clear_messages(1)
+    assert _run(asm.assemble(1)) == []
+
+
+def test_summarizer_runs_off_the_event_loop_thread(tmp_path):
+    import threading
+
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    threads = []
+
+    def summarize(previous, messages):
+        threads.append(threading.get_ident())
+        return "summary"
+
+    for i in range(20):
+        repo.add_message(1, "user", f"m{i:02d} " + "x" * 60)
+    _run(HistoryAssembler(repo, summarize, budget_tokens=200, summary_tokens=50).assemble(1))
+
+    assert threads and threads[0] != threading.get_ident()
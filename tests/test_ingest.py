@@ -83,3 +83,36 @@ def test_reindex_all_uses_cached_raw_text(monkeypatch, tmp_path):
     stored_chunks = repo.get_all_chunks()
     assert len(stored_chunks) == 1
     assert stored_chunks[0][1] == "chunk 1"
+
+
+def test_cached_document_picks_up_collection_and_tags_from_settings(monkeypatch, tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+
+    repo = Repo(db)
+    doc_id = repo.upsert_document(source_key="gdocs:doc1:txt", title="Doc 1", raw_text="cached text")
+    repo.replace_chunks(doc_id=doc_id, chunks=[(0, "chunk 1", [1.0, 0.0, 0.0])])
+
+    settings = SimpleNamespace(
+        gdocs_sources=[{"doc_id": "doc1", "title": "Doc 1", "format": "txt", "collection": "faq", "tags": ["ru"]}],
+        openai_api_key="test-key",
+    )
+    ingestor = KnowledgeIngestor(db=db, settings=settings)
+    exported = []
+    monkeypatch.setattr(ingestor, "export_embeddings", lambda: exported.append(1))
+    monkeypatch.setattr(ingestor.repo.vectors, "available", lambda: True)
+
+    assert asyncio.run(ingestor.ensure_indexed_once()) == 0
+
+    doc = db.query("SELECT collection, tags FROM kb_documents WHERE source_key='gdocs:doc1:txt'")[0]
+    chunk = db.query("SELECT collection, tags FROM kb_chunks")[0]
+    assert (doc["collection"], doc["tags"]) == ("faq", ",ru,")
+    assert (chunk["collection"], chunk["tags"]) == ("faq", ",ru,")
+    assert exported == [1]
+
+    # повторный прогон без изменений — ничего не перевыгружаем
+    again = KnowledgeIngestor(db=db, settings=settings)
+    monkeypatch.setattr(again, "export_embeddings", lambda: exported.append(2))
+    monkeypatch.setattr(again.repo.vectors, "available", lambda: True)
+    asyncio.run(again.ensure_indexed_once())
+    assert exported == [1]
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from app.kb import lazy_loader, state
+from app.storage.db import Database
+from app.storage.schema import ensure_schema
+
+
+def _bind(monkeypatch, tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    for name, value in (("_db", None), ("_kb_ready", False), ("_kb_generation", 0), ("_kb_last_load_ts", None), ("_kb_loading_lock", None)):
+        monkeypatch.setattr(state, name, value)
+    monkeypatch.setattr(state, "_POLL_SECONDS", 0.0)
+    state.kb_bind_db(db)
+    return db
+
+
+def test_kb_state_is_shared_through_database(monkeypatch, tmp_path):
+    db = _bind(monkeypatch, tmp_path)
+
+    assert state.kb_is_ready() is False
+    state.kb_mark_ready(True)
+    state.kb_set_last_load_ts(123)
+
+    row = db.query("SELECT ready, generation, last_load_ts FROM kb_state WHERE id=1")[0]
+    assert (row["ready"], row["generation"], row["last_load_ts"]) == (1, 1, 123)
+
+    # другой процесс пометил KB — мы видим это через опрос таблицы
+    db.execute("UPDATE kb_state SET generation=generation+1 WHERE id=1")
+    assert state.kb_get_generation() == 2
+
+
+def test_kb_lease_is_exclusive(monkeypatch, tmp_path):
+    _bind(monkeypatch, tmp_path)
+
+    assert state.kb_try_acquire_lease("a", 60) is True
+    assert state.kb_try_acquire_lease("b", 60) is False
+    assert state.kb_lease_active() is True
+
+    state.kb_release_lease("a")
+    assert state.kb_try_acquire_lease("b", 60) is True
+
+
+def test_run_kb_load_waits_for_other_process(monkeypatch, tmp_path):
+    db = _bind(monkeypatch, tmp_path)
+    monkeypatch.setattr(lazy_loader, "KB_LOAD_POLL_SECONDS", 0.01)
+    assert state.kb_try_acquire_lease("other-process", 60)
+
+    async def _other_process_finishes():
+        await asyncio.sleep(0.05)
+        db.execute("UPDATE kb_state SET ready=1, generation=generation+1 WHERE id=1")
+        state.kb_release_lease("other-process")
+
+    async def _load():
+        raise AssertionError("load_fn must not run while another process holds the lease")
+
+    async def _main():
+        asyncio.create_task(_other_process_finishes())
+        return await lazy_loader.run_kb_load(_load)
+
+    assert asyncio.run(_main()) is None
+    assert state.kb_is_ready() is True
+
+
+def test_failed_reload_keeps_previous_generation_ready(monkeypatch, tmp_path):
+    _bind(monkeypatch, tmp_path)
+
+    async def _ok():
+        return 1
+
+    async def _fail():
+        raise RuntimeError("gdocs down")
+
+    # ни одной загрузки ещё не было — неудача оставляет KB not ready
+    with pytest.raises(RuntimeError):
+        asyncio.run(lazy_loader.run_kb_load(_fail))
+    assert state.kb_is_ready() is False
+
+    assert asyncio.run(lazy_loader.run_kb_load(_ok)) == 1
+    with pytest.raises(RuntimeError):
+        asyncio.run(lazy_loader.run_kb_load(_fail))
+    assert state.kb_is_ready() is True
+    assert state.kb_get_generation() == 1
+    assert state.kb_lease_active() is False
+
+    # сам kb_mark_ready(False) снимает готовность буквально
+    state.kb_mark_ready(False)
+    assert state.kb_is_ready() is False
+
+
+def test_run_kb_load_serializes_loads_in_one_process(monkeypatch, tmp_path):
+    _bind(monkeypatch, tmp_path)
+    running = []
+    overlaps = []
+
+    async def _load():
+        overlaps.append(len(running))
+        running.append(1)
+        await asyncio.sleep(0.05)
+        running.pop()
+        return 1
+
+    async def _main():
+        return await asyncio.gather(lazy_loader.run_kb_load(_load), lazy_loader.run_kb_load(_load))
+
+    assert asyncio.run(_main()) == [1, 1]
+    assert overlaps == [0, 0]
+    assert state.kb_get_generation() == 2
+
+
+def test_run_kb_load_renews_lease_while_loading(monkeypatch, tmp_path):
+    db = _bind(monkeypatch, tmp_path)
+    monkeypatch.setattr(lazy_loader, "KB_LOAD_LEASE_SECONDS", 3)
+    monkeypatch.setattr(lazy_loader, "KB_LEASE_RENEW_FRACTION", 3)
+    expiries = []
+
+    async def _load():
+        for _ in range(3):
+            expiries.append(db.query("SELECT lease_expires_at FROM kb_state WHERE id=1")[0]["lease_expires_at"])
+            await asyncio.sleep(1.05)
+        return 1
+
+    assert asyncio.run(lazy_loader.run_kb_load(_load)) == 1
+    assert expiries[-1] > expiries[0]
+    assert state.kb_lease_active() is False
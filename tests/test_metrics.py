@@ -0,0 +1,82 @@
+import asyncio
+
+from app import main as app_main
+from app.kb import state
+from app.metrics import DB_LATENCY, Heartbeat, Registry
+from app.storage.db import Database
+
+
+def test_registry_renders_prometheus_text():
+    reg = Registry()
+    c = reg.counter("x_total", "X", ["result"])
+    h = reg.histogram("lat_seconds", "Latency", ["op"], buckets=(0.1, 1.0))
+    c.inc(result="sent")
+    c.inc(2, result="failed")
+    h.observe(0.05, op="q")
+    h.observe(0.5, op="q")
+    h.observe(5, op="q")
+
+    text = reg.render()
+    assert "# TYPE x_total counter" in text
+    assert 'x_total{result="failed"} 2' in text
+    assert 'lat_seconds_bucket{op="q",le="0.1"} 1' in text
+    assert 'lat_seconds_bucket{op="q",le="1"} 2' in text
+    assert 'lat_seconds_bucket{op="q",le="+Inf"} 3' in text
+    assert 'lat_seconds_count{op="q"} 3' in text
+    assert 'lat_seconds_sum{op="q"} 5.55' in text
+
+
+def test_db_operations_are_timed(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    before = DB_LATENCY.count(op="query")
+    db.query("SELECT 1")
+    assert DB_LATENCY.count(op="query") == before + 1
+
+
+async def _get(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1]), body
+
+
+def test_health_ready_and_metrics_endpoints(monkeypatch, tmp_path):
+    monkeypatch.setenv("PORT", "0")
+    monkeypatch.setattr(state, "_db", None)
+    monkeypatch.setattr(state, "_kb_ready", False)
+    monkeypatch.setattr(state, "_kb_generation", 0)
+
+    async def main():
+        heartbeat = Heartbeat(interval=0.01, stale_after=0.2)
+        readiness = {}
+        server = await app_main._start_http_server(heartbeat, readiness)
+        port = server.bound_port
+        try:
+            out = {"healthz_cold": await _get(port, "/healthz")}
+            task = asyncio.create_task(heartbeat.run())
+            await asyncio.sleep(0.03)
+            out["healthz"] = await _get(port, "/healthz")
+            out["ready_no_db"] = await _get(port, "/readyz")
+            readiness["db"] = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+            out["ready_no_kb"] = await _get(port, "/readyz")
+            state.kb_mark_ready(True)
+            out["ready"] = await _get(port, "/readyz")
+            out["metrics"] = await _get(port, "/metrics")
+            task.cancel()
+            return out
+        finally:
+            await server.stop()
+
+    out = asyncio.run(main())
+    assert out["healthz_cold"][0] == 503
+    assert out["healthz"][0] == 200
+    assert out["ready_no_db"][0] == 503
+    assert out["ready_no_kb"] == (503, b"kb not ready")
+    assert out["ready"] == (200, b"ready")
+    status, body = out["metrics"]
+    assert status == 200
+    assert b"# TYPE bot_update_duration_seconds histogram" in body
+    assert b"event_loop_lag_seconds" in body
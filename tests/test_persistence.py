@@ -0,0 +1,84 @@
+import asyncio
+
+from app.bot.admin import AdminState
+from app.bot.persistence import SqlitePersistence
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+class _FakeApp:
+    def __init__(self):
+        self.dropped = []
+        self.marked = []
+
+    def drop_user_data(self, user_id):
+        self.dropped.append(user_id)
+
+    def drop_chat_data(self, chat_id):
+        pass
+
+    def mark_data_for_update_persistence(self, chat_ids=None, user_ids=None):
+        self.marked.append(user_ids)
+
+
+def _persistence(tmp_path, **kw):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    return SqlitePersistence(Repo(db), **kw), db
+
+
+def test_dirty_entries_survive_restart(tmp_path):
+    p, db = _persistence(tmp_path)
+
+    async def first_run():
+        ud = {}
+        await p.refresh_user_data(1, ud)
+        ud["stage"] = "feelings"
+        ud["admin_state"] = AdminState(mode="push_text")
+        await p.update_user_data(1, ud)
+        await p.update_user_data(2, {})  # пустое и не сохранённое — не пишем
+        await p.flush()
+        writes = p.writes
+        await p.update_user_data(1, dict(ud))  # без изменений — не пишем
+        await p.flush()
+        return writes
+
+    assert asyncio.run(first_run()) == 1
+    assert p.writes == 1
+    assert db.query("SELECT COUNT(*) FROM persistence_data")[0][0] == 1
+
+    p2, _ = _persistence(tmp_path)
+
+    async def second_run():
+        assert await p2.get_user_data() == {}
+        ud = {}
+        await p2.refresh_user_data(1, ud)
+        return ud
+
+    ud = asyncio.run(second_run())
+    assert ud["stage"] == "feelings"
+    assert ud["admin_state"].mode == "push_text"
+
+
+def test_idle_entries_are_evicted_but_kept_in_db(tmp_path):
+    p, db = _persistence(tmp_path, update_interval=1, idle_ttl=2)
+    app = _FakeApp()
+
+    async def run():
+        ud = {"stage": "animal"}
+        await p.refresh_user_data(5, ud)
+        await p.update_user_data(5, ud)
+        await p.flush()
+        p._entries["user"].last_access[5] -= 10
+        assert p.evict_idle(app) == 1
+        # PTB вызывает drop_user_data у persistence — строка в БД должна остаться
+        await p.drop_user_data(5)
+        await p.flush()
+        fresh = {}
+        await p.refresh_user_data(5, fresh)
+        return fresh
+
+    assert asyncio.run(run()) == {"stage": "animal"}
+    assert app.dropped == [5]
+    assert db.query("SELECT COUNT(*) FROM persistence_data")[0][0] == 1
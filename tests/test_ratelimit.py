@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from app.bot import ratelimit
+from app.bot.ratelimit import PRIORITY_PAID, PRIORITY_TRIAL, LLMGate, LLMOverloaded, UserRateLimiter
+
+
+def test_token_bucket_allows_burst_then_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    limiter = UserRateLimiter(rate_per_minute=60, burst=3)
+
+    assert [limiter.allow(1) for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow(2) is True  # у другого пользователя свой бакет
+    assert limiter.should_notify(1) is True
+    assert limiter.should_notify(1) is False
+
+    now[0] += 1.0  # 1 токен в секунду
+    assert limiter.allow(1) is True
+    assert limiter.allow(1) is False
+    assert limiter.stats()["rejected"] == 2
+
+
+def test_llm_gate_prefers_paid_and_rejects_overflow():
+    order = []
+
+    async def main():
+        gate = LLMGate(max_concurrent=1, max_queue=2, timeout=5)
+        release = asyncio.Event()
+
+        async def call(name, prio, wait=False):
+            async with gate.slot(prio):
+                order.append(name)
+                if wait:
+                    await release.wait()
+
+        first = asyncio.create_task(call("first", PRIORITY_TRIAL, wait=True))
+        await asyncio.sleep(0)
+        trial = asyncio.create_task(call("trial", PRIORITY_TRIAL))
+        await asyncio.sleep(0)
+        # триальным досталась только половина очереди
+        with pytest.raises(LLMOverloaded):
+            await gate.acquire(PRIORITY_TRIAL)
+        paid = asyncio.create_task(call("paid", PRIORITY_PAID))
+        await asyncio.sleep(0)
+        assert gate.stats()["queued"] == 2
+
+        release.set()
+        await asyncio.gather(first, trial, paid)
+        return gate.stats()
+
+    stats = asyncio.run(main())
+    assert order == ["first", "paid", "trial"]
+    assert stats["rejected"] == 1
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_llm_gate_times_out_fast():
+    async def main():
+        gate = LLMGate(max_concurrent=1, max_queue=4, timeout=0.01)
+        await gate.acquire(PRIORITY_PAID)
+        with pytest.raises(LLMOverloaded):
+            await gate.acquire(PRIORITY_PAID)
+        gate.release()
+        await gate.acquire(PRIORITY_PAID)  # слот не «утёк» после таймаута
+        return gate.stats()
+
+    assert asyncio.run(main())["timeouts"] == 1
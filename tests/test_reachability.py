@@ -0,0 +1,64 @@
+import asyncio
+
+from telegram.error import BadRequest, Forbidden, TimedOut
+
+from app.push.broadcast import BroadcastEngine, is_unreachable
+from app.push.jobs import run_delivery_job
+from app.storage.activity import ActivityBuffer
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+class _Bot:
+    def __init__(self, fail):
+        self.fail = fail
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.fail:
+            raise self.fail[chat_id]
+        self.sent.append(chat_id)
+
+
+def test_classification():
+    assert is_unreachable(Forbidden("Forbidden: bot was blocked by the user"))
+    assert is_unreachable(BadRequest("Chat not found"))
+    assert not is_unreachable(BadRequest("Message text is empty"))
+    assert not is_unreachable(TimedOut())
+
+
+def test_permanent_failures_leave_segments_until_user_writes(monkeypatch, tmp_path):
+    from app.push import broadcast
+
+    # TimedOut уходит на повторные проходы — без паузы между ними
+    monkeypatch.setattr(broadcast, "DELIVERY_RETRY_DELAY", 0)
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    activity = ActivityBuffer(db)
+    repo = Repo(db, activity=activity)
+    for uid in range(1, 6):
+        Repo(db).upsert_user(uid, f"u{uid}", None)
+
+    bot = _Bot({
+        2: Forbidden("bot was blocked by the user"),
+        3: BadRequest("Chat not found"),
+        4: BadRequest("Can't parse entities"),
+        5: TimedOut(),
+    })
+    engine = BroadcastEngine(bot, rate_per_second=10000, max_retries=0)
+    bid = repo.create_broadcast(1, "all", "hi")
+    result = asyncio.run(run_delivery_job(repo, engine, "broadcast", bid, "all", "hi"))
+
+    assert (result.sent, result.failed) == (1, 4)
+    assert sorted(result.unreachable_user_ids) == [2, 3]
+    assert repo.list_users_by_segment("all") == [1, 4, 5]
+    assert sorted(repo.list_users_by_segment("all", include_unreachable=True)) == [1, 2, 3, 4, 5]
+    assert repo.count_unreachable_users() == 2
+
+    # пользователь снова написал боту — возвращается в рассылки
+    db.execute("UPDATE users SET unreachable_at=datetime('now','-1 minute') WHERE user_id=2")
+    activity.touch(2, "u2", None)
+    activity.flush()
+    Repo(db).upsert_user(3, "u3", None)
+    assert repo.list_users_by_segment("all") == [1, 2, 3, 4, 5]
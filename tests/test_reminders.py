@@ -0,0 +1,133 @@
+import asyncio
+
+from app.push.broadcast import BroadcastEngine
+from app.push.reminders import DormantReminder
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+def _setup(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    bot = _Bot()
+    reminder = DormantReminder(repo, BroadcastEngine(bot, rate_per_second=10000), dormant_days=7, batch_size=2)
+    return db, repo, bot, reminder
+
+
+def _seen(db, uid, days_ago):
+    db.execute(
+        "INSERT INTO users (user_id, last_seen_at) VALUES (?, datetime('now', ?))",
+        (uid, f"-{days_ago} day"),
+    )
+
+
+def test_reminds_each_dormant_user_once_and_walks_only_new_rows(tmp_path):
+    db, repo, bot, reminder = _setup(tmp_path)
+    _seen(db, 1, 30)   # пропал задолго до включения — не трогаем
+    for uid, days in ((2, 8), (3, 9), (4, 10), (5, 1)):
+        _seen(db, uid, days)
+    repo.mark_users_unreachable([4])
+
+    assert asyncio.run(reminder.run_once()) == 2
+    assert sorted(bot.sent) == [2, 3]
+
+    # повторный запуск: новых неактивных нет — ничего не читаем и не шлём
+    calls = []
+    real = repo.list_dormant_after
+    repo.list_dormant_after = lambda *a: calls.append(a) or real(*a)
+    assert asyncio.run(reminder.run_once()) == 0
+    assert len(calls) == 1
+    assert sorted(bot.sent) == [2, 3]
+
+    # uid=5 стал неактивным, uid=2 вернулся и снова пропал
+    db.execute("UPDATE users SET last_seen_at=datetime('now','-8 day','+1 hour') WHERE user_id=5")
+    db.execute("UPDATE users SET last_reminded_at=datetime('now','-20 day') WHERE user_id=2")
+    db.execute("UPDATE users SET last_seen_at=datetime('now','-7 day','-1 minute') WHERE user_id=2")
+    repo.list_dormant_after = real
+    assert asyncio.run(reminder.run_once()) == 2
+    assert sorted(bot.sent) == [2, 2, 3, 5]
+    assert asyncio.run(reminder.run_once()) == 0
+
+
+def test_transient_failure_is_retried_and_crash_does_not_resend(tmp_path):
+    from telegram.error import NetworkError
+
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    for uid, days in ((2, 8), (3, 9), (4, 10)):
+        _seen(db, uid, days)
+
+    class _FlakyBot(_Bot):
+        def __init__(self, fail=(), crash_after=None):
+            super().__init__()
+            self.fail = set(fail)
+            self.crash_after = crash_after
+
+        async def send_message(self, chat_id, text, **kwargs):
+            if self.crash_after is not None and len(self.sent) >= self.crash_after:
+                raise asyncio.CancelledError()  # «процесс упал»
+            if chat_id in self.fail:
+                raise NetworkError("timed out")
+            self.sent.append(chat_id)
+
+    def _reminder(bot):
+        engine = BroadcastEngine(bot, rate_per_second=10000, concurrency=1, max_retries=0)
+        return DormantReminder(repo, engine, dormant_days=7, batch_size=10)
+
+    # uid=3 (второй по last_seen_at) — сетевой сбой: курсор встаёт перед ним
+    bot = _FlakyBot(fail={3})
+    assert asyncio.run(_reminder(bot).run_once()) == 2
+    assert sorted(bot.sent) == [2, 4]
+
+    # повтор: досылаем только uid=3, напомненных не трогаем
+    bot = _FlakyBot()
+    assert asyncio.run(_reminder(bot).run_once()) == 1
+    assert bot.sent == [3]
+
+    # падение посреди пачки: отправленное уже отмечено и повторно не уходит
+    db.execute("UPDATE users SET last_reminded_at=NULL")
+    db.execute("DELETE FROM job_cursors")
+    crashed = _FlakyBot(crash_after=1)
+    try:
+        asyncio.run(_reminder(crashed).run_once())
+    except asyncio.CancelledError:
+        pass
+    bot = _FlakyBot()
+    asyncio.run(_reminder(bot).run_once())
+    assert not set(crashed.sent) & set(bot.sent)
+    assert sorted(crashed.sent + bot.sent) == [2, 3, 4]
+
+
+def test_only_one_replica_runs_reminders(tmp_path):
+    db, repo, bot, reminder = _setup(tmp_path)
+    for uid in (2, 3):
+        _seen(db, uid, 8)
+
+    # другая реплика уже делает проход
+    assert repo.try_acquire_job_lease("dormant_reminders", "other-replica", 600)
+    assert asyncio.run(reminder.run_once()) == 0
+    assert bot.sent == []
+
+    repo.release_job_lease("dormant_reminders", "other-replica")
+    assert asyncio.run(reminder.run_once()) == 2
+    assert sorted(bot.sent) == [2, 3]
+    # после прохода аренда свободна
+    assert repo.try_acquire_job_lease("dormant_reminders", "other-replica", 600)
+
+
+def test_expired_job_lease_can_be_taken_over(tmp_path):
+    db, repo, bot, reminder = _setup(tmp_path)
+    assert repo.try_acquire_job_lease("dormant_reminders", "dead", -1)
+    assert repo.try_acquire_job_lease("dormant_reminders", "alive", 600)
+    assert not repo.try_acquire_job_lease("dormant_reminders", "dead", 600)
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from app.push.scheduler import SchedulerService
+from app.storage.db import Database
+from app.storage.schema import ensure_schema
+
+
+class _Settings:
+    scheduler_tz = "UTC"
+    broadcast_rate_per_second = 25
+    broadcast_concurrency = 4
+
+
+class _App:
+    bot = object()
+
+
+def test_engine_reuses_application_bot(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    service = SchedulerService(db, _Settings())
+
+    with pytest.raises(RuntimeError):
+        service.engine
+
+    service.telegram_app = _App()
+    assert service.engine.bot is _App.bot
+    assert service.engine is service.engine
+    assert service.engine.concurrency == 4
+
+
+def test_push_fires_at_run_at_without_polling(tmp_path, monkeypatch):
+    from datetime import timedelta
+
+    from app.push import scheduler as scheduler_mod
+
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    service = SchedulerService(db, _Settings())
+    service.repo.upsert_user(1, "u", None)
+    service.repo.create_scheduled_push(1, "all", "old", "2000-01-01 00:00")
+
+    fired = []
+
+    async def fake_send_push(repo, engine, push_id, running=None):
+        fired.append((push_id, scheduler_mod._utcnow()))
+        repo.db.execute("UPDATE scheduled_pushes SET status='sent' WHERE id=?", (push_id,))
+
+    monkeypatch.setattr(scheduler_mod, "send_push", fake_send_push)
+    service._engine = object()
+    calls = {"list": 0}
+    real_list = service.repo.list_pending_pushes
+
+    def counting_list():
+        calls["list"] += 1
+        return real_list()
+
+    service.repo.list_pending_pushes = counting_list
+
+    async def main():
+        task = asyncio.create_task(service.run())
+        await asyncio.sleep(0.05)
+        run_at = (scheduler_mod._utcnow() + timedelta(seconds=1)).strftime("%Y-%m-%d %H:%M:%S")
+        pid = service.schedule_push(1, "all", "new", run_at)
+        await asyncio.sleep(1.5)
+        task.cancel()
+        return pid, scheduler_mod.parse_run_at(run_at)
+
+    pid, run_at = asyncio.run(main())
+    assert [p for p, _ in fired] == [1, pid]
+    assert fired[1][1] >= run_at
+    assert calls["list"] == 1
+
+    with pytest.raises(ValueError):
+        service.schedule_push(1, "all", "bad", "завтра")
+
+
+def test_push_time_is_entered_in_scheduler_tz(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+
+    class _Vilnius(_Settings):
+        scheduler_tz = "Europe/Vilnius"
+
+    service = SchedulerService(db, _Vilnius())
+    pid = service.schedule_push(1, "all", "hi", "2026-07-01 12:00")
+    # летом Вильнюс — UTC+3; в БД run_at хранится в UTC
+    assert service.repo.get_scheduled_push(pid)["run_at"] == "2026-07-01 09:00:00"
+
+    class _Unknown(_Settings):
+        scheduler_tz = "Nowhere/City"
+
+    pid = SchedulerService(db, _Unknown()).schedule_push(1, "all", "hi", "2026-07-01 12:00")
+    assert service.repo.get_scheduled_push(pid)["run_at"] == "2026-07-01 12:00:00"
@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import main as app_main
+from app.bot import handlers
+from app.kb import state
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+class _Message:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def test_handler_asks_to_retry_while_kb_is_warming(monkeypatch, tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    monkeypatch.setattr(state, "_db", None)
+    monkeypatch.setattr(state, "_kb_ready", False)
+    monkeypatch.setattr(state, "_kb_warming", True)
+
+    def no_lazy_load(*a, **kw):
+        raise AssertionError("warm-up is already loading documents")
+
+    monkeypatch.setattr(handlers, "KnowledgeIngestor", no_lazy_load)
+    msg = _Message("лиса в норе")
+    update = SimpleNamespace(effective_message=msg, effective_user=SimpleNamespace(id=1, username=None))
+    context = SimpleNamespace(user_data={"stage": handlers.STAGE_ANIMAL}, bot_data={})
+    settings = SimpleNamespace(admin_ids=[], symbolism_strict=False)
+
+    asyncio.run(handlers.text_message(update, context, Repo(db), settings))
+
+    assert msg.replies == [handlers.KB_WARMING_TEXT]
+    assert context.user_data["stage"] == handlers.STAGE_ANIMAL
+
+
+def test_warm_kb_retries_in_background(monkeypatch):
+    calls = []
+
+    async def flaky(db, settings):
+        calls.append(state.kb_is_warming())
+        if len(calls) < 2:
+            raise RuntimeError("gdocs down")
+        return 5
+
+    monkeypatch.setattr(state, "_db", None)
+    monkeypatch.setattr(state, "_kb_ready", False)
+    monkeypatch.setattr(app_main, "_startup_kb", flaky)
+    monkeypatch.setattr(app_main, "KB_WARM_RETRY_DELAYS", (0.01, 0.01))
+
+    asyncio.run(app_main._warm_kb(None, None))
+
+    assert calls == [True, True]
+    assert state.kb_is_warming() is False
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+from app import startup_profile
+from app.startup_profile import StartupProfiler
+
+
+def test_app_main_import_does_not_pull_heavy_dependencies():
+    code = (
+        "import sys, app.main\n"
+        "heavy = [m for m in ('openai', 'numpy', 'httpx', 'telegram', 'dotenv') if m in sys.modules]\n"
+        "print(','.join(heavy))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+def test_profiler_records_imports_and_phases(monkeypatch):
+    profiler = StartupProfiler()
+    monkeypatch.setattr(startup_profile, "_profiler", profiler)
+    profiler.install()
+    try:
+        sys.modules.pop("app.knowledge.chunker", None)
+        import app.knowledge.chunker  # noqa: F401
+    finally:
+        profiler.uninstall()
+
+    with startup_profile.phase("db"):
+        pass
+
+    assert "app.knowledge.chunker" in profiler.modules
+    own, total = profiler.modules["app.knowledge.chunker"]
+    assert 0 <= own <= total
+    assert [name for name, _ in profiler.phases] == ["db"]
+    report = profiler.report()
+    assert "app.knowledge.chunker" in report and "phases" in report
@@ -0,0 +1,33 @@
+from app.bot.admin_symbolism import format_symbolism_stats
+from app.knowledge.symbol_lookup import RULE_EXACT, SymbolMatch
+from app.knowledge.symbol_telemetry import SymbolTelemetry
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+def test_lookups_are_batched_and_aggregated(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    tel = SymbolTelemetry(repo)
+
+    hit = SymbolMatch(key="волк", entry="...", rule=RULE_EXACT, requested="волк")
+    tel.record(1, "Волк бежит", hit)
+    tel.record(1, "Единорог летит", None)
+    tel.record(2, "единорог", None)
+    assert db.query("SELECT COUNT(*) FROM symbol_lookups")[0][0] == 0
+
+    assert tel.flush() == 3
+    tel.record(3, "Грифон", None)
+    tel.flush()
+
+    stats = repo.get_symbol_lookup_stats(top=5, recent=2)
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+    assert stats["top_missing"][0]["requested_key"] == "единорог"
+    assert stats["top_missing"][0]["misses"] == 2
+    assert [r["requested"] for r in stats["recent"]] == ["грифон", "единорог"]
+
+    text = format_symbolism_stats(stats)
+    assert "hit rate 25.0%" in text
+    assert "единорог ×2" in text
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.knowledge.ingest import KnowledgeIngestor
+from app.knowledge.symbol_lookup import SymbolLookup
+from app.knowledge.symbolism import build_symbolism_index, find_symbol_entry
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+RAW = "🐺 Волк\n1. Сила и стая.\n2. Где твоя стая?\n\n🦊 Лиса\n1. Хитрость.\n"
+
+
+def test_ensure_docs_loaded_materializes_symbol_entries(monkeypatch, tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+
+    settings = SimpleNamespace(gdocs_sources=[{"doc_id": "sym", "title": "Символизм", "format": "txt"}])
+    monkeypatch.setattr("app.knowledge.ingest.export_doc_text", lambda doc_id, fmt: RAW)
+
+    asyncio.run(KnowledgeIngestor(db=db, settings=settings).ensure_docs_loaded())
+
+    sym = repo.load_symbolism_index()
+    assert set(sym.index) == {"волк", "лиса"}
+    assert sym.display["волк"] == "Волк"
+    assert sym.version == build_symbolism_index(RAW).version
+    assert find_symbol_entry(sym, "🐺 волк бежит") == ("волк", "🐺 Волк\n1. Сила и стая.\n2. Где твоя стая?")
+
+
+def test_symbol_entries_rebuilt_only_on_new_version(monkeypatch, tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    repo.upsert_document(source_key="gdocs:sym:txt", title="symbolism", raw_text=RAW)
+
+    settings = SimpleNamespace(gdocs_sources=[{"doc_id": "sym", "title": "symbolism", "format": "txt"}])
+    ingestor = KnowledgeIngestor(db=db, settings=settings)
+    asyncio.run(ingestor.ensure_docs_loaded())
+
+    calls = []
+    monkeypatch.setattr(repo.__class__, "replace_symbol_entries", lambda self, sym: calls.append(sym))
+    asyncio.run(ingestor.ensure_docs_loaded())
+
+    assert calls == []
+    assert len(repo.load_symbolism_index().index) == 2
+
+
+def _lookup_index():
+    raw = "🐺 Волк\n1. Сила.\n🦊 Лиса\n1. Хитрость.\n🐻 Медведь\n1. Мощь.\n🦅 Ястреб\n1. Взгляд.\n"
+    return build_symbolism_index(raw)
+
+
+@pytest.mark.parametrize(
+    "scene,key,rule",
+    [
+        ("Волк бежит", "волк", "exact"),
+        ("Волки в лесу", "волк", "trim_vowel"),
+        ("волками", "волк", "stem"),
+        ("волчица", "волк", "stem"),
+        ("Лисёнок спит", "лиса", "stem"),
+        ("Медвдь", "медведь", "fuzzy"),
+        ("ястребы", "ястреб", "trim_vowel"),
+    ],
+)
+def test_symbol_lookup_rules(scene, key, rule):
+    match = SymbolLookup(_lookup_index()).lookup(scene)
+
+    assert match is not None
+    assert (match.key, match.rule) == (key, rule)
+
+
+def test_symbol_lookup_strict_mode_keeps_legacy_rules():
+    lookup = SymbolLookup(_lookup_index())
+
+    assert lookup.lookup("волчица", strict=True) is None
+    assert lookup.lookup("ястребы", strict=True).rule == "trim_vowel"
+    assert lookup.lookup("кот") is None
+
+
+def test_cached_index_reloads_on_version_change(monkeypatch, tmp_path):
+    from app.knowledge import symbol_lookup
+
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    repo = Repo(db)
+    monkeypatch.setattr(symbol_lookup, "_cached_index", None)
+    assert symbol_lookup.load_symbolism_index_cached(repo).index == {}
+
+    # запись без новой generation KB (ленивая догрузка в хендлере) видна сразу
+    repo.replace_symbol_entries(build_symbolism_index(RAW))
+    loads = []
+    real = repo.load_symbolism_index
+    repo.load_symbolism_index = lambda: loads.append(1) or real()
+
+    first = symbol_lookup.load_symbolism_index_cached(repo)
+    assert set(first.index) == {"волк", "лиса"}
+    assert symbol_lookup.load_symbolism_index_cached(repo) is first
+    assert len(loads) == 1
+
+    repo.replace_symbol_entries(build_symbolism_index(RAW + "🐻 Медведь\n1. Мощь.\n"))
+    assert "медведь" in symbol_lookup.load_symbolism_index_cached(repo).index
+    assert len(loads) == 2
@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.bot import update_processor
+from app.bot.update_processor import PerChatUpdateProcessor
+
+
+def test_same_chat_is_serialized_and_chats_run_in_parallel(monkeypatch):
+    monkeypatch.setattr(update_processor, "chat_key", lambda update: update)
+    events = []
+
+    async def handler(chat, n, delay):
+        events.append(("start", chat, n))
+        await asyncio.sleep(delay)
+        events.append(("end", chat, n))
+
+    async def main():
+        proc = PerChatUpdateProcessor(workers=4)
+        await proc.initialize()
+        await asyncio.gather(
+            proc.process_update(1, handler(1, 1, 0.05)),
+            proc.process_update(1, handler(1, 2, 0.0)),
+            proc.process_update(2, handler(2, 1, 0.01)),
+        )
+        return proc.stats()
+
+    stats = asyncio.run(main())
+
+    chat1 = [e for e in events if e[1] == 1]
+    assert chat1 == [("start", 1, 1), ("end", 1, 1), ("start", 1, 2), ("end", 1, 2)]
+    # чат 2 не ждал медленный апдейт чата 1
+    assert events.index(("end", 2, 1)) < events.index(("end", 1, 1))
+    assert stats["processed"] == 3 and stats["pending"] == 0 and stats["chats_in_flight"] == 0
+
+
+def test_worker_count_is_bounded(monkeypatch):
+    monkeypatch.setattr(update_processor, "chat_key", lambda update: update)
+    running = SimpleNamespace(now=0, peak=0)
+
+    async def handler():
+        running.now += 1
+        running.peak = max(running.peak, running.now)
+        await asyncio.sleep(0.01)
+        running.now -= 1
+
+    async def main():
+        proc = PerChatUpdateProcessor(workers=2)
+        await proc.initialize()
+        await asyncio.gather(*(proc.process_update(chat, handler()) for chat in range(6)))
+
+    asyncio.run(main())
+
+    assert running.peak == 2
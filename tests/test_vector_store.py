@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.knowledge.ingest import KnowledgeIngestor
+from app.knowledge.vector_store import EmbeddingStore
+from app.storage.db import Database
+from app.storage.repo import Repo
+from app.storage.schema import ensure_schema
+
+
+def test_store_search_is_memmapped_and_exact(tmp_path):
+    rng = np.random.default_rng(0)
+    embs = rng.normal(size=(50, 8)).astype(np.float32)
+    store = EmbeddingStore(str(tmp_path))
+    store.write(ids=list(range(100, 150)), embeddings=embs.tolist())
+
+    query = embs[7] + 0.01
+    hits = store.search(query.tolist(), top_k=3)
+
+    assert isinstance(store._matrix, np.memmap)
+    assert hits[0][0] == 107
+    exact = (embs / np.linalg.norm(embs, axis=1, keepdims=True)) @ (query / np.linalg.norm(query))
+    assert [chunk_id for chunk_id, _ in hits] == [100 + int(i) for i in np.argsort(-exact)[:3]]
+
+
+def test_store_swaps_to_new_version(tmp_path):
+    writer = EmbeddingStore(str(tmp_path))
+    reader = EmbeddingStore(str(tmp_path))
+    writer.write(ids=[1], embeddings=[[1.0, 0.0]])
+    assert reader.search([1.0, 0.0], 1)[0][0] == 1
+
+    version = writer.write(ids=[2, 3], embeddings=[[0.0, 1.0], [1.0, 0.1]])
+
+    assert reader.search([1.0, 0.0], 1)[0][0] == 3
+    assert reader.version == version
+    assert len(list(tmp_path.glob("embeddings-*.ids.npy"))) == 2
+
+
+def test_reindex_exports_store_used_by_kb_search(monkeypatch, tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    store = EmbeddingStore(str(tmp_path / "vectors"))
+    settings = SimpleNamespace(
+        gdocs_sources=[{"doc_id": "doc1", "title": "Doc 1", "format": "txt"}],
+        openai_api_key="test-key",
+        embedding_model="text-embedding-3-small",
+    )
+    monkeypatch.setattr("app.knowledge.ingest.export_doc_text", lambda doc_id, fmt: "raw")
+    monkeypatch.setattr("app.knowledge.ingest.chunk_text", lambda *args, **kwargs: ["alpha", "beta"])
+    monkeypatch.setattr(
+        "app.knowledge.ingest.embed_texts", lambda api_key, model, texts: [[1.0, 0.0], [0.0, 1.0]]
+    )
+
+    asyncio.run(KnowledgeIngestor(db=db, settings=settings, vectors=store).reindex_all())
+
+    repo = Repo(db, vectors=store)
+    monkeypatch.setattr(repo, "get_all_chunks", lambda: (_ for _ in ()).throw(AssertionError("no JSON scan")))
+    result = repo.kb_search([0.1, 0.9], top_k=1)
+    assert [r["content"] for r in result] == ["beta"]
+
+
+def test_store_filters_collections_and_tags_before_scoring(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.write(
+        ids=[1, 2, 3, 4],
+        embeddings=[[1.0, 0.0], [0.9, 0.1], [0.8, 0.2], [0.0, 1.0]],
+        collections=["symbolism", "faq", "default", "faq"],
+        tags=[[], ["pricing"], [], ["ru"]],
+    )
+
+    assert store.collections() == ["default", "faq", "symbolism"]
+    assert [i for i, _ in store.search([1.0, 0.0], 4, collections=["faq"])] == [2, 4]
+    assert [i for i, _ in store.search([1.0, 0.0], 4, tags=["ru"])] == [4]
+    assert store.search([1.0, 0.0], 4, tags=["unknown"]) == []
+
+
+def test_kb_search_skips_symbolism_by_default_in_both_paths(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'bot.sqlite'}")
+    ensure_schema(db)
+    store = EmbeddingStore(str(tmp_path / "vectors"))
+    repo = Repo(db, vectors=store)
+    sym_id = repo.upsert_document("gdocs:s:txt", "symbolism", "raw", collection="symbolism")
+    faq_id = repo.upsert_document("gdocs:f:txt", "FAQ", "raw", collection="faq", tags=["ru"])
+    repo.replace_chunks(sym_id, [(0, "wolf", [1.0, 0.0])])
+    repo.replace_chunks(faq_id, [(0, "price", [0.5, 0.5])])
+
+    # без memmap-файла — SQL-фильтр до скоринга
+    assert [r["content"] for r in repo.kb_search([1.0, 0.0], top_k=5)] == ["price"]
+    assert [r["content"] for r in repo.kb_search([1.0, 0.0], top_k=5, collections=["symbolism"])] == ["wolf"]
+    assert repo.kb_search([1.0, 0.0], top_k=5, tags=["en"]) == []
+
+    KnowledgeIngestor(db=db, settings=SimpleNamespace(), vectors=store).export_embeddings()
+    assert [r["content"] for r in repo.kb_search([1.0, 0.0], top_k=5)] == ["price"]
+    assert [r["content"] for r in repo.kb_search([1.0, 0.0], top_k=5, tags=["ru"])] == ["price"]
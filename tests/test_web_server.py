@@ -0,0 +1,66 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.web.server import HttpServer, Response
+from app.web.webhook import SECRET_HEADER, make_webhook_handler
+
+
+async def _request(port: int, raw: bytes) -> tuple[int, bytes]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    body = await reader.readexactly(length)
+    writer.close()
+    return status, body
+
+
+def _post(path: str, body: bytes, secret: str) -> bytes:
+    return (
+        f"POST {path} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n"
+        f"{SECRET_HEADER}: {secret}\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode() + body
+
+
+def test_routes_fallback_and_webhook():
+    queue: asyncio.Queue = asyncio.Queue()
+    app = SimpleNamespace(bot=None, update_queue=queue)
+
+    async def ok(req):
+        return Response(body=b"OK")
+
+    async def main():
+        server = HttpServer("127.0.0.1", 0)
+        server.route("GET", "/health", ok)
+        server.fallback_get(ok)
+        server.route("POST", "/hook", make_webhook_handler(app, "s3cret"))
+        await server.start()
+        port = server.bound_port
+        try:
+            health = await _request(port, b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+            other = await _request(port, b"GET /anything HTTP/1.1\r\nConnection: close\r\n\r\n")
+            wrong_method = await _request(port, b"PUT /hook HTTP/1.1\r\nConnection: close\r\n\r\n")
+            payload = json.dumps({"update_id": 7}).encode()
+            forbidden = await _request(port, _post("/hook", payload, "nope"))
+            accepted = await _request(port, _post("/hook", payload, "s3cret"))
+            bad = await _request(port, _post("/hook", b"{oops", "s3cret"))
+        finally:
+            await server.stop()
+        return health, other, wrong_method, forbidden, accepted, bad
+
+    health, other, wrong_method, forbidden, accepted, bad = asyncio.run(main())
+
+    assert health == (200, b"OK")
+    assert other == (200, b"OK")
+    assert wrong_method[0] == 405
+    assert forbidden[0] == 403
+    assert accepted[0] == 200
+    assert bad[0] == 400
+    assert queue.qsize() == 1
+    assert queue.get_nowait().update_id == 7